@@ -0,0 +1,217 @@
+# Keying benchmarks on synthetic green-screen footage.
+#
+#   python bench_green.py                          # all cases at 720p and 1080p, JSON to stdout
+#   python bench_green.py --sizes 4K -o bench.json
+#   python bench_green.py --baseline old.json      # exit 1 if anything got >10% slower
+#
+# A case over its ALLOC_LIMITS entry (allocated frames per frame) also makes the run exit 1.
+#
+# Every case runs in its own interpreter so peak RSS is per case. Allocations are
+# measured with tracemalloc (numpy and OpenCV outputs are both numpy arrays, so both are
+# traced) as the heap high-water mark above the steady state while processing one frame.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import green
+
+SIZES = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+CASES = ["key", "keyer", "roi", "autokey", "resize", "preview", "rekey", "process"]
+# Most frames a case may allocate per frame. The key table lookup gathers into reused
+# buffers, so the calibrated key allocates nothing per frame, like the range key.
+ALLOC_LIMITS = {"autokey": 0.1}
+
+# Peak RSS of this process and its finished children (ffmpeg), in MB
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(own / scale, 1), round(children / scale, 1)
+
+# Synthetic foreground frame t: the static test frame with a subject block moving across it
+def foreground_frame(width, height, t):
+    frame = green.synthetic_green_frame(width, height)
+    x = int((width // 2) * (0.5 + 0.5 * np.sin(t * 2)))
+    frame[height // 3:2 * height // 3, x:x + width // 8] = (200, 150, 110)
+    return frame
+
+def background_frame(width, height, t):
+    y, x = np.mgrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[..., 0] = (x * 255 // max(width - 1, 1) + int(t * 50)) % 256
+    frame[..., 1] = y * 255 // max(height - 1, 1)
+    frame[..., 2] = 128
+    return frame
+
+# Write the synthetic foreground/background clips for a size (cached in the work dir)
+def make_clips(work_dir, width, height, seconds, fps):
+    from moviepy.editor import VideoClip
+    paths = {}
+    for name, make in (("fg", foreground_frame), ("bg", background_frame)):
+        path = os.path.join(work_dir, f"{name}_{width}x{height}_{seconds}s.mp4")
+        if not os.path.exists(path):
+            VideoClip(lambda t: make(width, height, t), duration=seconds).write_videofile(path, fps=fps, codec="libx264", audio=False, logger=None)
+        paths[name] = path
+    return paths["fg"], paths["bg"]
+
+# Time fn over `frames` calls; returns seconds and the per-frame allocation high-water mark
+def time_frames(fn, frames):
+    fn(0)  # warm-up: JIT, first-use buffers
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    fn(1)
+    alloc = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for i in range(frames):
+        fn(i)
+    return time.perf_counter() - start, alloc
+
+def run_case(case, size, frames, seconds, fps, work_dir, backend, quality):
+    width, height = SIZES[size]
+    frame_bytes = width * height * 3
+    result = {"case": case, "size": size, "frames": frames}
+    if case in ("key", "keyer", "roi", "autokey"):
+        fgs = [foreground_frame(width, height, i / fps) for i in range(4)]
+        bg = background_frame(width, height, 0)
+        if case == "key":
+            # The kernel alone, reused and writing into one output frame (manual_key_green would
+            # time building a keyer and its buffers on every call)
+            result["backend"] = green.resolve_key_backend(backend)
+            kernel = green.KEY_BACKENDS[result["backend"]]((0, 150, 0), (120, 255, 120), 1)
+            out = np.empty_like(bg)
+            fn = lambda i: kernel.key(fgs[i % 4], bg, out)
+        else:
+            # autokey: the calibrated key model, keyed through its key table
+            key_model = green.fit_key_model(fgs) if case == "autokey" else None
+            keyer = green.GreenKeyer((0, 150, 0), (120, 255, 120), 1, backend, roi=case == "roi", key_model=key_model)
+            result["backend"] = keyer.backend
+            fn = lambda i: keyer.key(fgs[i % 4], bg)
+        elapsed, alloc = time_frames(fn, frames)
+    elif case == "resize":
+        from moviepy.editor import VideoClip
+        sources = [foreground_frame(width, height, i / fps) for i in range(4)]
+        clip = VideoClip(lambda t: sources[int(t) % 4], duration=frames + 2)
+        clip = green.custom_resize(clip, width // 2, height // 2, quality, buffers=1)
+        result["quality"] = quality
+        elapsed, alloc = time_frames(lambda i: clip.get_frame(i), frames)
+    elif case == "preview":
+        fg_path, bg_path = make_clips(work_dir, width, height, seconds, fps)
+        frames = result["frames"] = max(1, frames // 10)
+        elapsed, alloc = time_frames(lambda i: green.preview_frame(fg_path, bg_path, "", "", "", "", (0, 150, 0), (120, 255, 120), 1, quality, backend), frames)
+    elif case == "rekey":
+        # Interactive preview: a keying setting changes on every frame, the decoded proxy frames stay
+        fg_path, bg_path = make_clips(work_dir, width, height, seconds, fps)
+        session = green.PreviewSession(fg_path, bg_path, "", "", "", "")
+        elapsed, alloc = time_frames(lambda i: session.render(1, (0, 150 + i % 2, 0), (120, 255, 120), 1, backend), frames)
+        session.close()
+    elif case == "process":
+        fg_path, bg_path = make_clips(work_dir, width, height, seconds, fps)
+        out_path = os.path.join(work_dir, f"out_{size}.mp4")
+        settings = {"fps": str(fps), "audio_source": "None", "green_lower": [0, 150, 0], "green_upper": [120, 255, 120],
+                    "resize_quality": quality, "key_backend": backend}
+        start = time.perf_counter()
+        green.process_with_preset([fg_path], bg_path, out_path, settings)
+        elapsed = time.perf_counter() - start
+        frames = result["frames"] = green.count_frames(seconds, fps)
+        alloc = None
+    result["seconds"] = round(elapsed, 4)
+    result["fps"] = round(frames / elapsed, 2) if elapsed else None
+    result["alloc_bytes_per_frame"] = alloc
+    result["alloc_frames_per_frame"] = round(alloc / frame_bytes, 2) if alloc is not None else None
+    result["peak_rss_mb"], result["peak_child_rss_mb"] = peak_rss_mb()
+    limit = ALLOC_LIMITS.get(case)
+    if limit is not None and result["alloc_frames_per_frame"] > limit:
+        result["alloc_error"] = f"allocates {result['alloc_frames_per_frame']} frames per frame (limit {limit})"
+    return result
+
+# Compare against an earlier JSON report; returns the list of regressions
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {(r["case"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["case"], r["size"]))
+        if old and old.get("fps") and r.get("fps") and r["fps"] < old["fps"] * (1 - threshold):
+            regressions.append(f"{r['case']} {r['size']}: {old['fps']} -> {r['fps']} fps")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark keying, resizing, preview and full renders on synthetic clips")
+    parser.add_argument("--sizes", nargs="+", default=["720p", "1080p"], choices=list(SIZES))
+    parser.add_argument("--cases", nargs="+", default=CASES, choices=CASES)
+    parser.add_argument("--frames", type=int, default=30, help="frames timed per frame-level case")
+    parser.add_argument("--seconds", type=float, default=2, help="length of the synthetic clips")
+    parser.add_argument("--fps", type=int, default=24)
+    parser.add_argument("--backend", default="auto", help="keying backend")
+    parser.add_argument("--quality", default="Best", choices=green.RESIZE_QUALITIES, help="resize quality")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="fps drop counted as a regression")
+    parser.add_argument("--work-dir", help="where synthetic clips are kept (default: a temp dir)")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--size", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        # Child mode: one case, one JSON line
+        result = run_case(args.case, args.size, args.frames, args.seconds, args.fps, args.work_dir, args.backend, args.quality)
+        print("BENCH " + json.dumps(result))
+        return 0
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_green_")
+    results = []
+    for size in args.sizes:
+        for case in args.cases:
+            cmd = [sys.executable, os.path.abspath(__file__), "--case", case, "--size", size, "--frames", str(args.frames),
+                   "--seconds", str(args.seconds), "--fps", str(args.fps), "--backend", args.backend,
+                   "--quality", args.quality, "--work-dir", work_dir]
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("BENCH ")]
+            if proc.returncode != 0 or not lines:
+                print(f"{case} {size} failed: {proc.stderr.strip()[-300:]}", file=sys.stderr)
+                results.append({"case": case, "size": size, "error": proc.stderr.strip()[-300:]})
+                continue
+            result = json.loads(lines[-1][len("BENCH "):])
+            print(f"{case:8} {size:6} {result['fps']:>9} fps  rss {result['peak_rss_mb']} MB", file=sys.stderr)
+            if "alloc_error" in result:
+                print(f"{case} {size} {result['alloc_error']}", file=sys.stderr)
+            results.append(result)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "key_backends": green.available_key_backends(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        for line in regressions:
+            print(f"Regression: {line}", file=sys.stderr)
+        return 1 if regressions or any("alloc_error" in r for r in results) else 0
+    return 1 if any("error" in r or "alloc_error" in r for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,340 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from moviepy.editor import VideoFileClip, CompositeVideoClip, TextClip, vfx, AudioFileClip, concatenate_videoclips
-from moviepy.config import change_settings
-from PIL import Image, ImageTk
+# Heavy modules (moviepy, cv2, tkinter, mediapipe) are imported where they are used,
+# so headless runs only pay for what they need
+from PIL import Image
 import numpy as np
-from scipy.ndimage import binary_dilation
-import threading
+import argparse
+import atexit
+import http.client
+import http.server
 import json
 import os
+import re
+import shutil
+import sys
 import time
 import subprocess
-import cv2
-import mediapipe as mp
-
-print("Imports completed")
+import tempfile
+import threading
+import queue
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Per-stage render timings: wall time, call count and a latency histogram per stage (decode,
+# resize, key, composite, text, write, ...) plus sampled queue depths when pipelined. Stages
+# are recorded from any thread. Histogram buckets are fixed so worker profiles can be merged.
+class RenderProfiler:
+    BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.queues = {}
+        self.frames = 0
+        self.started = time.perf_counter()
+        self.wall = None
+
+    def add(self, stage, seconds):
+        ms = seconds * 1000
+        bucket = next((i for i, limit in enumerate(self.BUCKETS_MS) if ms <= limit), len(self.BUCKETS_MS))
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = {"seconds": 0.0, "calls": 0, "max_ms": 0.0, "histogram": [0] * (len(self.BUCKETS_MS) + 1)}
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            entry["histogram"][bucket] += 1
+
+    # Total seconds recorded so far over all stages
+    def recorded(self):
+        with self.lock:
+            return sum(entry["seconds"] for entry in self.stages.values())
+
+    def sample_queue(self, name, depth):
+        with self.lock:
+            entry = self.queues.setdefault(name, {"samples": 0, "total": 0, "max": 0})
+            entry["samples"] += 1
+            entry["total"] += depth
+            entry["max"] = max(entry["max"], depth)
+
+    def finish(self, frames):
+        self.frames = frames
+        self.wall = time.perf_counter() - self.started
+
+    # Plain-dict form, for returning from worker processes
+    def to_dict(self):
+        with self.lock:
+            return {"stages": {k: dict(v, histogram=list(v["histogram"])) for k, v in self.stages.items()},
+                    "queues": {k: dict(v) for k, v in self.queues.items()}}
+
+    def merge(self, profile):
+        with self.lock:
+            for stage, other in profile["stages"].items():
+                entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "max_ms": 0.0, "histogram": [0] * (len(self.BUCKETS_MS) + 1)})
+                entry["seconds"] += other["seconds"]
+                entry["calls"] += other["calls"]
+                entry["max_ms"] = max(entry["max_ms"], other["max_ms"])
+                entry["histogram"] = [a + b for a, b in zip(entry["histogram"], other["histogram"])]
+            for name, other in profile["queues"].items():
+                entry = self.queues.setdefault(name, {"samples": 0, "total": 0, "max": 0})
+                entry["samples"] += other["samples"]
+                entry["total"] += other["total"]
+                entry["max"] = max(entry["max"], other["max"])
+
+    # Approximate latency percentile (upper edge of the bucket it falls in), in ms
+    def percentile(self, entry, fraction):
+        target = fraction * entry["calls"]
+        seen = 0
+        for limit, count in zip(self.BUCKETS_MS + [None], entry["histogram"]):
+            seen += count
+            if seen >= target and count:
+                return limit if limit is not None else round(entry["max_ms"], 1)
+        return None
 
-# Set ImageMagick path
-change_settings({"IMAGEMAGICK_BINARY": r"C:\Program Files\ImageMagick-7.1.1-Q16-HDRI\magick.exe"})
+    # One JSON-serialisable record per stage and queue, plus a summary record
+    def records(self, **job):
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.started
+        records = [dict(job, record="summary", frames=self.frames, wall_seconds=round(wall, 3),
+                        render_fps=round(self.frames / wall, 2) if wall else None)]
+        labels = [f"<={limit}ms" for limit in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        with self.lock:
+            for stage, entry in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"]):
+                records.append(dict(job, record="stage", stage=stage, seconds=round(entry["seconds"], 4), calls=entry["calls"],
+                                    mean_ms=round(entry["seconds"] * 1000 / entry["calls"], 3),
+                                    p50_ms=self.percentile(entry, 0.5), p95_ms=self.percentile(entry, 0.95),
+                                    max_ms=round(entry["max_ms"], 3),
+                                    share=round(entry["seconds"] / wall, 3) if wall else None,
+                                    histogram=dict(zip(labels, entry["histogram"]))))
+            for name, entry in sorted(self.queues.items()):
+                records.append(dict(job, record="queue", queue=name, samples=entry["samples"], max_depth=entry["max"],
+                                    mean_depth=round(entry["total"] / entry["samples"], 2) if entry["samples"] else 0))
+        return records
+
+    def summary(self):
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.started
+        with self.lock:
+            parts = [f"{stage} {entry['seconds']:.2f}s" for stage, entry in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])]
+        return f"{self.frames} frames in {wall:.2f}s ({self.frames / wall if wall else 0:.1f} fps): " + ", ".join(parts)
+
+# Profiler of the render in progress in this process, or None. Hot paths record into it
+# through profiled() instead of having it passed down.
+PROFILER = None
+
+def profiled(stage, fn):
+    def timed(*args, **kwargs):
+        profiler = PROFILER
+        if profiler is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.add(stage, time.perf_counter() - start)
+    return timed
+
+def start_profiler():
+    global PROFILER
+    PROFILER = RenderProfiler()
+    return PROFILER
+
+# Append a profile and the job's events to the JSON-lines render log next to the output
+def write_profile_log(profiler, output_path, events=(), **job):
+    log_path = os.path.join(os.path.dirname(os.path.abspath(output_path)), "process_log.jsonl")
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    started = events[0]["time"] if events else 0
+    with open(log_path, "a") as f:
+        for record in profiler.records(time=stamp, output=output_path, **job):
+            f.write(json.dumps(record) + "\n")
+        # Events carry only the job's time and output; t is seconds since the job's first event
+        for event in events:
+            fields = {k: v for k, v in event.items() if k not in ("type", "time")}
+            f.write(json.dumps(dict(fields, time=stamp, output=output_path, record="event", event=event["type"], t=round(event["time"] - started, 3))) + "\n")
+    return log_path
+
+def stop_profiler(frames):
+    global PROFILER
+    profiler, PROFILER = PROFILER, None
+    if profiler is not None:
+        profiler.finish(frames)
+    return profiler
+
+# Profile a moviepy clip while write_videofile renders it: get_frame time not claimed by
+# another stage is compositing, and the time between frames is the encoder's
+def profile_frames(clip, profiler):
+    last = [None]
+
+    def frame(gf, t):
+        start = time.perf_counter()
+        if last[0] is not None:
+            profiler.add("write", start - last[0])
+            profiler.add("frame", start - last[1])
+        before = profiler.recorded()
+        image = gf(t)
+        end = time.perf_counter()
+        profiler.add("composite", max(0.0, (end - start) - (profiler.recorded() - before)))
+        last[:] = [end, start]
+        return image
+
+    # Call after writing to count the last frame's encode and closing the encoder
+    def flush():
+        if last[0] is not None:
+            profiler.add("write", time.perf_counter() - last[0])
+            last[0] = None
+
+    return clip.fl(frame), flush
+
+# Resize quality settings, best to fastest. "Best" is PIL LANCZOS, "Balanced" is cv2 INTER_AREA
+# (INTER_CUBIC when enlarging), "Fast" is cv2 INTER_LINEAR and "Decoder" lets ffmpeg scale while
+# decoding (frames that still need resizing after decode use the Fast filter).
+RESIZE_QUALITIES = ["Best", "Balanced", "Fast", "Decoder"]
+
+# Resize a single RGB frame
+def resize_frame(image, width, height, quality="Best", out=None):
+    if quality == "Best":
+        pil_image = Image.fromarray(image, mode='RGB')
+        resized_image = pil_image.resize((width, height), Image.Resampling.LANCZOS)
+        return np.array(resized_image)
+    import cv2
+    if quality == "Balanced":
+        enlarging = width * height > image.shape[0] * image.shape[1]
+        interpolation = cv2.INTER_CUBIC if enlarging else cv2.INTER_AREA
+    else:
+        interpolation = cv2.INTER_LINEAR
+    return cv2.resize(image, (width, height), dst=out, interpolation=interpolation)
+
+resize_frame = profiled("resize", resize_frame)
+
+# Resizer for one output size that writes into a ring of `buffers` preallocated frames
+# (cv2 qualities only). A returned frame stays valid for `buffers` - 1 further calls;
+# with buffers=0 every call returns a new array.
+class FrameResizer:
+    def __init__(self, width, height, quality="Best", buffers=0):
+        self.width = width
+        self.height = height
+        self.quality = quality
+        self.ring = frame_ring(buffers, (height, width, 3)) if quality != "Best" else []
+        self.next = 0
+
+    # Hand the ring back to the frame pool; frames from it must no longer be used
+    def release(self):
+        release_frames(self.ring)
+        self.ring = []
+
+    def resize(self, image):
+        out = None
+        if self.ring:
+            out = self.ring[self.next]
+            self.next = (self.next + 1) % len(self.ring)
+        return resize_frame(image, self.width, self.height, self.quality, out)
+
+# Video properties (w, h, duration, fps, nframes, audio) as VideoFileClip would report them,
+# read from ffmpeg's header parse without starting a decoder. Results are kept in a JSON file
+# keyed by absolute path and checked against the file's mtime and size, so each file is probed
+# once across runs. Other processes' entries are merged back in on save.
+MEDIA_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media_cache.json")
+
+class MediaProbe:
+    def __init__(self, path=MEDIA_CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = None
+        self.hits = 0
+        self.misses = 0
+
+    def read_file(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        with self.lock:
+            entries = {**self.read_file(), **self.entries}
+            self.entries = entries
+            data = json.dumps(entries)
+        try:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save media cache: {str(e)}")
+
+    # Cached entry of a file, or a new empty one if the file changed since (call with the lock held)
+    def entry(self, key, stat):
+        if self.entries is None:
+            self.entries = self.read_file()
+        entry = self.entries.get(key)
+        if not entry or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            entry = {"mtime": stat.st_mtime, "size": stat.st_size}
+        return entry
+
+    def probe(self, video_path):
+        key = os.path.abspath(video_path)
+        stat = os.stat(key)
+        with self.lock:
+            entry = self.entry(key, stat)
+            if "info" in entry:
+                self.hits += 1
+                return dict(entry["info"])
+            self.misses += 1
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+        infos = ffmpeg_parse_infos(key)
+        if "video_size" not in infos:
+            raise IOError(f"No video stream found in {video_path}")
+        info = {"w": infos["video_size"][0], "h": infos["video_size"][1], "duration": infos["video_duration"],
+                "fps": infos["video_fps"], "nframes": infos["video_nframes"], "audio": infos["audio_found"]}
+        with self.lock:
+            entry = self.entry(key, stat)
+            entry["info"] = info
+            self.entries[key] = entry
+        self.save()
+        return dict(info)
+
+    # SHA-256 of the file's contents, hashed once per path, mtime and size
+    def file_hash(self, path):
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        with self.lock:
+            entry = self.entry(key, stat)
+            if "sha256" in entry:
+                return entry["sha256"]
+        import hashlib
+        digest = hashlib.sha256()
+        with open(key, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        with self.lock:
+            entry = self.entry(key, stat)
+            entry["sha256"] = digest.hexdigest()
+            self.entries[key] = entry
+        self.save()
+        return entry["sha256"]
+
+MEDIA_PROBE = MediaProbe()
+
+def probe_video(path):
+    return MEDIA_PROBE.probe(path)
+
+def file_hash(path):
+    return MEDIA_PROBE.file_hash(path)
+
+# Open a video, scaled to size by ffmpeg while decoding when the quality setting asks for it
+def open_video(path, size=None, resize_quality="Best"):
+    from moviepy.editor import VideoFileClip
+    if size and resize_quality == "Decoder":
+        clip = VideoFileClip(path, target_resolution=(size[1], size[0]))
+    else:
+        clip = VideoFileClip(path)
+    clip.reader.get_frame = profiled("decode", clip.reader.get_frame)
+    return clip
 
 # Custom resize function
-def custom_resize(clip, width, height):
+def custom_resize(clip, width, height, quality="Best", buffers=0):
     try:
-        def resize_frame(image):
-            pil_image = Image.fromarray(image, mode='RGB')
-            resized_image = pil_image.resize((width, height), Image.Resampling.LANCZOS)
-            return np.array(resized_image)
-        resized_clip = clip.fl_image(resize_frame)
+        resized_clip = clip.fl_image(FrameResizer(width, height, quality, buffers).resize)
         if resized_clip is None:
             raise ValueError("Resize returned None")
         print(f"Resized clip: {resized_clip.w}x{resized_clip.h}, duration={resized_clip.duration}")
@@ -34,869 +343,3003 @@ def custom_resize(clip, width, height):
         print(f"Error in custom_resize: {str(e)}")
         return None
 
+# Calibrated key model ("Auto"). Instead of a hand-tuned RGB box, backdrop pixels sampled from
+# the foreground are fitted with a Gaussian in YCbCr chroma: a pixel is backdrop when its
+# (Cb, Cr) is within `tolerance` standard deviations of the backdrop's (Mahalanobis distance)
+# and it is no darker than half the darkest backdrop sampled. Shadows and hot spots on the
+# backdrop mostly change luma, so one fit covers the evenly and unevenly lit parts. The model is
+# compiled into a key table with an entry for every 24-bit RGB colour, which turns the kernels'
+# green test into a single gather.
+KEY_MODELS = ["Range", "Auto"]
+CALIBRATION_FRAMES = 5
+CALIBRATION_WIDTH = 320
+# Backdrop candidates in OpenCV HSV (hue 0-180): green hues with some saturation and light
+CALIBRATION_HSV_LOWER = (35, 60, 40)
+CALIBRATION_HSV_UPPER = (90, 255, 255)
+# Fewer candidates than this fraction of the sampled pixels means there is no backdrop to fit
+CALIBRATION_MIN_FRACTION = 0.02
+# Chroma variance floor, so a flat synthetic backdrop still keys its compression noise
+CALIBRATION_MIN_VARIANCE = 4.0
+# Backdrop pixels fitted at most (evenly strided), which keeps the fit small on full-size frames
+CALIBRATION_MAX_SAMPLES = 200000
+
+# BT.601 full-range YCbCr, as OpenCV's RGB2YCrCb
+def rgb_to_ycbcr(r, g, b):
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    return y, (b - y) * 0.564 + 128, (r - y) * 0.713 + 128
+
+# Fit a key model to the backdrop of some RGB frames; None if too few pixels look like backdrop
+def fit_key_model(frames, tolerance=3.0):
+    import cv2
+    samples = []
+    total = 0
+    for frame in frames:
+        frame = np.ascontiguousarray(frame)
+        seed = cv2.inRange(cv2.cvtColor(frame, cv2.COLOR_RGB2HSV), CALIBRATION_HSV_LOWER, CALIBRATION_HSV_UPPER)
+        samples.append(frame[seed > 0])
+        total += seed.size
+    pixels = np.concatenate(samples) if samples else np.empty((0, 3), np.uint8)
+    if len(pixels) < max(64, CALIBRATION_MIN_FRACTION * total):
+        return None
+    pixels = pixels[::-(-len(pixels) // CALIBRATION_MAX_SAMPLES)].astype(np.float64)
+    y, cb, cr = rgb_to_ycbcr(pixels[:, 0], pixels[:, 1], pixels[:, 2])
+    chroma = np.stack([cb, cr], axis=1)
+    # Fit around the median, drop the samples beyond 3 sigma (subject pixels with a green
+    # hue, spill) and fit the rest again
+    keep = np.ones(len(chroma), bool)
+    center = np.median(chroma, axis=0)
+    for _ in range(2):
+        delta = chroma[keep] - center
+        covariance = delta.T @ delta / len(delta) + np.eye(2) * CALIBRATION_MIN_VARIANCE
+        inverse = np.linalg.inv(covariance)
+        delta = chroma - center
+        inside = np.einsum("ni,ij,nj->n", delta, inverse, delta) <= 9
+        if inside.sum() < 64:
+            break
+        keep = inside
+        center = chroma[keep].mean(axis=0)
+    return {
+        "center": [round(float(c), 3) for c in center],
+        "inverse": [[round(float(v), 6) for v in row] for row in inverse],
+        "min_luma": round(float(np.percentile(y[keep], 1)) * 0.5, 2),
+        "tolerance": float(tolerance),
+    }
+
+CALIBRATIONS = {}
+
+# Key model of a foreground video, fitted on frames spread over it and decoded small (chroma
+# doesn't depend on the size). None if it has no green backdrop to fit.
+def calibrate_key(path, tolerance=3.0):
+    stat = os.stat(path)
+    memo = (os.path.abspath(path), stat.st_mtime, stat.st_size, float(tolerance))
+    if memo in CALIBRATIONS:
+        return CALIBRATIONS[memo]
+    info = probe_video(path)
+    width = min(CALIBRATION_WIDTH, info["w"])
+    clip = open_video(path, (width, max(2, int(round(info["h"] * width / info["w"] / 2)) * 2)), "Decoder")
+    try:
+        frames = [clip.get_frame(info["duration"] * (k + 0.5) / CALIBRATION_FRAMES) for k in range(CALIBRATION_FRAMES)]
+    finally:
+        clip.close()
+    model = fit_key_model(frames, tolerance)
+    if model is None:
+        print(f"No green backdrop found in {path}—keying it with the green range")
+    else:
+        print(f"Calibrated key for {os.path.basename(path)}: chroma center {model['center']}, min luma {model['min_luma']}")
+    CALIBRATIONS[memo] = model
+    return model
+
+# Compiled key tables, shared by every keyer in the process (16 MB each)
+KEY_TABLES = OrderedDict()
+KEY_TABLES_LOCK = threading.Lock()
+MAX_KEY_TABLES = 4
+
+# Key table of a model: 255 for the packed colours r << 16 | g << 8 | b the model keys, else 0
+def key_table(model):
+    memo = json.dumps(model, sort_keys=True)
+    with KEY_TABLES_LOCK:
+        table = KEY_TABLES.get(memo)
+        if table is not None:
+            KEY_TABLES.move_to_end(memo)
+            return table
+        table = np.empty(1 << 24, np.uint8)
+        g, b = np.meshgrid(np.arange(256, dtype=np.float32), np.arange(256, dtype=np.float32), indexing="ij")
+        g, b = g.ravel(), b.ravel()
+        (c_b, c_r), ((i_bb, i_br), (i_rb, i_rr)) = model["center"], model["inverse"]
+        limit = model["tolerance"] ** 2
+        # One red value (65536 colours) at a time keeps the temporaries small
+        for r in range(256):
+            y, cb, cr = rgb_to_ycbcr(np.float32(r), g, b)
+            cb -= c_b
+            cr -= c_r
+            distance = i_bb * cb * cb + (i_br + i_rb) * cb * cr + i_rr * cr * cr
+            table[r << 16:(r + 1) << 16] = np.where((distance <= limit) & (y >= model["min_luma"]), 255, 0)
+        KEY_TABLES[memo] = table
+        while len(KEY_TABLES) > MAX_KEY_TABLES:
+            KEY_TABLES.popitem(last=False)
+        return table
+
+# Scratch frame for lookup_key_mask: one 8-byte table index per pixel, upper bytes left at 0
+def key_index_buffer(height, width):
+    return np.zeros((height, width, 8), np.uint8)
+
+# Backdrop mask (0/255) of an RGB frame from a key table. Every pixel is packed into the
+# key_index_buffer as bytes B, G, R, 0, ..., which read as a little-endian int64 are the table
+# index. The indices are already intp and in range, so np.take with mode="clip" gathers
+# straight into `out` (the default mode="raise" copies the indices and buffers the output).
+def lookup_key_mask(table, img, packed, out):
+    import cv2
+    cv2.mixChannels([img], [packed], [0, 2, 1, 1, 2, 0])
+    np.take(table, packed.view("<i8")[..., 0], out=out, mode="clip")
+    return out
+
+# Keying kernels. Every kernel computes the same key: pixels inside the green range form a mask,
+# which is dilated `dilation` times with a cross, blurred (5x5 Gaussian) and re-thresholded.
+# Masked pixels take the background, a 2-pixel band around the mask edge takes a 50/50 blend,
+# and everything else keeps the foreground. With a key table (see key_table) the green range test
+# is a table lookup instead. Kernels write into a caller-provided frame and keep their scratch
+# buffers per resolution. Dilation 0 means no dilation; the original scipy binary_dilation read
+# iterations=0 as "dilate until nothing changes" (keying the whole frame), so the dilation
+# setting starts at MIN_DILATION.
+MIN_DILATION = 1
+
+# Pure numpy reference. Slow, but bit-exact with the original scipy/cv2 implementation for
+# dilation >= 1.
+class NumpyKeyKernel:
+    name = "numpy"
+
+    def __init__(self, green_lower, green_upper, dilation, table=None):
+        self.green_lower = np.array(green_lower, np.int32)
+        self.green_upper = np.array(green_upper, np.int32)
+        self.dilation = int(dilation)
+        self.table = table
+
+    @staticmethod
+    def spread(mask, radius, combine, border):
+        padded = np.pad(mask, radius, constant_values=border)
+        h, w = mask.shape
+        result = mask.copy()
+        for dy in range(2 * radius + 1):
+            for dx in range(2 * radius + 1):
+                result = combine(result, padded[dy:dy + h, dx:dx + w])
+        return result
+
+    @staticmethod
+    def blur_threshold(mask):
+        # cv2.GaussianBlur((5, 5), 0) on a 0/255 mask followed by > 127 is exactly a
+        # [1, 4, 6, 4, 1] x [1, 4, 6, 4, 1] weighted count of at least 128 of 256
+        weights = (1, 4, 6, 4, 1)
+        h, w = mask.shape
+        padded = np.pad(mask.astype(np.int32), 2, mode="reflect")
+        rows = sum(weight * padded[:, i:i + w] for i, weight in enumerate(weights))
+        total = sum(weight * rows[i:i + h, :] for i, weight in enumerate(weights))
+        return total >= 128
+
+    def key(self, img, bg, out):
+        if self.table is not None:
+            mask = self.table[(img[..., 0].astype(np.int32) << 16) | (img[..., 1].astype(np.int32) << 8) | img[..., 2]] > 0
+        else:
+            mask = np.all((img >= self.green_lower) & (img <= self.green_upper), axis=2)
+        for _ in range(self.dilation):
+            padded = np.pad(mask, 1, constant_values=False)
+            mask = mask | padded[:-2, 1:-1] | padded[2:, 1:-1] | padded[1:-1, :-2] | padded[1:-1, 2:]
+        mask = self.blur_threshold(mask)
+        outer = self.spread(mask, 2, np.logical_or, False)
+        inner = self.spread(mask, 2, np.logical_and, True)
+        half = ((img.astype(np.uint16) + bg) >> 1).astype(np.uint8)
+        out[:] = np.where(mask[..., None], bg, np.where((outer & ~inner)[..., None], half, img))
+
+# OpenCV kernel: inRange, in-place morphology and a copyTo-based blend into preallocated buffers.
+# The transition blend is rounded instead of truncated, so it can differ from the reference by 1.
+class OpenCVKeyKernel:
+    name = "opencv"
+
+    def __init__(self, green_lower, green_upper, dilation, table=None):
+        import cv2
+        self.green_lower = tuple(float(v) for v in green_lower)
+        self.green_upper = tuple(float(v) for v in green_upper)
+        self.dilation = int(dilation)
+        self.table = table
+        # Same structuring elements as the old scipy/cv2 chain: a cross for
+        # binary_dilation's default connectivity, a 3x3 square for the transition zone
+        self.cross = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+        self.kernel = np.ones((3, 3), np.uint8)
+        self.buffers = {}
+
+    def get_buffers(self, height, width):
+        buffers = self.buffers.get((height, width))
+        if buffers is None:
+            buffers = {
+                "mask": np.empty((height, width), np.uint8),
+                "blur": np.empty((height, width), np.uint8),
+                "outer": np.empty((height, width), np.uint8),
+                "inner": np.empty((height, width), np.uint8),
+                "half": np.empty((height, width, 3), np.uint8),
+                "packed": key_index_buffer(height, width) if self.table is not None else None,
+            }
+            self.buffers[(height, width)] = buffers
+        return buffers
+
+    def key(self, img, bg, out):
+        import cv2
+        b = self.get_buffers(img.shape[0], img.shape[1])
+        mask, blur, outer, inner = b["mask"], b["blur"], b["outer"], b["inner"]
+
+        # Create initial mask based on green range (0/255)
+        if self.table is not None:
+            lookup_key_mask(self.table, img, b["packed"], mask)
+        else:
+            cv2.inRange(img, self.green_lower, self.green_upper, dst=mask)
+
+        # Refine mask edges
+        if self.dilation > 0:
+            cv2.dilate(mask, self.cross, dst=mask, iterations=self.dilation)
+        cv2.GaussianBlur(mask, (5, 5), 0, dst=blur)
+        cv2.threshold(blur, 127, 255, cv2.THRESH_BINARY, dst=mask)
+
+        # Create a transition zone around edges
+        cv2.dilate(mask, self.kernel, dst=outer, iterations=2)
+        cv2.erode(mask, self.kernel, dst=inner, iterations=2)
+        cv2.subtract(outer, inner, dst=outer)
+
+        # Foreground, then 50/50 blend in the transition zone, then background under the mask
+        np.copyto(out, img)
+        cv2.addWeighted(img, 0.5, bg, 0.5, 0, dst=b["half"])
+        cv2.copyTo(b["half"], outer, out)
+        cv2.copyTo(bg, mask, out)
+
+# numba kernel: the whole key in one jitted, row-parallel function. The final pass computes
+# the transition band and blends in the same loop. Bit-exact with the reference.
+NUMBA_KEY = None
+
+def compile_numba_key():
+    global NUMBA_KEY
+    if NUMBA_KEY is not None:
+        return NUMBA_KEY
+    from numba import config, njit, prange
+    # The render pipeline keys on a worker thread; TBB's pool then hangs at interpreter exit,
+    # OpenMP doesn't
+    config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+
+    @njit(inline="always")
+    def reflect(i, n):
+        if i < 0:
+            return -i
+        if i >= n:
+            return 2 * n - 2 - i
+        return i
+
+    @njit(parallel=True, cache=True)
+    def numba_key(img, bg, lower, upper, table, dilation, mask, spare, rows, band_max, band_min, out):
+        h, w = mask.shape
+        lookup = table.shape[0] > 0
+        for y in prange(h):
+            for x in range(w):
+                if lookup:
+                    mask[y, x] = 1 if table[(np.int32(img[y, x, 0]) << 16) | (np.int32(img[y, x, 1]) << 8) | np.int32(img[y, x, 2])] else 0
+                    continue
+                inside = 1
+                for c in range(3):
+                    if img[y, x, c] < lower[c] or img[y, x, c] > upper[c]:
+                        inside = 0
+                mask[y, x] = inside
+
+        src, dst = mask, spare
+        for _ in range(dilation):
+            for y in prange(h):
+                for x in range(w):
+                    v = src[y, x]
+                    if v == 0:
+                        if (y > 0 and src[y - 1, x]) or (y < h - 1 and src[y + 1, x]) or (x > 0 and src[y, x - 1]) or (x < w - 1 and src[y, x + 1]):
+                            v = 1
+                    dst[y, x] = v
+            src, dst = dst, src
+
+        # Gaussian blur + threshold as an integer weighted count
+        for y in prange(h):
+            for x in range(w):
+                rows[y, x] = (src[y, reflect(x - 2, w)] + 4 * src[y, reflect(x - 1, w)] + 6 * src[y, x]
+                              + 4 * src[y, reflect(x + 1, w)] + src[y, reflect(x + 2, w)])
+        for y in prange(h):
+            for x in range(w):
+                total = (rows[reflect(y - 2, h), x] + 4 * rows[reflect(y - 1, h), x] + 6 * rows[y, x]
+                         + 4 * rows[reflect(y + 1, h), x] + rows[reflect(y + 2, h), x])
+                dst[y, x] = 1 if total >= 128 else 0
+        keyed = dst
+
+        # 5-wide row max/min, then column max/min fused with the blend
+        for y in prange(h):
+            for x in range(w):
+                hi = 0
+                lo = 1
+                for dx in range(-2, 3):
+                    xx = x + dx
+                    if xx < 0 or xx >= w:
+                        continue
+                    v = keyed[y, xx]
+                    hi = max(hi, v)
+                    lo = min(lo, v)
+                band_max[y, x] = hi
+                band_min[y, x] = lo
+        for y in prange(h):
+            for x in range(w):
+                if keyed[y, x]:
+                    for c in range(3):
+                        out[y, x, c] = bg[y, x, c]
+                    continue
+                hi = 0
+                lo = 1
+                for dy in range(-2, 3):
+                    yy = y + dy
+                    if yy < 0 or yy >= h:
+                        continue
+                    hi = max(hi, band_max[yy, x])
+                    lo = min(lo, band_min[yy, x])
+                if hi and not lo:
+                    for c in range(3):
+                        out[y, x, c] = (np.uint16(img[y, x, c]) + bg[y, x, c]) >> 1
+                else:
+                    for c in range(3):
+                        out[y, x, c] = img[y, x, c]
+
+    NUMBA_KEY = numba_key
+    return NUMBA_KEY
+
+class NumbaKeyKernel:
+    name = "numba"
+
+    def __init__(self, green_lower, green_upper, dilation, table=None):
+        self.numba_key = compile_numba_key()
+        self.green_lower = np.array(green_lower, np.int32)
+        self.green_upper = np.array(green_upper, np.int32)
+        # An empty table means "use the range"
+        self.table = table if table is not None else np.empty(0, np.uint8)
+        self.dilation = int(dilation)
+        self.buffers = {}
+
+    def key(self, img, bg, out):
+        h, w = img.shape[:2]
+        b = self.buffers.get((h, w))
+        if b is None:
+            b = [np.empty((h, w), np.uint8), np.empty((h, w), np.uint8), np.empty((h, w), np.int32),
+                 np.empty((h, w), np.uint8), np.empty((h, w), np.uint8)]
+            self.buffers[(h, w)] = b
+        self.numba_key(np.ascontiguousarray(img), np.ascontiguousarray(bg), self.green_lower, self.green_upper, self.table, self.dilation, *b, out)
+
+KEY_BACKENDS = {"numpy": NumpyKeyKernel, "opencv": OpenCVKeyKernel, "numba": NumbaKeyKernel}
+# Preference order for "auto"
+KEY_BACKEND_ORDER = ["opencv", "numba", "numpy"]
+KEY_BACKEND_MODULES = {"numpy": "numpy", "opencv": "cv2", "numba": "numba"}
+
+# Backends whose modules are installed
+def available_key_backends():
+    import importlib.util
+    return [name for name in KEY_BACKEND_ORDER if importlib.util.find_spec(KEY_BACKEND_MODULES[name]) is not None]
+
+def resolve_key_backend(backend="auto"):
+    available = available_key_backends()
+    if backend in (None, "", "auto"):
+        return available[0]
+    if backend not in available:
+        print(f"Key backend {backend} is not available—using {available[0]}")
+        return available[0]
+    return backend
+
+# Region-of-interest tracking for keying. A pixel's key only depends on the green range test
+# within dilation + 4 pixels of it (dilation, 5x5 blur, 2-pixel transition band), so every
+# pixel further than that from non-green content keys to plain background. The tracker finds
+# the bounding box of non-green content on a block-downscaled mask (any non-green pixel marks
+# its whole block, so the box is conservative), pads it by that reach, unions it with the
+# boxes of the last few frames and snaps it to a grid, so the box, and with it the kernel's
+# buffer size, only changes when the subject really moves.
+class KeyRegion:
+    BLOCK = 8
+    ALIGN = 32
+    HOLD = 12
+    # Above this fraction of the frame, keying the whole frame is cheaper than cropping
+    MAX_FRACTION = 0.6
+
+    def __init__(self, green_lower, green_upper, dilation, table=None):
+        self.green_lower = tuple(float(v) for v in green_lower)
+        self.green_upper = tuple(float(v) for v in green_upper)
+        self.table = table
+        self.reach = int(dilation) + 5
+        self.history = []
+        self.buffers = {}
+        # Frames left to key whole without looking for a box, after the box covered most of the frame
+        self.skip = 0
+        self.full = self.cropped = self.empty = 0
+
+    # Box (x0, y0, x1, y1) that has to be keyed, or None if the frame is all backdrop
+    def find(self, img):
+        import cv2
+        h, w = img.shape[:2]
+        b = self.buffers.get((h, w))
+        if b is None:
+            b = self.buffers[(h, w)] = (np.empty((h, w), np.uint8), np.empty(((h + self.BLOCK - 1) // self.BLOCK, (w + self.BLOCK - 1) // self.BLOCK), np.uint8),
+                                        key_index_buffer(h, w) if self.table is not None else None)
+        mask, small, packed = b
+        if self.table is not None:
+            lookup_key_mask(self.table, img, packed, mask)
+        else:
+            cv2.inRange(img, self.green_lower, self.green_upper, dst=mask)
+        cv2.bitwise_not(mask, dst=mask)
+        cv2.resize(mask, (small.shape[1], small.shape[0]), dst=small, interpolation=cv2.INTER_AREA)
+        # INTER_AREA averages, so a lone non-green pixel still leaves a non-zero block (255 / 64 rounds to 4)
+        x, y, bw, bh = cv2.boundingRect(small)
+        box = None
+        if bw and bh:
+            box = (max(0, x * self.BLOCK - self.reach), max(0, y * self.BLOCK - self.reach),
+                   min(w, (x + bw) * self.BLOCK + self.reach), min(h, (y + bh) * self.BLOCK + self.reach))
+        self.history = (self.history + [box])[-self.HOLD:]
+        boxes = [b for b in self.history if b is not None]
+        if not boxes:
+            return None
+        x0 = min(b[0] for b in boxes) // self.ALIGN * self.ALIGN
+        y0 = min(b[1] for b in boxes) // self.ALIGN * self.ALIGN
+        x1 = min(w, -(-max(b[2] for b in boxes) // self.ALIGN) * self.ALIGN)
+        y1 = min(h, -(-max(b[3] for b in boxes) // self.ALIGN) * self.ALIGN)
+        return x0, y0, x1, y1
+
+    # The box plus `reach` pixels of context, so the kernel sees the same neighbourhood
+    # inside the box as it would on the full frame
+    def context(self, box, w, h):
+        x0, y0, x1, y1 = box
+        return max(0, x0 - self.reach), max(0, y0 - self.reach), min(w, x1 + self.reach), min(h, y1 + self.reach)
+
+# Reusable green keying engine. Buffers are allocated once per resolution and
+# reused for every frame, so keying a clip does no per-frame full-frame allocations.
+# The returned frame is an internal buffer that is overwritten by the next call
+# at the same resolution; copy it if it has to outlive that.
+# With roi=True the kernel only runs around the non-green content (see KeyRegion) and the
+# rest of the frame is copied from the background; the result is identical to a full key.
+# A key_model (from calibrate_key) replaces the green range.
+class GreenKeyer:
+    def __init__(self, green_lower, green_upper, dilation, backend="auto", roi=False, key_model=None):
+        self.backend = resolve_key_backend(backend)
+        table = key_table(key_model) if key_model else None
+        self.kernel = KEY_BACKENDS[self.backend](green_lower, green_upper, dilation, table)
+        self.run_kernel = profiled("key", self.kernel.key)
+        self.region = KeyRegion(green_lower, green_upper, dilation, table) if roi else None
+        self.find_region = profiled("roi", self.region.find) if roi else None
+        self.crop_shape = None
+        self.buffers = {}
+
+    # Pass `out` to key into a caller-owned (height, width, 3) uint8 frame instead
+    def key(self, image, bg_frame, out=None):
+        img = np.asarray(image)
+        bg = np.asarray(bg_frame)
+        if out is None:
+            out = self.buffers.get(img.shape)
+            if out is None:
+                out = self.buffers[img.shape] = np.empty(img.shape, np.uint8)
+        if self.region is None:
+            self.run_kernel(img, bg, out)
+        else:
+            self.key_region(img, bg, out)
+        return out
+
+    def key_region(self, img, bg, out):
+        h, w = img.shape[:2]
+        region = self.region
+        if region.skip > 0:
+            region.skip -= 1
+            region.full += 1
+            self.run_kernel(img, bg, out)
+            return
+        box = self.find_region(img)
+        if box is None:
+            region.empty += 1
+            np.copyto(out, bg)
+            return
+        x0, y0, x1, y1 = box
+        if (x1 - x0) * (y1 - y0) > region.MAX_FRACTION * w * h:
+            # A full key is always exact, so don't pay for the box search again for a while
+            region.full += 1
+            region.skip = region.HOLD
+            region.history = []
+            self.run_kernel(img, bg, out)
+            return
+        region.cropped += 1
+        cx0, cy0, cx1, cy1 = region.context(box, w, h)
+        shape = (cy1 - cy0, cx1 - cx0, 3)
+        if shape != self.crop_shape:
+            # Drop the kernel's buffers for the previous crop size; the box changes rarely
+            # but every size would otherwise stay allocated
+            kernel_buffers = getattr(self.kernel, "buffers", None)
+            if kernel_buffers is not None and self.crop_shape is not None:
+                kernel_buffers.pop(self.crop_shape[:2], None)
+            self.buffers.pop(("crop",) + (self.crop_shape or ()), None)
+            self.crop_shape = shape
+        crop = self.buffers.get(("crop",) + shape)
+        if crop is None:
+            crop = self.buffers[("crop",) + shape] = np.empty(shape, np.uint8)
+        self.run_kernel(img[cy0:cy1, cx0:cx1], bg[cy0:cy1, cx0:cx1], crop)
+        np.copyto(out, bg)
+        out[y0:y1, x0:x1] = crop[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+
+# Converted foregrounds can carry their person mask in a lossless (FFV1) greyscale sidecar
+# video next to them, written by convert_video_to_green. Foregrounds with a sidecar are
+# composited through that alpha instead of being colour keyed.
+def alpha_sidecar_path(video_path):
+    return os.path.splitext(video_path)[0] + ".alpha.mkv"
+
+# Sidecar of a video, or None if there is none (or it predates the video)
+def find_alpha_sidecar(video_path):
+    path = alpha_sidecar_path(video_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(video_path) - 2:
+        return path
+    return None
+
+def remove_alpha_sidecar(video_path):
+    path = alpha_sidecar_path(video_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+# Alpha compositing with GreenKeyer's buffer handling: out = fg * a + bg * (1 - a) for a 0-255
+# alpha frame (greyscale, or RGB with equal channels as moviepy decodes it)
+class AlphaCompositor:
+    def __init__(self):
+        self.buffers = {}
+        self.run_blend = profiled("alpha", self.blend)
+
+    def blend(self, img, alpha, bg, out):
+        import cv2
+        alpha = alpha if alpha.ndim == 2 else alpha[..., 0]
+        # Masks from convert_video_to_green are 0/255 unless resizing softened them; those are a plain copy
+        if not cv2.countNonZero(cv2.inRange(alpha, 1, 254)):
+            np.copyto(out, bg)
+            cv2.copyTo(img, alpha, out)
+            return
+        weights = self.buffers.get(("weights",) + img.shape[:2])
+        if weights is None:
+            weights = self.buffers[("weights",) + img.shape[:2]] = (np.empty(img.shape[:2], np.float32), np.empty(img.shape[:2], np.float32))
+        fg_weight, bg_weight = weights
+        np.multiply(alpha, np.float32(1 / 255), out=fg_weight)
+        np.subtract(np.float32(1), fg_weight, out=bg_weight)
+        cv2.blendLinear(img, bg, fg_weight, bg_weight, dst=out)
+
+    def composite(self, image, alpha, bg_frame, out=None):
+        img = np.asarray(image)
+        if out is None:
+            out = self.buffers.get(img.shape)
+            if out is None:
+                out = self.buffers[img.shape] = np.empty(img.shape, np.uint8)
+        self.run_blend(img, np.asarray(alpha), np.asarray(bg_frame), out)
+        return out
+
+# Synthetic green-screen frame: noisy green backdrop with a few solid shapes and soft edges
+def synthetic_green_frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = (20, 220, 30)
+    frame += rng.integers(0, 25, frame.shape, dtype=np.uint8)
+    frame[height // 4:3 * height // 4, width // 3:width // 2] = (190, 120, 90)
+    frame[height // 2:, 2 * width // 3:5 * width // 6] = (60, 60, 200)
+    ramp = np.linspace(0, 255, width // 6, dtype=np.uint8)
+    frame[:height // 5, :width // 6, 0] = ramp
+    return frame
+
+# Compare every installed backend against the numpy reference on synthetic frames, keyed
+# with the green range and with a key model calibrated on them.
+# Returns {backend: max abs difference}; `tolerance` is the allowed difference.
+def check_key_backends(sizes=((320, 180), (641, 361)), dilations=(0, 1, 3), tolerance=1):
+    results = {}
+    for backend in available_key_backends():
+        worst = 0
+        for width, height in sizes:
+            img = synthetic_green_frame(width, height)
+            bg = np.random.default_rng(1).integers(0, 256, img.shape, dtype=np.uint8)
+            for key_model in (None, fit_key_model([img])):
+                for dilation in dilations:
+                    reference = GreenKeyer((0, 150, 0), (120, 255, 120), dilation, "numpy", key_model=key_model).key(img, bg)
+                    result = GreenKeyer((0, 150, 0), (120, 255, 120), dilation, backend, key_model=key_model).key(img, bg)
+                    worst = max(worst, int(np.abs(reference.astype(np.int16) - result).max()))
+        results[backend] = worst
+        print(f"Key backend {backend}: max difference {worst} ({'ok' if worst <= tolerance else 'FAILED'})")
+    return results
+
 # Custom green keying function
-def manual_key_green(image, bg_frame, green_lower, green_upper, dilation):
-    img = np.array(image)
-    bg = np.array(bg_frame)
-    
-    # Create initial mask based on green range
-    mask = np.all((img >= green_lower) & (img <= green_upper), axis=2)
-    
-    # Apply edge refinement
-    kernel = np.ones((3,3), np.uint8)
-    edge_mask = cv2.Canny(img, 100, 200)
-    edge_mask = cv2.dilate(edge_mask, kernel, iterations=1)
-    
-    # Refine mask edges
-    mask = binary_dilation(mask, iterations=dilation)
-    mask = cv2.GaussianBlur(mask.astype(np.uint8) * 255, (5, 5), 0) > 127
-    
-    # Create a transition zone around edges
-    transition_mask = cv2.dilate(mask.astype(np.uint8), kernel, iterations=2) - cv2.erode(mask.astype(np.uint8), kernel, iterations=2)
-    
-    # Apply alpha blending in transition zone
-    alpha = np.zeros_like(mask, dtype=np.float32)
-    alpha[mask] = 1.0
-    alpha[transition_mask == 1] = 0.5
-    
-    # Blend the edges
-    result = img.copy()
-    for c in range(3):
-        result[:,:,c] = img[:,:,c] * (1 - alpha) + bg[:,:,c] * alpha
-    
-    # Apply final mask
-    result[mask] = bg[mask]
-    
-    return result
+def manual_key_green(image, bg_frame, green_lower, green_upper, dilation, backend="auto"):
+    return GreenKeyer(green_lower, green_upper, dilation, backend).key(image, bg_frame)
+
+# LRU cache of decoded, resized frames keyed by (path, (width, height), frame index).
+# Frames are evicted least-recently-used once max_bytes is exceeded. With spill_bytes set,
+# evicted frames are written to a memory-mapped raw file and read back from there instead of
+# being decoded and resized again. Cached frames are read-only.
+class FrameCache:
+    def __init__(self, max_bytes, spill_bytes=0):
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self.frames = OrderedDict()
+        self.nbytes = 0
+        self.spills = {}
+        self.spilled = {}
+        self.lock = threading.Lock()
+        self.hits = self.spill_hits = self.misses = 0
+
+    def get(self, key, load):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            if key in self.spilled:
+                shape, slot = self.spilled[key]
+                frame = np.array(self.spills[shape]["map"][slot])
+                self.spill_hits += 1
+            else:
+                frame = None
+        if frame is None:
+            frame = np.ascontiguousarray(load())
+            with self.lock:
+                self.misses += 1
+        frame.flags.writeable = False
+        with self.lock:
+            if key not in self.frames:
+                self.frames[key] = frame
+                self.nbytes += frame.nbytes
+                self.evict()
+        return frame
+
+    def evict(self):
+        while self.nbytes > self.max_bytes and len(self.frames) > 1:
+            key, frame = self.frames.popitem(last=False)
+            self.nbytes -= frame.nbytes
+            if self.spill_bytes and key not in self.spilled:
+                self.spill(key, frame)
+
+    def spill(self, key, frame):
+        spill = self.spills.get(frame.shape)
+        if spill is None:
+            slots = self.spill_bytes // frame.nbytes
+            if slots == 0:
+                return
+            fd, path = tempfile.mkstemp(prefix="bgcache_", suffix=".raw")
+            os.close(fd)
+            spill = {"path": path, "map": np.memmap(path, dtype=np.uint8, mode="w+", shape=(slots,) + frame.shape), "used": 0}
+            self.spills[frame.shape] = spill
+        if spill["used"] < len(spill["map"]):
+            spill["map"][spill["used"]] = frame
+            self.spilled[key] = (frame.shape, spill["used"])
+            spill["used"] += 1
+
+    def close(self):
+        with self.lock:
+            self.frames.clear()
+            self.spilled.clear()
+            self.nbytes = 0
+            for spill in self.spills.values():
+                del spill["map"]
+                os.remove(spill["path"])
+            self.spills.clear()
+
+# Process-wide background cache, so every foreground of a batch (and every job of a CLI batch)
+# sharing a background decodes and resizes each background frame once
+BACKGROUND_CACHE = None
+
+def configure_background_cache(max_mb, spill_mb=0):
+    global BACKGROUND_CACHE
+    max_bytes, spill_bytes = int(max_mb) * 1024 * 1024, int(spill_mb) * 1024 * 1024
+    if BACKGROUND_CACHE is not None:
+        if (BACKGROUND_CACHE.max_bytes, BACKGROUND_CACHE.spill_bytes) == (max_bytes, spill_bytes):
+            return BACKGROUND_CACHE
+        BACKGROUND_CACHE.close()
+    BACKGROUND_CACHE = FrameCache(max_bytes, spill_bytes) if max_bytes > 0 else None
+    return BACKGROUND_CACHE
+
+def close_background_cache():
+    if BACKGROUND_CACHE is not None:
+        BACKGROUND_CACHE.close()
+
+atexit.register(close_background_cache)
+
+# Resident memory of this process in bytes: (current, peak). On Linux both come from /proc,
+# where reset_peak_memory() starts a new peak per render; elsewhere the peak is the process
+# lifetime's and the current size is unknown (None without the resource module).
+def memory_usage():
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
 
-# Main processing function
-def process_video(foreground_paths, background_path, output_base_path, text, text_color, text_size, text_pos, loop, fg_width, fg_height, bg_width, bg_height, audio_source, custom_audio_path, green_lower, green_upper, dilation, format, fps, transition, app):
+def reset_peak_memory():
     try:
-        app.update_status(f"Starting {os.path.basename(output_base_path)}", "#d4a017")
-        app.progress["value"] = 0
-        total_files = len(foreground_paths)
-        
-        target_width = int(fg_width) if fg_width else (int(bg_width) if bg_width else None)
-        target_height = int(fg_height) if fg_height else (int(bg_height) if bg_height else None)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
 
-        app.update_status("Loading background", "#d4a017")
-        background = VideoFileClip(background_path)
-        if background is None:
-            raise ValueError(f"Failed to load background: {background_path}")
-        print(f"Background loaded: {background.w}x{background.h}, duration={background.duration}")
+# Peak RSS of the largest finished child process (ffmpeg, render workers) in bytes, or None
+def child_peak_memory():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+# Free frame buffers by shape. Under a memory budget the frame rings of the renderer (resizer,
+# decoder and output rings) come from here and go back when a clip is done, so each clip
+# reuses the previous clip's buffers instead of allocating new full frames, which glibc
+# tends to keep in a fragmented heap rather than return to the OS.
+class FramePool:
+    def __init__(self):
+        self.free = {}
+        self.lock = threading.Lock()
+
+    def take(self, shape):
+        with self.lock:
+            buffers = self.free.get(shape)
+            if buffers:
+                return buffers.pop()
+        return np.empty(shape, np.uint8)
+
+    def give(self, buffers):
+        with self.lock:
+            for buffer in buffers:
+                self.free.setdefault(buffer.shape, []).append(buffer)
+
+    def clear(self):
+        with self.lock:
+            self.free.clear()
+
+# Memory budget of a render (memory_budget_mb). Budgeted renders stream one clip at a time into
+# disk segments through the pipelined renderer, take their frame buffers from a shared pool,
+# decode with at most DECODE_THREADS ffmpeg threads straight into pooled frames, and get the
+# worker count, pipeline depth (how far decoding runs ahead) and background cache size that
+# fit. The budget covers the render processes; ffmpeg's own memory (the encoder's lookahead
+# above all) is reported separately.
+class MemoryBudget:
+    # Full frames a pipelined render holds besides its queues (resizer, decoder and output
+    # rings, keying scratch), and per unit of pipeline depth (one per queue); measured at
+    # 1080p and 4K
+    FIXED_FRAMES = 8
+    FRAMES_PER_DEPTH = 3
+    MAX_DEPTH = 4
+    DECODE_THREADS = 2
+    # Least size of a render process once numpy, OpenCV and moviepy are loaded (they load lazily,
+    # so the current size at the start of a render is usually lower)
+    BASE_BYTES = 150 * 1024 * 1024
+
+    def __init__(self, max_mb):
+        self.max_mb = int(max_mb)
+        self.pool = FramePool()
+
+    def pipeline_bytes(self, frame_bytes, depth):
+        return frame_bytes * (self.FIXED_FRAMES + self.FRAMES_PER_DEPTH * depth)
+
+    # (workers, pipeline depth, background cache MB) that fit for output frames of frame_bytes.
+    # The requested values are upper limits; depth 0 means up to MAX_DEPTH.
+    def fit(self, frame_bytes, workers, depth, bg_cache_mb):
+        base = max(memory_usage()[0] or 0, self.BASE_BYTES)
+        available = self.max_mb * 1024 * 1024 - base
+        smallest = self.pipeline_bytes(frame_bytes, 1)
+        if workers > 1:
+            # Every worker is a render process of its own; this one only waits for them
+            workers = int(max(1, min(workers, available // (base + smallest))))
+        share = available if workers == 1 else available // workers - base
+        if share < smallest:
+            print(f"Memory budget of {self.max_mb} MB is below the {(base + smallest) // (1024 * 1024)} MB this frame size needs—rendering with the smallest pipeline")
+        depth = int(depth) or self.MAX_DEPTH
+        while depth > 1 and self.pipeline_bytes(frame_bytes, depth) > share:
+            depth -= 1
+        # What is left goes to the background cache, less one more depth's worth of frames for
+        # the copies it makes and the frame it is evicting
+        cache_mb = int(max(0, min(int(bg_cache_mb), (share - self.pipeline_bytes(frame_bytes, depth + 1)) // (1024 * 1024))))
+        return workers, depth, cache_mb
+
+# Memory budget of the render in progress in this process, or None for no budget
+MEMORY_BUDGET = None
+
+def configure_memory_budget(max_mb):
+    global MEMORY_BUDGET
+    max_mb = int(max_mb) if max_mb else 0
+    if max_mb <= 0:
+        MEMORY_BUDGET = None
+    elif MEMORY_BUDGET is None or MEMORY_BUDGET.max_mb != max_mb:
+        MEMORY_BUDGET = MemoryBudget(max_mb)
+    return MEMORY_BUDGET
+
+# `count` uint8 frames of `shape`, from the budget's pool when there is one
+def frame_ring(count, shape):
+    budget = MEMORY_BUDGET
+    if budget is None:
+        return [np.empty(shape, np.uint8) for _ in range(count)]
+    return [budget.pool.take(shape) for _ in range(count)]
+
+def release_frames(frames):
+    budget = MEMORY_BUDGET
+    if budget is not None:
+        budget.pool.give(frames)
+
+# Index of the source frame moviepy's reader returns for time t
+def source_frame_index(fps, t):
+    return int(fps * t + 0.00001)
+
+# Serve a (resized) background clip's frames through the background cache
+def cache_background(clip, path, fps, resize_quality="Best"):
+    cache = BACKGROUND_CACHE
+    if cache is None:
+        return clip
+    key_base = (path, (clip.w, clip.h), resize_quality)
+    return clip.fl(lambda gf, t: cache.get(key_base + (source_frame_index(fps, t),), lambda: gf(t)))
+
+# Render events. Render and conversion code posts events here instead of touching a GUI, so it
+# runs the same in the Tk app, on the command line and in queue worker processes:
+#   ("status", text, color), ("progress", value), ("done", task, output, message), ("error", task, message)
+# post() calls the subscribers on the posting thread, so they must be quick and thread-safe
+# (print, append to a list, put on a queue); the subscriber tuple is replaced rather than
+# mutated, so posting takes no lock. The GUI subscribes a queue and drains it from the Tk thread.
+class EventBus:
+    def __init__(self):
+        self.subscribers = ()
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers = self.subscribers + (callback,)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.subscribers = tuple(s for s in self.subscribers if s is not callback)
+
+    def post(self, kind, **fields):
+        event = dict(fields, type=kind, time=time.time())
+        for callback in self.subscribers:
+            callback(event)
+
+EVENTS = EventBus()
+
+# Command-line subscriber: status lines as they come, progress in 10% steps
+class ConsoleEvents:
+    def __init__(self):
+        self.last_step = None
+
+    def __call__(self, event):
+        if event["type"] == "status":
+            print(f"Status: {event['text']}")
+        elif event["type"] == "detail":
+            print(event["text"])
+        elif event["type"] == "progress":
+            step = int(event["value"] // 10) * 10
+            if step != self.last_step:
+                self.last_step = step
+                print(f"Progress: {step}%")
+
+def report_status(text, color="#d4a017"):
+    EVENTS.post("status", text=text, color=color)
+
+def report_progress(value):
+    EVENTS.post("progress", value=value)
+
+# Diagnostic detail (sizes, durations) for the console and the log; the GUI doesn't show it
+def report_detail(text):
+    EVENTS.post("detail", text=text)
+
+# Frame progress, reported when it moved by PROGRESS_STEP percent or PROGRESS_INTERVAL seconds
+# passed since the last report, and always on the last frame, so short clips still step through
+# and long ones don't flood the event bus
+PROGRESS_STEP = 1.0
+PROGRESS_INTERVAL = 0.5
+
+class ProgressThrottle:
+    def __init__(self, total):
+        self.total = total
+        self.last_value = None
+        self.last_time = 0.0
+
+    def update(self, done):
+        if not self.total:
+            return
+        value = min(100, (done / self.total) * 100)
+        now = time.monotonic()
+        if self.last_value is None or value >= 100 or value - self.last_value >= PROGRESS_STEP or (value > self.last_value and now - self.last_time >= PROGRESS_INTERVAL):
+            self.last_value, self.last_time = value, now
+            report_progress(value)
+
+# Report write progress while write_videofile renders a clip
+def track_progress(clip, fps, total_frames):
+    progress = ProgressThrottle(total_frames)
+
+    def frame(gf, t):
+        progress.update(source_frame_index(fps, t) + 1)
+        return gf(t)
+    return clip.fl(frame)
+
+# Output size requested by the size settings, or (None, None) to follow the first foreground
+def requested_size(fg_width, fg_height, bg_width, bg_height):
+    target_width = int(fg_width) if fg_width else (int(bg_width) if bg_width else None)
+    target_height = int(fg_height) if fg_height else (int(bg_height) if bg_height else None)
+    return target_width, target_height
+
+# HUD text overlay, rendered with PIL instead of moviepy's TextClip (which needed ImageMagick).
+# The text is rasterized once into a premultiplied sprite cropped to its visible pixels, and each
+# frame only blends that rectangle: out = text + frame * (255 - alpha) / 255.
+# Tried in order; Arial on Windows, DejaVu on most Linux installs, else PIL's built-in font
+TEXT_FONTS = ["arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"]
+
+def load_text_font(size):
+    from PIL import ImageFont
+    for name in TEXT_FONTS:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    return ImageFont.load_default(size)
+
+class TextOverlay:
+    # Anchor of each position: fraction of the free width, and the top edge (None = centered)
+    POSITIONS = {
+        "Top Left": (0.0, 50),
+        "Top Center": (0.5, 50),
+        "Top Right": (1.0, 50),
+        "Center": (0.5, None),
+        "Bottom Left": (0.0, -50),
+        "Bottom Center": (0.5, -50),
+        "Bottom Right": (1.0, -50)
+    }
+
+    def __init__(self, text, color, size, position, frame_width, frame_height):
+        from PIL import ImageColor, ImageDraw
+        font = load_text_font(int(size))
+        left, top, right, bottom = font.getbbox(text)
+        image = Image.new("L", (max(1, right), max(1, bottom)))
+        ImageDraw.Draw(image).text((0, 0), text, fill=255, font=font)
+        alpha = np.asarray(image)
+        # Placement uses the full text box, the sprite only the pixels that are drawn
+        x_fraction, top_edge = self.POSITIONS[position]
+        x = int((frame_width - image.width) * x_fraction)
+        if top_edge is None:
+            y = (frame_height - image.height) // 2
+        else:
+            y = top_edge if top_edge >= 0 else frame_height + top_edge
+        box = image.getbbox()
+        self.rect = None
+        if box is None:
+            return
+        x0, y0, x1, y1 = box
+        # Clip to the frame
+        fx0, fy0 = max(0, x + x0), max(0, y + y0)
+        fx1, fy1 = min(frame_width, x + x1), min(frame_height, y + y1)
+        if fx0 >= fx1 or fy0 >= fy1:
+            return
+        alpha = alpha[fy0 - y:fy1 - y, fx0 - x:fx1 - x]
+        rgb = np.array(ImageColor.getrgb(color)[:3], np.float32)
+        self.rect = (fx0, fy0, fx1, fy1)
+        self.premultiplied = np.rint(alpha[..., None] * (rgb / 255)).astype(np.uint8)
+        self.inverse_alpha = np.repeat((255 - alpha)[..., None], 3, axis=2)
+
+    # Blend the text into a (height, width, 3) uint8 frame in place; returns the frame
+    def draw(self, frame):
+        import cv2
+        if self.rect is not None:
+            x0, y0, x1, y1 = self.rect
+            region = frame[y0:y1, x0:x1]
+            cv2.multiply(region, self.inverse_alpha, dst=region, scale=1 / 255)
+            cv2.add(region, self.premultiplied, dst=region)
+        return frame
+
+# Overlays are cached per (text, color, size, position, frame size), so every clip and
+# render of the same HUD shares one sprite
+TEXT_OVERLAYS = OrderedDict()
+
+def text_overlay(text, color, size, position, frame_width, frame_height):
+    key = (text, color, int(size), position, int(frame_width), int(frame_height))
+    overlay = TEXT_OVERLAYS.get(key)
+    if overlay is None:
+        overlay = TEXT_OVERLAYS[key] = profiled("text", TextOverlay)(*key)
+        while len(TEXT_OVERLAYS) > 16:
+            TEXT_OVERLAYS.popitem(last=False)
+    return overlay
+
+# One output frame in a single pass: the background frame is fetched once and the foreground is
+# keyed (or alpha composited) over it straight into the output buffer, then the HUD is drawn
+# into it. Replaces a CompositeVideoClip of background, keyed foreground and text layers, which
+# fetched and blitted the background a second time and copied every layer.
+class FrameCompositor:
+    def __init__(self, width, height, green_lower, green_upper, dilation, key_backend="auto", roi_keying=False,
+                 text="", text_color="white", text_size=24, text_pos="Top Left", key_model=None):
+        self.keyer = GreenKeyer([int(c) for c in green_lower], [int(c) for c in green_upper], dilation, key_backend, roi_keying, key_model)
+        self.alpha = AlphaCompositor()
+        self.fill = profiled("composite", np.copyto)
+        self.draw_text = None
+        if text.strip():
+            self.draw_text = profiled("text", text_overlay(text, text_color, text_size, text_pos, width, height).draw)
+        self.size = (width, height)
+        self.out = None
+
+    # fg_frame None means the foreground has ended and the background shows alone. The frame
+    # is written to `out` (default: the compositor's own buffer, overwritten by the next call).
+    def compose(self, fg_frame, alpha_frame, bg_frame, show_text, out=None):
+        if out is None:
+            if self.out is None:
+                self.out = np.empty((self.size[1], self.size[0], 3), np.uint8)
+            out = self.out
+        if alpha_frame is not None:
+            self.alpha.composite(fg_frame, alpha_frame, bg_frame, out=out)
+        elif fg_frame is not None:
+            self.keyer.key(fg_frame, bg_frame, out=out)
+        else:
+            self.fill(out, bg_frame)
+        if show_text and self.draw_text is not None:
+            self.draw_text(out)
+        return out
+
+# Build the composited, trimmed timeline (without audio) for a batch of foregrounds
+def build_timeline(foreground_paths, background_path, text, text_color, text_size, text_pos, fg_width, fg_height, bg_width, bg_height, green_lower, green_upper, dilation, transition, resize_quality="Best", key_backend="auto", roi_keying=False, key_model="Range", key_tolerance=3.0):
+    from moviepy.editor import VideoClip, concatenate_videoclips
+    total_files = len(foreground_paths)
+
+    target_width, target_height = requested_size(fg_width, fg_height, bg_width, bg_height)
+
+    if not target_width or not target_height:
+        report_status("Checking foreground for size")
+        first_fg = probe_video(foreground_paths[0])
+        target_width, target_height = first_fg["w"], first_fg["h"]
+        report_detail(f"Set target size from foreground: {target_width}x{target_height}")
+
+    report_status("Loading background")
+    background = open_video(background_path, (target_width, target_height), resize_quality)
+    if background is None:
+        raise ValueError(f"Failed to load background: {background_path}")
+    report_detail(f"Background loaded: {background.w}x{background.h}, duration={background.duration}")
 
-        if not target_width or not target_height:
-            app.update_status("Checking foreground for size", "#d4a017")
-            first_fg = VideoFileClip(foreground_paths[0])
-            if first_fg is None:
-                raise ValueError(f"Failed to load first foreground: {foreground_paths[0]}")
-            target_width, target_height = first_fg.w, first_fg.h
-            first_fg.close()
-            print(f"Set target size from foreground: {target_width}x{target_height}")
-
-        if (background.w, background.h) != (target_width, target_height):
-            app.update_status("Resizing background", "#d4a017")
-            background = custom_resize(background, target_width, target_height)
-            if background is None:
-                raise ValueError("Background resize failed")
-        print(f"Background ready: {background.w}x{background.h}, duration={background.duration}")
-
-        clips = []
-        for i, fg_path in enumerate(foreground_paths):
-            app.update_status(f"Processing foreground {i+1}/{total_files}", "#d4a017")
-            print(f"Processing file {i+1}/{total_files}: {fg_path}")
-            foreground = VideoFileClip(fg_path)
-            if foreground is None:
-                raise ValueError(f"Failed to load foreground: {fg_path}")
-            print(f"Foreground size (original): {foreground.w}x{foreground.h}, duration={foreground.duration}")
-
-            duration = min(foreground.duration, background.duration)
-            print(f"Calculated duration: {duration}")
-
-            fg_sub = foreground
-            bg_sub = background
-            print(f"Using foreground: {fg_sub.w}x{fg_sub.h}, duration={fg_sub.duration}")
-            print(f"Using background: {bg_sub.w}x{bg_sub.h}, duration={bg_sub.duration}")
-
-            if (fg_sub.w, fg_sub.h) != (target_width, target_height):
-                app.update_status(f"Resizing foreground {i+1}", "#d4a017")
-                fg_sub = custom_resize(fg_sub, target_width, target_height)
-                if fg_sub is None:
-                    raise ValueError(f"Foreground resize failed for {fg_path}")
-
-            app.update_status(f"Keying green screen {i+1}", "#d4a017")
-            print("Applying green screen keying...")
-            green_lower_array = np.array([int(green_lower[0]), int(green_lower[1]), int(green_lower[2])])
-            green_upper_array = np.array([int(green_upper[0]), int(green_upper[1]), int(green_upper[2])])
-            foreground_keyed = fg_sub.fl(lambda gf, t: manual_key_green(gf(t), bg_sub.get_frame(t % bg_sub.duration), green_lower_array, green_upper_array, dilation))
-
-            layers = [bg_sub, foreground_keyed]
-            if text.strip():
-                app.update_status(f"Adding text to {i+1}", "#d4a017")
-                print("Adding text overlay...")
-                pos_map = {
-                    "Top Left": ("left", 50),
-                    "Top Center": ("center", 50),
-                    "Top Right": ("right", 50),
-                    "Center": ("center", "center"),
-                    "Bottom Left": ("left", target_height - 50),
-                    "Bottom Center": ("center", target_height - 50),
-                    "Bottom Right": ("right", target_height - 50)
-                }
-                hud = TextClip(text, fontsize=text_size, color=text_color, font="Arial").set_position(pos_map[text_pos]).set_duration(duration)
-                layers.append(hud)
-
-            app.update_status(f"Compositing {i+1}", "#d4a017")
-            print("Compositing layers...")
-            clip = CompositeVideoClip(layers, size=(target_width, target_height))
-            if clip is None:
-                raise ValueError(f"CompositeVideoClip failed for {fg_path}")
-            clips.append(clip)
-
-            app.progress["value"] = ((i + 1) / total_files) * 100
-            app.root.update_idletasks()
-
-        app.update_status("Combining clips", "#d4a017")
-        print("Combining clips...")
-        if len(clips) > 1 and transition:
-            final_video = concatenate_videoclips(clips, method="compose", transition=vfx.fadeout(0.5).set_duration(0.5))
+    if (background.w, background.h) != (target_width, target_height):
+        report_status("Resizing background")
+        background = custom_resize(background, target_width, target_height, resize_quality)
+        if background is None:
+            raise ValueError("Background resize failed")
+    background = cache_background(background, background_path, background.fps, resize_quality)
+    report_detail(f"Background ready: {background.w}x{background.h}, duration={background.duration}")
+
+    clips = []
+    for i, fg_path in enumerate(foreground_paths):
+        report_status(f"Processing foreground {i+1}/{total_files}")
+        foreground = open_video(fg_path, (target_width, target_height), resize_quality)
+        if foreground is None:
+            raise ValueError(f"Failed to load foreground: {fg_path}")
+        report_detail(f"Foreground {i+1}: {fg_path}, {foreground.w}x{foreground.h}, duration={foreground.duration}")
+
+        duration = min(foreground.duration, background.duration)
+        fg_sub = foreground
+        bg_sub = background
+
+        if (fg_sub.w, fg_sub.h) != (target_width, target_height):
+            report_status(f"Resizing foreground {i+1}")
+            fg_sub = custom_resize(fg_sub, target_width, target_height, resize_quality, buffers=1)
+            if fg_sub is None:
+                raise ValueError(f"Foreground resize failed for {fg_path}")
+
+        alpha = None
+        clip_model = None
+        alpha_path = find_alpha_sidecar(fg_path)
+        if alpha_path:
+            report_status(f"Compositing alpha {i+1}")
+            report_detail(f"Using alpha sidecar {alpha_path} instead of keying")
+            alpha = open_video(alpha_path, (target_width, target_height), resize_quality)
+            if (alpha.w, alpha.h) != (target_width, target_height):
+                alpha = custom_resize(alpha, target_width, target_height, resize_quality, buffers=1)
         else:
-            final_video = clips[0] if len(clips) == 1 else concatenate_videoclips(clips, method="compose")
-        if final_video is None:
-            raise ValueError("Clip combination failed")
-
-        final_duration = min([VideoFileClip(fg).duration for fg in foreground_paths])
-        app.update_status("Trimming duration", "#d4a017")
-        final_video = final_video.set_duration(final_duration)
-        print(f"Final video duration trimmed to: {final_video.duration}")
-        if final_video is None:
-            raise ValueError("Set duration failed")
-
-        if audio_source == "Foreground":
-            app.update_status("Adding foreground audio", "#d4a017")
-            print("Setting foreground audio...")
-            audio_clip = VideoFileClip(foreground_paths[0])
-            if audio_clip.audio is None:
-                print("No audio in foreground—skipping audio.")
-            else:
-                audio = audio_clip.audio.set_duration(final_video.duration)
-                if audio is not None:
-                    final_video = final_video.set_audio(audio)
+            report_status(f"Keying green screen {i+1}")
+            if key_model == "Auto":
+                clip_model = calibrate_key(fg_path, key_tolerance)
+        if text.strip():
+            report_status(f"Adding text to {i+1}")
+
+        report_status(f"Compositing {i+1}")
+        # Every clip gets its own compositor (and output buffer), so a transition can fetch two clips' frames at once
+        compositor = FrameCompositor(target_width, target_height, green_lower, green_upper, dilation, key_backend, roi_keying,
+                                     text, text_color, text_size, text_pos, clip_model)
+
+        def make_frame(t, fg_sub=fg_sub, bg_sub=bg_sub, alpha=alpha, compositor=compositor, duration=duration):
+            bg_frame = bg_sub.get_frame(t % bg_sub.duration)
+            if t >= fg_sub.duration:
+                return compositor.compose(None, None, bg_frame, t < duration)
+            return compositor.compose(fg_sub.get_frame(t), alpha.get_frame(t) if alpha is not None else None, bg_frame, t < duration)
+
+        clip = VideoClip(make_frame, duration=max(fg_sub.duration, bg_sub.duration))
+        clips.append(clip)
+
+        report_progress(((i + 1) / total_files) * 100)
+
+    report_status("Combining clips")
+    # Clips are all the target size, so chaining them needs no compositing. Transitions are
+    # rendered by the segment renderers (render_streamed) instead.
+    final_video = clips[0] if len(clips) == 1 else concatenate_videoclips(clips, method="chain")
+    if final_video is None:
+        raise ValueError("Clip combination failed")
+
+    final_duration = min(probe_video(fg)["duration"] for fg in foreground_paths)
+    report_status("Trimming duration")
+    final_video = final_video.set_duration(final_duration)
+    report_detail(f"Final video duration trimmed to: {final_video.duration}")
+    if final_video is None:
+        raise ValueError("Set duration failed")
+
+    return final_video, final_duration, target_width, target_height
+
+# Number of frames write_videofile produces for a clip of this duration
+def count_frames(duration, fps):
+    return len(np.arange(0, duration, 1.0 / fps))
+
+# Length of the cross-fade between clips when transitions are on
+TRANSITION_SECONDS = 0.5
+
+# Clip layout for the frame-level renderers, matching build_timeline: clip i lasts
+# max(fg, bg) seconds with the HUD shown for min(fg, bg), clips play back to back (with
+# transitions, each clip starts TRANSITION_SECONDS before the previous one ends and the two
+# cross-fade), and the whole timeline is trimmed to the shortest foreground. With the "Auto" key
+# model every keyed clip carries its calibrated model.
+def plan_timeline(foreground_paths, background_path, text, text_color, text_size, text_pos, fg_width, fg_height, bg_width, bg_height, green_lower, green_upper, dilation, transition, resize_quality="Best", key_backend="auto", roi_keying=False, key_model="Range", key_tolerance=3.0):
+    target_width, target_height = requested_size(fg_width, fg_height, bg_width, bg_height)
+    bg_duration = probe_video(background_path)["duration"]
+
+    clips = []
+    start = 0
+    for fg_path in foreground_paths:
+        foreground = probe_video(fg_path)
+        if not target_width or not target_height:
+            target_width, target_height = foreground["w"], foreground["h"]
+        duration = max(foreground["duration"], bg_duration)
+        alpha_path = find_alpha_sidecar(fg_path)
+        clips.append({"path": fg_path, "start": start, "duration": duration, "fg_duration": foreground["duration"],
+                      "hud_duration": min(foreground["duration"], bg_duration), "alpha_path": alpha_path,
+                      "key_model": calibrate_key(fg_path, key_tolerance) if key_model == "Auto" and not alpha_path else None})
+        start += duration
+    overlap = 0
+    if transition and len(clips) > 1:
+        overlap = min([TRANSITION_SECONDS] + [clip["duration"] for clip in clips])
+        for i, clip in enumerate(clips):
+            clip["start"] -= i * overlap
+
+    return {
+        "foreground_paths": foreground_paths,
+        "background_path": background_path,
+        "bg_duration": bg_duration,
+        "size": (target_width, target_height),
+        "clips": clips,
+        "transition": overlap,
+        "final_duration": min(clip["fg_duration"] for clip in clips),
+        "text": text, "text_color": text_color, "text_size": text_size, "text_pos": text_pos,
+        "green_lower": [int(c) for c in green_lower], "green_upper": [int(c) for c in green_upper], "dilation": dilation,
+        "resize_quality": resize_quality,
+        "key_backend": key_backend,
+        "roi_keying": bool(roi_keying),
+        "bg_cache": (BACKGROUND_CACHE.max_bytes // (1024 * 1024), BACKGROUND_CACHE.spill_bytes // (1024 * 1024)) if BACKGROUND_CACHE else (0, 0),
+        "memory_budget_mb": MEMORY_BUDGET.max_mb if MEMORY_BUDGET else 0,
+    }
+
+# (frame number, clip index, time within the clip) for output frames [start_frame, end_frame)
+def frame_schedule(plan, fps, start_frame, end_frame):
+    clips = plan["clips"]
+    i = 0
+    for n in range(start_frame, end_frame):
+        t = n / fps
+        while i + 1 < len(clips) and clips[i + 1]["start"] <= t:
+            i += 1
+        yield n, i, t - clips[i]["start"]
+
+def pipeline_put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def pipeline_get(q, stop):
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return None
+
+# Pipelined renderer for output frames [start_frame, end_frame) of a plan. Foreground decode,
+# background decode, key/composite and encode run concurrently, connected by queues holding at
+# most `depth` frames, so a stalled stage blocks the ones feeding it and memory stays bounded.
+# Writes video only; audio is muxed afterwards.
+def render_pipelined(plan, output_path, fps, encoding, depth, start_frame=0, end_frame=None, report=True):
+    width, height = plan["size"]
+    clips = plan["clips"]
+    if end_frame is None:
+        end_frame = count_frames(plan["final_duration"], fps)
+    total = end_frame - start_frame
+    depth = max(1, int(depth))
+    fg_queue = queue.Queue(maxsize=depth)
+    bg_queue = queue.Queue(maxsize=depth)
+    out_queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    quality = plan["resize_quality"]
+    budget = MEMORY_BUDGET
+    # Foreground frames wait in fg_queue, so the resizer ring covers the queue plus the frame
+    # being keyed and the one being decoded
+    fg_resizer = FrameResizer(width, height, quality, buffers=depth + 2)
+    alpha_resizer = FrameResizer(width, height, quality, buffers=depth + 2)
+    # Under a memory budget background frames get a ring too, unless they go into the cache
+    bg_resizer = FrameResizer(width, height, quality, buffers=depth + 2) if budget is not None and BACKGROUND_CACHE is None else None
+
+    def open_source(path):
+        if budget is None:
+            return open_video(path, (width, height), quality)
+        size = (width, height) if quality == "Decoder" else None
+        info = probe_video(path)
+        # Frames used at their decoded size wait in a queue like resized ones (one more for the
+        # decoder's own last frame); frames that get resized only need to outlive the resize
+        queued = size is not None or (info["w"], info["h"]) == (width, height)
+        decoder = VideoDecoder(path, size, depth + 3 if queued else 2, budget.DECODE_THREADS)
+        decoder.get_frame = profiled("decode", decoder.get_frame)
+        return decoder
+
+    def fit(frame, resizer=None):
+        if frame.shape[1] != width or frame.shape[0] != height:
+            return resizer.resize(frame) if resizer else resize_frame(frame, width, height, quality)
+        return frame
+
+    def run_stage(body, out_q):
+        try:
+            body()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            pipeline_put(out_q, None, stop)
+
+    def decode_foregrounds():
+        index, foreground, alpha = None, None, None
+        try:
+            for n, i, t in frame_schedule(plan, fps, start_frame, end_frame):
+                frame, alpha_frame = None, None
+                if t < clips[i]["fg_duration"]:
+                    if i != index:
+                        for clip in (foreground, alpha):
+                            if clip is not None:
+                                clip.close()
+                        index, foreground = i, open_source(clips[i]["path"])
+                        alpha = open_source(clips[i]["alpha_path"]) if clips[i].get("alpha_path") else None
+                    frame = fit(foreground.get_frame(t), fg_resizer)
+                    if alpha is not None:
+                        alpha_frame = fit(alpha.get_frame(t), alpha_resizer)
+                if not pipeline_put(fg_queue, (i, t, frame, alpha_frame), stop):
+                    return
+        finally:
+            for clip in (foreground, alpha):
+                if clip is not None:
+                    clip.close()
+
+    def decode_background():
+        background = open_source(plan["background_path"])
+        cache = BACKGROUND_CACHE
+        key_base = (plan["background_path"], (width, height), quality)
+        # Decoder ring frames get overwritten, so the cache keeps copies
+        own = np.array if budget is not None else (lambda frame: frame)
+        try:
+            for n, i, t in frame_schedule(plan, fps, start_frame, end_frame):
+                t = t % background.duration
+                if cache is not None:
+                    frame = cache.get(key_base + (source_frame_index(background.fps, t),), lambda: own(fit(background.get_frame(t))))
                 else:
-                    print("Audio setting failed—proceeding without audio.")
-            audio_clip.close()
-        elif audio_source == "Background":
-            app.update_status("Adding background audio", "#d4a017")
-            print("Setting background audio...")
-            audio_clip = VideoFileClip(background_path)
-            if audio_clip.audio is None:
-                print("No audio in background—skipping audio.")
+                    frame = fit(background.get_frame(t), bg_resizer)
+                if not pipeline_put(bg_queue, frame, stop):
+                    return
+        finally:
+            background.close()
+
+    def make_compositor(key_model):
+        return FrameCompositor(width, height, plan["green_lower"], plan["green_upper"], plan["dilation"], plan["key_backend"],
+                               plan["roi_keying"], plan["text"], plan["text_color"], plan["text_size"], plan["text_pos"], key_model)
+
+    def composite():
+        key_model = None
+        compositor = make_compositor(key_model)
+        # One buffer per queued frame plus the one being encoded and the one being keyed
+        ring = frame_ring(depth + 2, (height, width, 3))
+        rings.append(ring)
+        for k in range(total):
+            fg_item = pipeline_get(fg_queue, stop)
+            bg_frame = pipeline_get(bg_queue, stop)
+            if fg_item is None or bg_frame is None:
+                return
+            i, t, fg_frame, alpha_frame = fg_item
+            if clips[i].get("key_model") != key_model:
+                key_model = clips[i].get("key_model")
+                compositor = make_compositor(key_model)
+            out = compositor.compose(fg_frame, alpha_frame, bg_frame, t < clips[i]["hud_duration"], out=ring[k % len(ring)])
+            if not pipeline_put(out_queue, out, stop):
+                return
+
+    rings = []
+    stages = [threading.Thread(target=run_stage, args=(decode_foregrounds, fg_queue), daemon=True),
+              threading.Thread(target=run_stage, args=(decode_background, bg_queue), daemon=True),
+              threading.Thread(target=run_stage, args=(composite, out_queue), daemon=True)]
+    for stage in stages:
+        stage.start()
+    written = 0
+    progress = ProgressThrottle(total) if report else None
+    profiler = PROFILER
+    last = None
+    try:
+        with VideoEncoder(output_path, (width, height), fps, encoding) as encoder:
+            write = profiled("write", encoder.write)
+            while True:
+                frame = pipeline_get(out_queue, stop)
+                if frame is None:
+                    break
+                if profiler is not None:
+                    for name, q in (("foreground", fg_queue), ("background", bg_queue), ("output", out_queue)):
+                        profiler.sample_queue(name, q.qsize())
+                    now = time.perf_counter()
+                    if last is not None:
+                        profiler.add("frame", now - last)
+                    last = now
+                write(frame)
+                written += 1
+                if progress is not None:
+                    progress.update(written)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+        for resizer in (fg_resizer, alpha_resizer, bg_resizer):
+            if resizer is not None:
+                resizer.release()
+        for ring in rings:
+            release_frames(ring)
+    if errors:
+        raise errors[0]
+    if written != total:
+        raise RuntimeError(f"Pipeline wrote {written} of {total} frames")
+    print(f"Pipelined render wrote {written} frames to {output_path}")
+
+# Path of the file the selected audio source is taken from, or None for no audio
+def audio_source_path(audio_source, foreground_paths, background_path, custom_audio_path):
+    if audio_source == "Foreground":
+        return foreground_paths[0]
+    elif audio_source == "Background":
+        return background_path
+    elif audio_source == "Custom" and custom_audio_path:
+        return custom_audio_path
+    return None
+
+# Run ffmpeg (the binary moviepy uses) and raise with its stderr on failure
+def run_ffmpeg(args):
+    from moviepy.config import get_setting
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error"] + args
+    print(f"Running: {' '.join(cmd)}")
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()[-300:]}")
+
+# Video encoding. Frames go to a persistent ffmpeg process as raw RGB over its stdin; the output
+# arguments come from encoder_args. MP4 and MOV use x264 or x265 with a preset, optional tune,
+# CRF quality, thread count and keyframe interval (GOP); AVI uses mpeg4. Draft mode trades
+# quality for speed for quick looks at a render.
+ENCODERS = {"x264": "libx264", "x265": "libx265"}
+ENCODER_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+ENCODER_TUNES = {
+    "x264": ["none", "film", "animation", "grain", "stillimage", "fastdecode", "zerolatency"],
+    "x265": ["none", "animation", "grain", "fastdecode", "zerolatency"]
+}
+DRAFT_PRESET = "ultrafast"
+DRAFT_CRF = 30
+
+# ffmpeg output arguments for the encoder settings
+def encoder_args(format="MP4", encoder="x264", preset="medium", tune="none", crf=23, threads=0, gop=0, draft=False):
+    if format == "AVI":
+        args = ["-vcodec", "mpeg4"]
+    else:
+        if encoder not in ENCODERS:
+            print(f"Unknown encoder {encoder}—using x264")
+            encoder = "x264"
+        crf = int(crf)
+        if draft:
+            preset, crf = DRAFT_PRESET, max(crf, DRAFT_CRF)
+        args = ["-vcodec", ENCODERS[encoder], "-preset", preset, "-crf", str(crf)]
+        if tune and tune != "none":
+            if tune in ENCODER_TUNES[encoder]:
+                args += ["-tune", tune]
             else:
-                audio = audio_clip.audio.set_duration(final_video.duration)
-                if audio is not None:
-                    final_video = final_video.set_audio(audio)
-                else:
-                    print("Audio setting failed—proceeding without audio.")
-            audio_clip.close()
-        elif audio_source == "Custom" and custom_audio_path:
-            app.update_status("Adding custom audio", "#d4a017")
-            print("Setting custom audio...")
-            custom_audio = AudioFileClip(custom_audio_path)
-            if custom_audio is None:
-                print("Failed to load custom audio—skipping.")
+                print(f"{encoder} has no tune {tune}—ignoring it")
+        if encoder == "x265":
+            # hvc1 so QuickTime plays it; x265 logs every run to stderr otherwise
+            args += ["-tag:v", "hvc1", "-x265-params", "log-level=error"]
+    if threads and int(threads) > 0:
+        args += ["-threads", str(int(threads))]
+    if gop and int(gop) > 0:
+        args += ["-g", str(int(gop))]
+    return args
+
+# A running ffmpeg encode of raw RGB frames. Use as a context manager; close() raises with
+# ffmpeg's error output if the encode failed.
+class VideoEncoder:
+    def __init__(self, path, size, fps, args):
+        from moviepy.config import get_setting
+        width, height = size
+        cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "rawvideo", "-vcodec", "rawvideo",
+               "-s", f"{width}x{height}", "-pix_fmt", "rgb24", "-r", str(fps), "-an", "-i", "-"] + args
+        # 4:2:0 needs even dimensions; ffmpeg picks a format itself otherwise
+        if width % 2 == 0 and height % 2 == 0:
+            cmd += ["-pix_fmt", "yuv420p"]
+        cmd.append(path)
+        print(f"Running: {' '.join(cmd)}")
+        self.path = path
+        self.frame_bytes = width * height * 3
+        self.frames = 0
+        # stderr goes to a file so a chatty encoder can never fill the pipe and stall us
+        self.log = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.log)
+
+    def error(self):
+        self.log.seek(0)
+        return self.log.read().decode(errors="replace").strip()[-300:]
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame, np.uint8)
+        if frame.nbytes != self.frame_bytes:
+            raise ValueError(f"Frame of shape {frame.shape} does not match the encoder size")
+        try:
+            self.proc.stdin.write(memoryview(frame).cast("B"))
+        except (BrokenPipeError, OSError):
+            self.proc.wait()
+            raise RuntimeError(f"ffmpeg failed writing {self.path}: {self.error()}")
+        self.frames += 1
+
+    def close(self):
+        if self.proc.stdin.closed:
+            return
+        try:
+            self.proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        code = self.proc.wait()
+        error = self.error()
+        self.log.close()
+        if code != 0:
+            raise RuntimeError(f"ffmpeg failed writing {self.path}: {error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Already failing: stop ffmpeg without masking the original error
+            self.proc.kill()
+            self.proc.wait()
+            self.log.close()
+        return False
+
+# Encode every frame of a moviepy clip (video only)
+def encode_clip(clip, path, fps, args):
+    with VideoEncoder(path, clip.size, fps, args) as encoder:
+        for frame in clip.iter_frames(fps=fps, dtype="uint8"):
+            encoder.write(frame)
+    return encoder.frames
+
+# Raw-pipe ffmpeg decode of a video, the reading counterpart of VideoEncoder, used by the
+# pipelined renderer under a memory budget. Frames are read into a ring of `buffers` frames
+# from the frame pool instead of a new array each (a returned frame stays valid for
+# buffers - 1 further reads), and ffmpeg decodes with at most `threads` threads (0: ffmpeg's
+# default), which bounds how many frames it holds decoded ahead. get_frame(t) seeks and picks
+# frames exactly like moviepy's reader, so the frames are the same as VideoFileClip's.
+class VideoDecoder:
+    def __init__(self, path, size=None, buffers=2, threads=0):
+        info = probe_video(path)
+        self.path = path
+        self.fps = info["fps"]
+        self.duration = info["duration"]
+        self.size = tuple(size) if size else (info["w"], info["h"])
+        self.threads = threads
+        self.ring = frame_ring(max(2, buffers), (self.size[1], self.size[0], 3))
+        self.next = 0
+        self.proc = None
+        self.pos = 0
+        self.last = None
+
+    def start(self, t):
+        from moviepy.config import get_setting
+        self.stop()
+        cmd = [get_setting("FFMPEG_BINARY")]
+        if self.threads:
+            cmd += ["-threads", str(int(self.threads))]
+        if t != 0:
+            offset = min(1, t)
+            cmd += ["-ss", "%.06f" % (t - offset), "-i", self.path, "-ss", "%.06f" % offset]
+        else:
+            cmd += ["-i", self.path]
+        cmd += ["-loglevel", "error", "-f", "image2pipe", "-vf", "scale=%d:%d" % self.size, "-sws_flags", "bicubic",
+                "-pix_fmt", "rgb24", "-vcodec", "rawvideo", "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+
+    def read_into(self, frame):
+        return self.proc.stdout.readinto(memoryview(frame).cast("B")) == frame.nbytes
+
+    def get_frame(self, t):
+        pos = int(self.fps * t + 0.00001) + 1
+        if self.last is not None and pos == self.pos:
+            return self.last
+        if self.proc is None or pos < self.pos or pos > self.pos + 100:
+            self.start(t)
+        else:
+            # Skipped frames land in the slot the next frame is read into
+            for _ in range(pos - self.pos - 1):
+                self.read_into(self.ring[self.next])
+        frame = self.ring[self.next]
+        if self.read_into(frame):
+            self.next = (self.next + 1) % len(self.ring)
+            self.last = frame
+        elif self.last is None:
+            raise IOError(f"Failed to read the first frame of {self.path}")
+        else:
+            print(f"Warning: short read in {self.path} at {t:.2f}s—using the last valid frame")
+        self.pos = pos
+        return self.last
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+
+    def close(self):
+        self.stop()
+        release_frames(self.ring)
+        self.ring = []
+
+# Frame ranges [start, end) that split a render of total_frames across workers
+def split_frame_ranges(total_frames, workers):
+    workers = max(1, min(workers, total_frames))
+    step, extra = divmod(total_frames, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + step + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+# Add the audio track of audio_path (if any) to a video-only render
+def mux_audio(video_path, audio_path, duration, output_path):
+    if audio_path:
+        run_ffmpeg(["-i", video_path, "-i", audio_path, "-map", "0:v", "-map", "1:a?", "-c:v", "copy",
+                    "-c:a", "libmp3lame", "-t", str(duration), output_path])
+    else:
+        os.replace(video_path, output_path)
+
+# Encode output frames [start_frame, end_frame) of a plan where clip i - 1 cross-fades into
+# clip i. Both clips are composited as usual (each over the background at its own time) and
+# blended, the weight of clip i growing from 0 over the transition. Fades are a fraction of a
+# second, so this renders frame by frame without a pipeline.
+def render_fade(plan, i, start_frame, end_frame, fps, encoding, output_path):
+    import cv2
+    width, height = plan["size"]
+    quality = plan["resize_quality"]
+    blend = profiled("fade", cv2.addWeighted)
+
+    def fit(frame):
+        if frame.shape[1] != width or frame.shape[0] != height:
+            return resize_frame(frame, width, height, quality)
+        return frame
+
+    sides, opened = [], []
+    try:
+        for clip in plan["clips"][i - 1:i + 1]:
+            foreground = open_video(clip["path"], (width, height), quality)
+            opened.append(foreground)
+            alpha = open_video(clip["alpha_path"], (width, height), quality) if clip.get("alpha_path") else None
+            if alpha is not None:
+                opened.append(alpha)
+            # One background reader per side: the two sides read it at different times
+            background = open_video(plan["background_path"], (width, height), quality)
+            opened.append(background)
+            compositor = FrameCompositor(width, height, plan["green_lower"], plan["green_upper"], plan["dilation"], plan["key_backend"],
+                                         plan["roi_keying"], plan["text"], plan["text_color"], plan["text_size"], plan["text_pos"], clip.get("key_model"))
+            sides.append((clip, foreground, alpha, background, compositor))
+        out = np.empty((height, width, 3), np.uint8)
+        with VideoEncoder(output_path, (width, height), fps, encoding) as encoder:
+            for n in range(start_frame, end_frame):
+                frames = []
+                for clip, foreground, alpha, background, compositor in sides:
+                    t = n / fps - clip["start"]
+                    bg_frame = fit(background.get_frame(t % background.duration))
+                    fg_frame = alpha_frame = None
+                    if t < clip["fg_duration"]:
+                        fg_frame = fit(foreground.get_frame(t))
+                        if alpha is not None:
+                            alpha_frame = fit(alpha.get_frame(t))
+                    frames.append(compositor.compose(fg_frame, alpha_frame, bg_frame, t < clip["hud_duration"]))
+                weight = min(1.0, (n / fps - sides[1][0]["start"]) / plan["transition"])
+                blend(frames[0], 1 - weight, frames[1], weight, 0, dst=out)
+                encoder.write(out)
+    finally:
+        for video in opened:
+            video.close()
+    print(f"Rendered fade into clip {i + 1}: frames {start_frame}-{end_frame - 1}")
+
+# Worker process entry point: encode one frame range without audio (a cross-fade into clip
+# `fade` when set). Returns the segment path and the worker's profile.
+def render_segment(timeline_args, plan, start_frame, end_frame, fps, encoding, depth, segment_path, fade=None):
+    configure_background_cache(*plan["bg_cache"])
+    configure_memory_budget(plan.get("memory_budget_mb", 0))
+    profiler = start_profiler()
+    if fade is not None:
+        render_fade(plan, fade, start_frame, end_frame, fps, encoding, segment_path)
+    elif depth > 0:
+        render_pipelined(plan, segment_path, fps, encoding, depth, start_frame, end_frame)
+    else:
+        final_video, _, _, _ = build_timeline(*timeline_args)
+        # End half a frame early so iter_frames yields exactly end_frame - start_frame frames
+        segment, flush = profile_frames(final_video.subclip(start_frame / fps, (end_frame - 0.5) / fps), profiler)
+        encode_clip(segment, segment_path, fps, encoding)
+        flush()
+        final_video.close()
+    stop_profiler(end_frame - start_frame)
+    return segment_path, profiler.to_dict()
+
+# Render (start_frame, end_frame, path, fade) jobs (fade: index of the clip faded into, or None):
+# on the render farm when one is configured, in worker processes when workers > 1, else
+# pipelined in this process
+def render_segments(timeline_args, plan, jobs, fps, encoding, depth, workers):
+    if FARM is not None:
+        FARM.render(plan, jobs, fps, encoding, depth)
+        return
+    if workers <= 1:
+        for done, (start, end, path, fade) in enumerate(jobs, 1):
+            if fade is not None:
+                render_fade(plan, fade, start, end, fps, encoding, path)
             else:
-                audio = custom_audio.set_duration(final_video.duration)
-                if audio is not None:
-                    final_video = final_video.set_audio(audio)
-                else:
-                    print("Audio setting failed—proceeding without audio.")
+                render_pipelined(plan, path, fps, encoding, max(1, depth), start, end, report=len(jobs) == 1)
+            report_status(f"Rendered segment {done}/{len(jobs)}")
+            report_progress((done / len(jobs)) * 100)
+        return
+    # spawn so workers never inherit the Tk interpreter or the UI threads
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(render_segment, timeline_args, plan, start, end, fps, encoding, depth, path, fade)
+                   for start, end, path, fade in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            _, profile = future.result()
+            if PROFILER is not None:
+                PROFILER.merge(profile)
+            report_status(f"Rendered segment {done}/{len(jobs)}")
+            report_progress((done / len(jobs)) * 100)
+
+# Join segments encoded with the same settings into one file with the concat demuxer (no re-encode)
+def concat_segments(segment_paths, output_path):
+    list_path = f"{output_path}.segments.txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        profiled("concat", run_ffmpeg)(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_path])
+    finally:
+        os.remove(list_path)
+
+# Render frame ranges in parallel worker processes and stitch them (video only) with the concat demuxer
+def render_parallel(timeline_args, plan, output_path, fps, encoding, depth, workers):
+    total_frames = count_frames(plan["final_duration"], fps)
+    ranges = split_frame_ranges(total_frames, workers)
+    print(f"Parallel render: {total_frames} frames in {len(ranges)} segments")
+    ext = os.path.splitext(output_path)[1]
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp_dir:
+        jobs = [(start, end, os.path.join(tmp_dir, f"segment{i:04d}{ext}"), None) for i, (start, end) in enumerate(ranges)]
+        render_segments(timeline_args, plan, jobs, fps, encoding, depth, workers)
+        report_status("Joining segments")
+        concat_segments([job[2] for job in jobs], output_path)
+
+# Render a plan one clip at a time into disk segments and join them without re-encoding, so a
+# render process only ever has one clip's decoders and buffers open. Cross-fades are encoded
+# as short segments of their own, so only the frames that mix two clips are rendered twice
+# over. With several workers, clips are split into chunks so every worker has one.
+def render_streamed(timeline_args, plan, output_path, fps, encoding, depth, workers):
+    total_frames = count_frames(plan["final_duration"], fps)
+    segments = timeline_segments(plan, fps, total_frames)
+    chunks_per_clip = max(1, workers // len(segments))
+    ext = os.path.splitext(output_path)[1]
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp_dir:
+        jobs = []
+        for k, (i, start, end, fade) in enumerate(segments):
+            if fade:
+                jobs.append((start, end, os.path.join(tmp_dir, f"fade{k:04d}{ext}"), i))
+                continue
+            for j, (chunk_start, chunk_end) in enumerate(split_frame_ranges(end - start, chunks_per_clip)):
+                jobs.append((start + chunk_start, start + chunk_end, os.path.join(tmp_dir, f"clip{k:04d}.{j:04d}{ext}"), None))
+        print(f"Streamed render: {total_frames} frames in {len(jobs)} segment(s)")
+        render_segments(timeline_args, plan, jobs, fps, encoding, depth, workers)
+        if len(jobs) == 1:
+            os.replace(jobs[0][2], output_path)
+        else:
+            report_status("Joining segments")
+            concat_segments([job[2] for job in jobs], output_path)
+
+# Content-addressed cache of rendered per-foreground segments. A segment's key hashes everything
+# its frames depend on (input file contents, size, keying, text and encoder settings, and which
+# part of the clip it covers), so changing a setting only re-renders the clips it affects and
+# cached segments are joined without re-encoding. Files are kept least-recently-used (a hit
+# touches the file) under max_bytes on disk.
+SEGMENT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "segment_cache")
+# Bump when a change to the renderer changes its output
+SEGMENT_CACHE_VERSION = 1
+
+class SegmentCache:
+    def __init__(self, max_bytes, directory=SEGMENT_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = self.misses = 0
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    # Path of a cached segment (marked as just used), or None
+    def get(self, key, ext):
+        path = self.path(key, ext)
+        if os.path.exists(path):
+            os.utime(path)
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
 
-        if final_video is None:
-            raise ValueError("Final video is None before writing")
+    # Where to render a segment before put() moves it into place
+    def temp_path(self, key, ext):
+        return os.path.join(self.directory, f"{key}.{os.getpid()}.tmp{ext}")
+
+    def put(self, key, ext, rendered_path):
+        path = self.path(key, ext)
+        os.replace(rendered_path, path)
+        return path
+
+    # Delete least recently used segments until the cache fits, never the ones in `keep`
+    def evict(self, keep=()):
+        keep = {os.path.abspath(path) for path in keep}
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            # Skip segments and chunk directories still being rendered
+            if ".tmp" in name or not os.path.isfile(path):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            print(f"Segment cache: evicted {removed} segment(s), {total / (1024 * 1024):.0f} MB left")
+
+# Cache key for output frames [start_frame, end_frame) of clip i in a plan (fading in from
+# clip i - 1 when fade is set)
+def segment_key(plan, i, start_frame, end_frame, fps, encoding, fade=False):
+    import hashlib
+    clip = plan["clips"][i]
+    fields = {
+        "version": SEGMENT_CACHE_VERSION,
+        "foreground": file_hash(clip["path"]),
+        "background": file_hash(plan["background_path"]),
+        "size": list(plan["size"]),
+        "resize_quality": plan["resize_quality"],
+        "fps": fps,
+        # Time of the first frame within the clip, and how many frames follow
+        "first": round(start_frame / fps - clip["start"], 6),
+        "frames": end_frame - start_frame,
+        "encoding": encoding,
+    }
+    if clip.get("alpha_path"):
+        fields["alpha"] = file_hash(clip["alpha_path"])
+    else:
+        # ROI keying is left out: it gives the same frames
+        fields.update(green_lower=plan["green_lower"], green_upper=plan["green_upper"], dilation=plan["dilation"],
+                      key_backend=resolve_key_backend(plan["key_backend"]))
+        if clip.get("key_model"):
+            fields["key_model"] = clip["key_model"]
+    if plan["text"].strip():
+        fields.update(text=plan["text"], text_color=plan["text_color"], text_size=int(plan["text_size"]),
+                      text_pos=plan["text_pos"], hud_duration=clip["hud_duration"])
+    if fade:
+        # The same frames of the previous clip, as if it were rendered alone
+        fields.update(transition=plan["transition"], fade_from=segment_key(plan, i - 1, start_frame, end_frame, fps, encoding))
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+# Output frames [0, total_frames) as (clip index, start_frame, end_frame, fade) segments: clip
+# i alone, or (fade) the first frames of clip i while clip i - 1 cross-fades into it
+def timeline_segments(plan, fps, total_frames):
+    segments = []
+    for n, i, t in frame_schedule(plan, fps, 0, total_frames):
+        fade = i > 0 and t < plan["transition"]
+        if segments and segments[-1][0] == i and segments[-1][3] == fade:
+            segments[-1][2] = n + 1
+        else:
+            segments.append([i, n, n + 1, fade])
+    return [tuple(segment) for segment in segments]
+
+# Render a plan one segment per clip (and per cross-fade) through the segment cache: cached
+# segments are reused, the rest are rendered (split across workers) and added, and all are
+# joined without re-encoding
+def render_cached(timeline_args, plan, output_path, fps, encoding, depth, workers, cache):
+    total_frames = count_frames(plan["final_duration"], fps)
+    ext = os.path.splitext(output_path)[1]
+    segments, missing = [], []
+    for i, start, end, fade in timeline_segments(plan, fps, total_frames):
+        key = segment_key(plan, i, start, end, fps, encoding, fade)
+        path = cache.get(key, ext)
+        if path is None:
+            missing.append((key, start, end, i if fade else None))
+            path = cache.path(key, ext)
+        segments.append(path)
+    print(f"Segment cache: {len(segments) - len(missing)} of {len(segments)} segment(s) cached")
+
+    if missing:
+        report_status(f"Rendering {len(missing)} changed segment(s)")
+        with tempfile.TemporaryDirectory(dir=cache.directory) as tmp_dir:
+            # Each missing clip is split into chunks so every worker has one; fades are short and stay whole
+            chunks_per_clip = max(1, workers // len(missing))
+            jobs, parts = [], {}
+            for key, start, end, fade in missing:
+                chunks = [(0, end - start)] if fade is not None else split_frame_ranges(end - start, chunks_per_clip)
+                for j, (chunk_start, chunk_end) in enumerate(chunks):
+                    path = os.path.join(tmp_dir, f"{key}.{j:04d}{ext}")
+                    jobs.append((start + chunk_start, start + chunk_end, path, fade))
+                    parts.setdefault(key, []).append(path)
+            render_segments(timeline_args, plan, jobs, fps, encoding, depth, workers)
+            for key, _, _, _ in missing:
+                rendered = cache.temp_path(key, ext)
+                if len(parts[key]) == 1:
+                    os.replace(parts[key][0], rendered)
+                else:
+                    concat_segments(parts[key], rendered)
+                cache.put(key, ext, rendered)
+
+    report_status("Joining segments")
+    if len(segments) == 1:
+        shutil.copyfile(segments[0], output_path)
+    else:
+        concat_segments(segments, output_path)
+    cache.evict(keep=segments)
+
+# Render farm. Worker nodes (`green.py --farm-worker`) are HTTP servers that render one segment
+# job at a time; a render with farm workers configured hands its segment jobs to them instead of
+# to local processes, then joins and muxes the returned segments as usual. Protocol:
+#   GET  /status          health check: {"rendered": segments rendered so far}
+#   HEAD /files/<name>    200 if the worker has the input file, else 404
+#   PUT  /files/<name>    upload an input file, checked against the SHA-256 in its name
+#   POST /render          JSON {"plan", "start", "end", "fps", "encoding", "depth", "fade", "ext"};
+#                         replies with the encoded segment and its profile in X-Profile
+# Input files are named by content hash in the plan sent to workers, so nodes need no shared
+# storage and upload each file once. A job whose worker drops the connection or times out goes
+# back to the queue for the others; a job that fails FARM_ATTEMPTS times fails the render.
+# There is no authentication: only run workers on a trusted network.
+FARM_PORT = 8765
+FARM_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "farm_store")
+# Seconds a worker may stay silent (uploading, rendering a segment) before it counts as lost
+FARM_TIMEOUT = 600
+FARM_ATTEMPTS = 3
+# Segments per worker, so a lost worker's share is spread over the others
+FARM_CHUNKS_PER_WORKER = 2
+FARM_FILE_NAME = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]{1,8})?$")
+
+# "host:port" (or "host", on FARM_PORT) as (host, port)
+def parse_farm_address(address):
+    host, _, port = address.strip().rpartition(":")
+    if not host:
+        return port, FARM_PORT
+    return host, int(port)
+
+# The plan as sent to workers, with every input file replaced by its store name, and the
+# {store name: local path} files it needs
+def farm_plan(plan):
+    files = {}
+
+    def store_name(path):
+        if not path:
+            return path
+        name = file_hash(path) + os.path.splitext(path)[1].lower()
+        files[name] = path
+        return name
+
+    remote = dict(plan, clips=[dict(clip, path=store_name(clip["path"]), alpha_path=store_name(clip.get("alpha_path")))
+                               for clip in plan["clips"]])
+    remote["foreground_paths"] = [store_name(path) for path in plan["foreground_paths"]]
+    remote["background_path"] = store_name(plan["background_path"])
+    return remote, files
+
+# A farm plan with its store names resolved to files in a worker's store
+def localize_farm_plan(plan, store_dir):
+    def local(name):
+        if not name:
+            return name
+        if not FARM_FILE_NAME.match(name):
+            raise ValueError(f"Invalid file name in plan: {name}")
+        path = os.path.join(store_dir, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Input file not uploaded: {name}")
+        return path
+
+    plan = dict(plan, clips=[dict(clip, path=local(clip["path"]), alpha_path=local(clip.get("alpha_path"))) for clip in plan["clips"]])
+    plan["foreground_paths"] = [local(name) for name in plan["foreground_paths"]]
+    plan["background_path"] = local(plan["background_path"])
+    return plan
+
+# Request handler of a farm worker; the server carries store_dir and the rendered count
+class FarmWorkerHandler(http.server.BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def file_path(self):
+        name = self.path[len("/files/"):]
+        return os.path.join(self.server.store_dir, name) if self.path.startswith("/files/") and FARM_FILE_NAME.match(name) else None
+
+    def do_GET(self):
+        if self.path != "/status":
+            return self.send_json(404, {"error": "Not found"})
+        self.send_json(200, {"rendered": self.server.rendered})
+
+    def do_HEAD(self):
+        path = self.file_path()
+        self.send_response(200 if path and os.path.exists(path) else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        import hashlib
+        path = self.file_path()
+        if path is None:
+            return self.send_json(404, {"error": "Not found"})
+        length = int(self.headers["Content-Length"])
+        digest = hashlib.sha256()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            while length > 0:
+                chunk = self.rfile.read(min(length, 1 << 20))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                length -= len(chunk)
+        if length or digest.hexdigest() != os.path.basename(path)[:64]:
+            os.remove(tmp_path)
+            return self.send_json(400, {"error": "Upload does not match its hash"})
+        os.replace(tmp_path, path)
+        self.send_json(200, {"stored": os.path.basename(path)})
+
+    def do_POST(self):
+        if self.path != "/render":
+            return self.send_json(404, {"error": "Not found"})
+        job = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with tempfile.TemporaryDirectory(dir=self.server.store_dir) as tmp_dir:
+            try:
+                segment_path = os.path.join(tmp_dir, "segment" + os.path.basename(job["ext"]))
+                plan = localize_farm_plan(job["plan"], self.server.store_dir)
+                print(f"Rendering frames {job['start']}-{job['end']}" + (" (fade)" if job["fade"] is not None else ""))
+                _, profile = render_segment(None, plan, job["start"], job["end"], job["fps"], job["encoding"], job["depth"], segment_path, job["fade"])
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                return self.send_json(500, {"error": str(e)})
+            self.server.rendered += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(segment_path)))
+            self.send_header("X-Profile", json.dumps(profile))
+            self.end_headers()
+            with open(segment_path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+
+# Serve segment jobs until interrupted
+def run_farm_worker(host="127.0.0.1", port=FARM_PORT, store_dir=FARM_STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    server = http.server.HTTPServer((host, port), FarmWorkerHandler)
+    server.store_dir = store_dir
+    server.rendered = 0
+    print(f"Farm worker listening on {host}:{port} (store: {store_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# A render job failed on a worker that is still reachable
+class FarmJobError(Exception):
+    pass
+
+# Coordinator side: the reachable workers of a farm, and segment jobs run on them
+class RenderFarm:
+    def __init__(self, addresses):
+        self.workers = []
+        for address in addresses:
+            worker = parse_farm_address(address)
+            try:
+                self.request(worker, "GET", "/status", timeout=5)
+                self.workers.append(worker)
+            except (OSError, http.client.HTTPException, FarmJobError) as e:
+                print(f"Farm worker {address} is not reachable ({str(e)})—skipping it")
+        if not self.workers:
+            raise ValueError("No render farm worker is reachable")
+
+    # One request on a new connection; returns the open response (the caller reads it)
+    def request(self, worker, method, path, body=None, headers=None, timeout=FARM_TIMEOUT, ok=(200,)):
+        connection = http.client.HTTPConnection(*worker, timeout=timeout)
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        if response.status not in ok:
+            message = response.read().decode(errors="replace")
+            connection.close()
+            raise FarmJobError(f"{method} {path}: HTTP {response.status} {message[:200]}")
+        return response
+
+    # Upload the input files the worker doesn't have yet
+    def upload(self, worker, files):
+        for name, path in files.items():
+            if self.request(worker, "HEAD", f"/files/{name}", ok=(200, 404)).status == 200:
+                continue
+            print(f"Uploading {os.path.basename(path)} to {worker[0]}:{worker[1]}")
+            with open(path, "rb") as f:
+                self.request(worker, "PUT", f"/files/{name}", body=f, headers={"Content-Length": str(os.path.getsize(path))}).read()
+
+    # Render one job on a worker into its segment path; returns the worker's profile
+    def render_job(self, worker, plan, job, fps, encoding, depth):
+        start, end, path, fade = job
+        body = json.dumps({"plan": plan, "start": start, "end": end, "fps": fps, "encoding": encoding, "depth": depth,
+                           "fade": fade, "ext": os.path.splitext(path)[1]}).encode()
+        response = self.request(worker, "POST", "/render", body=body, headers={"Content-Type": "application/json"})
+        length = int(response.getheader("Content-Length"))
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(response, f)
+        if os.path.getsize(tmp_path) != length:
+            os.remove(tmp_path)
+            raise ConnectionError(f"Segment {os.path.basename(path)} arrived incomplete")
+        os.replace(tmp_path, path)
+        return json.loads(response.getheader("X-Profile"))
+
+    # Run (start_frame, end_frame, path, fade) jobs on every worker, one job per worker at a time
+    def render(self, plan, jobs, fps, encoding, depth):
+        remote_plan, files = farm_plan(plan)
+        pending = deque((job, 0) for job in jobs)
+        condition = threading.Condition()
+        state = {"running": 0, "done": 0, "error": None}
+
+        def run_worker(worker):
+            name = f"{worker[0]}:{worker[1]}"
+            try:
+                self.upload(worker, files)
+            except (OSError, http.client.HTTPException, FarmJobError) as e:
+                print(f"Farm worker {name} lost while uploading inputs ({str(e)})")
+                return
+            while True:
+                with condition:
+                    while not pending and state["running"] and state["error"] is None:
+                        condition.wait()
+                    if not pending or state["error"] is not None:
+                        return
+                    job, attempts = pending.popleft()
+                    state["running"] += 1
+                lost = False
+                try:
+                    profile = self.render_job(worker, remote_plan, job, fps, encoding, max(1, depth))
+                except FarmJobError as e:
+                    attempts += 1
+                    print(f"Segment {os.path.basename(job[2])} failed on {name} ({str(e)})")
+                    with condition:
+                        if attempts >= FARM_ATTEMPTS:
+                            state["error"] = RuntimeError(f"Segment {os.path.basename(job[2])} failed {attempts} times on the render farm: {str(e)}")
+                        else:
+                            pending.append((job, attempts))
+                except (OSError, http.client.HTTPException) as e:
+                    # The worker is gone (or hung); its job goes to the others
+                    print(f"Farm worker {name} lost ({str(e)}); requeueing {os.path.basename(job[2])}")
+                    lost = True
+                    with condition:
+                        pending.append((job, attempts))
+                else:
+                    if PROFILER is not None:
+                        PROFILER.merge(profile)
+                    with condition:
+                        state["done"] += 1
+                        done = state["done"]
+                    report_status(f"Rendered segment {done}/{len(jobs)} on {name}")
+                    report_progress((done / len(jobs)) * 100)
+                finally:
+                    with condition:
+                        state["running"] -= 1
+                        condition.notify_all()
+                if lost:
+                    return
+
+        print(f"Render farm: {len(jobs)} segment(s) on {len(self.workers)} worker(s)")
+        threads = [threading.Thread(target=run_worker, args=(worker,), daemon=True) for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if state["error"] is not None:
+            raise state["error"]
+        if pending:
+            raise RuntimeError(f"Every render farm worker was lost with {len(pending)} segment(s) left")
+
+# Render farm of the current render, or None to render locally
+FARM = None
+
+def configure_farm(addresses):
+    global FARM
+    FARM = RenderFarm(addresses) if addresses else None
+    return FARM
 
+# Main processing function
+def process_video(foreground_paths, background_path, output_base_path, text, text_color, text_size, text_pos, loop, fg_width, fg_height, bg_width, bg_height, audio_source, custom_audio_path, green_lower, green_upper, dilation, format, fps, transition, workers=1, export_log=False, pipeline_depth=0, bg_cache_mb=512, bg_cache_spill_mb=0, resize_quality="Best", key_backend="auto", roi_keying=False,
+                  encoder="x264", encoder_preset="medium", encoder_tune="none", crf=23, encoder_threads=0, gop=0, draft=False, segment_cache_mb=0, memory_budget_mb=0,
+                  key_model="Range", key_tolerance=3.0, farm_workers=()):
+    profiler = start_profiler()
+    reset_peak_memory()
+    frames = 0
+    budget = None
+    job_events = []
+    log_events = EVENTS.subscribe(job_events.append) if export_log else None
+    try:
+        report_status(f"Starting {os.path.basename(output_base_path)}")
+        report_progress(0)
+        total_files = len(foreground_paths)
+        workers = int(workers) if workers else 1
+        if int(dilation) < MIN_DILATION:
+            print(f"Dilation {dilation} is below {MIN_DILATION}—using {MIN_DILATION}")
+            dilation = MIN_DILATION
+        pipeline_depth = int(pipeline_depth) if pipeline_depth else 0
+        segment_cache_mb = int(segment_cache_mb) if segment_cache_mb else 0
+        memory_budget_mb = int(memory_budget_mb) if memory_budget_mb else 0
+        # Cross-fades are rendered as segments of their own and joined to the clips without re-encoding
+        fades = bool(transition) and len(foreground_paths) > 1
+        if fades and pipeline_depth == 0:
+            # Segments are cut from the plan's timeline, which only the pipelined renderer follows
+            pipeline_depth = 1
+        budget = configure_memory_budget(memory_budget_mb)
+        if budget is not None:
+            target_width, target_height = requested_size(fg_width, fg_height, bg_width, bg_height)
+            if not target_width or not target_height:
+                first_fg = probe_video(foreground_paths[0])
+                target_width, target_height = first_fg["w"], first_fg["h"]
+            workers, pipeline_depth, bg_cache_mb = budget.fit(target_width * target_height * 3, workers, pipeline_depth, bg_cache_mb or 0)
+            print(f"Memory budget {memory_budget_mb} MB: {workers} worker(s), pipeline depth {pipeline_depth}, background cache {bg_cache_mb} MB")
+        configure_background_cache(bg_cache_mb or 0, bg_cache_spill_mb or 0)
+        farm = configure_farm(farm_workers)
+        if farm is not None:
+            # Workers render pipelined segments cut from the plan; `workers` becomes the segment count
+            pipeline_depth = max(1, pipeline_depth)
+            workers = FARM_CHUNKS_PER_WORKER * len(farm.workers)
+            print(f"Render farm: {', '.join(f'{host}:{port}' for host, port in farm.workers)}")
+
+        timeline_args = (foreground_paths, background_path, text, text_color, text_size, text_pos, fg_width, fg_height, bg_width, bg_height, green_lower, green_upper, dilation, transition, resize_quality, key_backend, roi_keying, key_model, float(key_tolerance))
         output_path = output_base_path
-        codec_map = {"MP4": "libx264", "AVI": "mpeg4", "MOV": "libx264"}
-        app.update_status(f"Writing {os.path.basename(output_path)}", "#d4a017")
-        print(f"Writing video: {output_path}")
-        ffmpeg_params = ["-loop", "0"] if loop else []
-        print(f"FFmpeg params: {ffmpeg_params}")
-        final_video.write_videofile(output_path, fps=int(fps), codec=codec_map[format], logger=None, ffmpeg_params=ffmpeg_params)
+        # `loop` is kept for presets that have it; video files have no loop flag to set
+        encoding = encoder_args(format, encoder, encoder_preset, encoder_tune, crf, encoder_threads, gop, draft)
+        print(f"Encoder: {' '.join(encoding)}")
+
+        audio_path = audio_source_path(audio_source, foreground_paths, background_path, custom_audio_path)
+        if audio_source in ("Foreground", "Background") and not probe_video(audio_path)["audio"]:
+            print(f"No audio in {audio_source.lower()}—skipping audio.")
+            audio_path = None
+
+        # Every renderer writes video only; the audio is muxed in afterwards
+        ext = os.path.splitext(output_path)[1]
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp_dir:
+            video_path = os.path.join(tmp_dir, f"video{ext}")
+            if workers > 1 or pipeline_depth > 0 or segment_cache_mb > 0 or fades:
+                plan = plan_timeline(*timeline_args)
+                final_duration = plan["final_duration"]
+                target_width, target_height = plan["size"]
+                frames = count_frames(final_duration, int(fps))
+                if segment_cache_mb > 0:
+                    report_status(f"Rendering {os.path.basename(output_path)} (segment cache)")
+                    print(f"Writing video through the segment cache: {output_path}")
+                    cache = SegmentCache(segment_cache_mb * 1024 * 1024)
+                    render_cached(timeline_args, plan, video_path, int(fps), encoding, pipeline_depth, workers, cache)
+                elif budget is not None or fades:
+                    report_status(f"Rendering {os.path.basename(output_path)}" + (f" within {memory_budget_mb} MB" if budget is not None else " with transitions"))
+                    print(f"Writing video one clip at a time: {output_path}")
+                    render_streamed(timeline_args, plan, video_path, int(fps), encoding, pipeline_depth, workers)
+                elif farm is not None:
+                    report_status(f"Rendering {os.path.basename(output_path)} on {len(farm.workers)} farm worker(s)")
+                    print(f"Writing video on the render farm: {output_path}")
+                    render_parallel(timeline_args, plan, video_path, int(fps), encoding, pipeline_depth, workers)
+                elif workers > 1:
+                    report_status(f"Rendering {os.path.basename(output_path)} on {workers} workers")
+                    print(f"Writing video with {workers} workers: {output_path}")
+                    render_parallel(timeline_args, plan, video_path, int(fps), encoding, pipeline_depth, workers)
+                else:
+                    report_status(f"Writing {os.path.basename(output_path)} (pipelined)")
+                    print(f"Writing video with pipeline depth {pipeline_depth}: {output_path}")
+                    render_pipelined(plan, video_path, int(fps), encoding, pipeline_depth)
+            else:
+                final_video, final_duration, target_width, target_height = build_timeline(*timeline_args)
+                frames = count_frames(final_duration, int(fps))
+                if final_video is None:
+                    raise ValueError("Final video is None before writing")
+
+                report_status(f"Writing {os.path.basename(output_path)}")
+                print(f"Writing video: {output_path}")
+                final_video = track_progress(final_video, int(fps), frames)
+                final_video, flush = profile_frames(final_video, profiler)
+                encode_clip(final_video, video_path, int(fps), encoding)
+                flush()
+            if audio_path:
+                report_status("Adding audio")
+            profiled("mux", mux_audio)(video_path, audio_path, final_duration, output_path)
         print("Video processing complete:", output_path)
-
-        app.last_output = output_path
-        print(f"Set app.last_output to: {app.last_output}")
-        app.add_recent_file(output_path)
-        app.update_status(f"Done: {os.path.basename(output_path)}", "#27ae60")
-        messagebox.showinfo("Success", f"Processed {total_files} video(s)!")
-        if app.export_log.get():
-            with open(os.path.join(os.path.dirname(output_path), "process_log.txt"), "a") as f:
-                f.write(f"{time.ctime()}: Processed {output_path} ({final_duration}s, {target_width}x{target_height})\n")
+        if BACKGROUND_CACHE is not None:
+            print(f"Background cache: {BACKGROUND_CACHE.hits} hits, {BACKGROUND_CACHE.spill_hits} from disk, {BACKGROUND_CACHE.misses} decoded")
+
+        stop_profiler(frames)
+        print(f"Profile: {profiler.summary()}")
+
+        peak, child_peak = memory_usage()[1], child_peak_memory()
+        peak_mb = round(peak / (1024 * 1024)) if peak else None
+        child_peak_mb = round(child_peak / (1024 * 1024)) if child_peak else None
+        if peak_mb is not None:
+            print(f"Peak RSS: {peak_mb} MB (largest child process: {child_peak_mb} MB)")
+            if memory_budget_mb and peak_mb > memory_budget_mb:
+                print(f"Warning: peak RSS {peak_mb} MB exceeded the {memory_budget_mb} MB memory budget")
+        report_status(f"Done: {os.path.basename(output_path)}" + (f" (peak RSS {peak_mb} MB)" if peak_mb is not None else ""), "#27ae60")
+        if export_log:
+            cache = BACKGROUND_CACHE
+            log_path = write_profile_log(profiler, output_path, job_events, foregrounds=foreground_paths, background=background_path,
+                                         duration=final_duration, size=[target_width, target_height], fps=int(fps),
+                                         workers=workers, pipeline_depth=pipeline_depth, resize_quality=resize_quality,
+                                         key_backend=resolve_key_backend(key_backend), roi_keying=bool(roi_keying), key_model=key_model,
+                                         key_tolerance=float(key_tolerance), farm_workers=[f"{host}:{port}" for host, port in farm.workers] if farm else [],
+                                         encoder=encoding,
+                                         memory_budget_mb=memory_budget_mb, peak_rss_mb=peak_mb, peak_child_rss_mb=child_peak_mb,
+                                         bg_cache={"hits": cache.hits, "spill_hits": cache.spill_hits, "misses": cache.misses} if cache else None)
+            print(f"Profile written to {log_path}")
+        EVENTS.post("done", task="render", output=output_path, message=f"Processed {total_files} video(s)!")
+        return output_path
     except Exception as e:
         print(f"Error: {str(e)}")
-        app.update_status(f"Error: {str(e)[:50]}", "#c0392b")
-        messagebox.showerror("Error", f"Processing failed: {str(e)}")
+        report_status(f"Error: {str(e)[:50]}", "#c0392b")
+        EVENTS.post("error", task="render", message=f"Processing failed: {str(e)}")
+        raise
     finally:
-        print(f"Calling enable_button, last_output: {app.last_output}, exists: {os.path.exists(app.last_output) if app.last_output else False}")
-        app.root.after(0, app.enable_button)
-
-# Preview function
-def preview_frame(foreground_path, background_path, fg_width, fg_height, bg_width, bg_height, green_lower, green_upper, dilation):
-    foreground = VideoFileClip(foreground_path)
-    if foreground is None:
-        raise ValueError(f"Failed to load preview foreground: {foreground_path}")
-    background = VideoFileClip(background_path)
-    if background is None:
-        raise ValueError(f"Failed to load preview background: {background_path}")
-
-    duration = min(foreground.duration, background.duration)
-    target_width = int(fg_width) if fg_width else (int(bg_width) if bg_width else foreground.w)
-    target_height = int(fg_height) if fg_height else (int(bg_height) if bg_height else foreground.h)
-
-    if (foreground.w, foreground.h) != (target_width, target_height):
-        foreground = custom_resize(foreground, target_width, target_height)
-    if (background.w, background.h) != (target_width, target_height):
-        background = custom_resize(background, target_width, target_height)
-
-    frame = manual_key_green(foreground.get_frame(1 % foreground.duration), background.get_frame(1 % background.duration), np.array(green_lower), np.array(green_upper), dilation)
-    return Image.fromarray(frame)
-
-# Tooltip class
-class Tooltip:
-    def __init__(self, widget, text):
-        self.widget = widget
-        self.text = text
-        self.tip_window = None
-        self.widget.bind("<Enter>", self.show_tip)
-        self.widget.bind("<Leave>", self.hide_tip)
-
-    def show_tip(self, event):
-        if self.tip_window or not self.text:
-            return
-        x, y = self.widget.winfo_rootx() + 25, self.widget.winfo_rooty() + 25
-        self.tip_window = tw = tk.Toplevel(self.widget)
-        tw.wm_overrideredirect(True)
-        tw.wm_geometry(f"+{x}+{y}")
-        label = ttk.Label(tw, text=self.text, background="#263238", foreground="#ffffff", relief="solid", borderwidth=1, padding=4, font=("Helvetica", 9))
-        label.pack()
-
-    def hide_tip(self, event):
-        if self.tip_window:
-            self.tip_window.destroy()
-            self.tip_window = None
-
-# GUI class
-class VideoProcessorApp:
-    def __init__(self, root):
-        print("Starting VideoProcessorApp.__init__")
-        self.root = root
-        self.root.title("Green Screen Video Editor v1.3")
-        self.root.geometry("700x900")  # Slightly larger for better spacing
-        self.root.configure(bg="#eceff1")  # Softer light gray background
-        self.theme = "Light"
-        self.last_output = None
-
-        # Style configuration with modern flair
-        style = ttk.Style()
-        style.theme_use("clam")
-        style.configure("TButton", font=("Helvetica", 11, "bold"), padding=8, background="#4caf50", 
-                        foreground="#ffffff", borderwidth=0, relief="flat")
-        style.map("TButton", background=[("active", "#388e3c"), ("disabled", "#b0bec5")], 
-                  foreground=[("disabled", "#eceff1")])
-        style.configure("TLabel", font=("Helvetica", 10), background="#eceff1", foreground="#263238")
-        style.configure("TFrame", background="#eceff1")
-        style.configure("TCheckbutton", font=("Helvetica", 10), background="#eceff1", foreground="#263238")
-        style.configure("TScale", background="#eceff1", troughcolor="#cfd8dc", sliderrelief="flat")
-        style.configure("TProgressbar", background="#4caf50", troughcolor="#cfd8dc", thickness=10)
-        style.configure("TNotebook", background="#eceff1", tabposition="nw")
-        style.configure("TNotebook.Tab", font=("Helvetica", 11, "bold"), padding=[12, 6], 
-                        background="#b0bec5", borderwidth=0)
-        style.map("TNotebook.Tab", background=[("selected", "#ffffff"), ("active", "#90a4ae")])
-
-        # Main frame with scrollbar and subtle shadow
-        self.canvas = tk.Canvas(self.root, bg="#eceff1", highlightthickness=0, borderwidth=0)
-        self.scrollbar = ttk.Scrollbar(self.root, orient="vertical", command=self.canvas.yview)
-        self.main_frame = ttk.Frame(self.canvas, style="TFrame", padding=10)
-        self.main_frame.configure(relief="flat", borderwidth=2)
-
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        self.scrollbar.pack(side="right", fill="y", padx=5)
-        self.canvas.pack(side="left", fill="both", expand=True, padx=20, pady=20)
-        self.canvas.create_window((0, 0), window=self.main_frame, anchor="nw")
-        self.main_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-
-        # Variables
-        self.foreground_paths = []
-        self.background_path = tk.StringVar()
-        self.output_path = tk.StringVar(value="C:/Users/Haley/Desktop/green/output.mp4")
-        self.fg_size = tk.StringVar(value="Not selected")
-        self.bg_size = tk.StringVar(value="Not selected")
-        self.status = tk.StringVar(value="Ready")
-        self.status_color = tk.StringVar(value="#263238")
-        self.text_input = tk.StringVar()
-        self.text_color = tk.StringVar(value="white")
-        self.text_size = tk.IntVar(value=24)
-        self.text_pos = tk.StringVar(value="Top Left")
-        self.loop_video = tk.BooleanVar(value=False)
-        self.fg_width = tk.StringVar()
-        self.fg_height = tk.StringVar()
-        self.bg_width = tk.StringVar()
-        self.bg_height = tk.StringVar()
-        self.fg_preset = tk.StringVar(value="Native")
-        self.bg_preset = tk.StringVar(value="Native")
-        self.audio_source = tk.StringVar(value="Foreground")
-        self.custom_audio_path = tk.StringVar()
-        self.green_lower_r = tk.IntVar(value=0)
-        self.green_lower_g = tk.IntVar(value=200)
-        self.green_lower_b = tk.IntVar(value=0)
-        self.green_upper_r = tk.IntVar(value=50)
-        self.green_upper_g = tk.IntVar(value=255)
-        self.green_upper_b = tk.IntVar(value=50)
-        self.dilation = tk.IntVar(value=1)
-        self.format = tk.StringVar(value="MP4")
-        self.fps = tk.StringVar(value="24")
-        self.transition = tk.BooleanVar(value=False)
-        self.export_log = tk.BooleanVar(value=False)
-        self.recent_files = []
-
-        self.size_presets = {
-            "Native": (None, None),
-            "Instagram (1080x1080)": (1080, 1080),
-            "YouTube (1920x1080)": (1920, 1080),
-            "TikTok (1080x1920)": (1080, 1920),
-            "Custom": (None, None)
-        }
-
-        # Header with gradient background
-        header_frame = ttk.Frame(self.main_frame, relief="flat")
-        header_frame.grid(row=0, column=0, sticky="ew", pady=(0, 20))
-        self.header_canvas = tk.Canvas(header_frame, height=50, highlightthickness=0)
-        self.header_canvas.pack(fill="x")
-        self.header_canvas.create_rectangle(0, 0, 700, 50, fill="#4caf50", outline="")
-        self.header_canvas.create_text(20, 25, text="Green Screen Video Editor", font=("Helvetica", 18, "bold"), fill="#ffffff", anchor="w")
-        self.header_canvas.create_text(260, 25, text="v1.3", font=("Helvetica", 8), fill="#ffffff", anchor="w")
-        theme_menu = ttk.OptionMenu(header_frame, tk.StringVar(value="Light"), "Light", "Dark", "Slate", command=self.set_theme)
-        theme_menu.pack(side="right", pady=5, padx=10)
-        Tooltip(theme_menu, "Switch UI theme")
-
-        # Inputs with card-like design
-        input_frame = ttk.LabelFrame(self.main_frame, text="Inputs", padding=15, relief="flat", borderwidth=2)
-        input_frame.grid(row=1, column=0, sticky="ew", pady=10)
-
-        ttk.Label(input_frame, text="Foreground Video(s):", font=("Helvetica", 11, "bold")).grid(row=0, column=0, sticky="w")
-        fg_btn_frame = ttk.Frame(input_frame)
-        fg_btn_frame.grid(row=0, column=1, sticky="e")
-        ttk.Button(fg_btn_frame, text="Add", command=self.add_foreground, style="TButton").pack(side="left", padx=5)
-        ttk.Button(fg_btn_frame, text="Clear", command=self.clear_foregrounds, style="TButton").pack(side="left", padx=5)
-        self.fg_listbox = tk.Listbox(input_frame, height=4, font=("Helvetica", 10), bg="#ffffff", relief="flat", borderwidth=1, selectbackground="#b0bec5")
-        self.fg_listbox.grid(row=1, column=0, columnspan=2, sticky="ew", pady=5)
-        ttk.Label(input_frame, textvariable=self.fg_size, font=("Helvetica", 9, "italic")).grid(row=2, column=0, columnspan=2, sticky="w")
-
-        ttk.Label(input_frame, text="Background Video:", font=("Helvetica", 11, "bold")).grid(row=3, column=0, sticky="w")
-        ttk.Button(input_frame, text="Browse", command=self.select_background, style="TButton").grid(row=3, column=1, sticky="e", padx=5)
-        ttk.Label(input_frame, textvariable=self.background_path, wraplength=400, font=("Helvetica", 9)).grid(row=4, column=0, columnspan=2, sticky="w")
-        ttk.Label(input_frame, textvariable=self.bg_size, font=("Helvetica", 9, "italic")).grid(row=5, column=0, columnspan=2, sticky="w")
-
-        ttk.Label(input_frame, text="Output Path:", font=("Helvetica", 11, "bold")).grid(row=6, column=0, sticky="w")
-        ttk.Button(input_frame, text="Browse", command=self.select_output, style="TButton").grid(row=6, column=1, sticky="e", padx=5)
-        ttk.Label(input_frame, textvariable=self.output_path, wraplength=400, font=("Helvetica", 9)).grid(row=7, column=0, columnspan=2, sticky="w")
-
-        # Tabbed Settings with shadow
-        settings_notebook = ttk.Notebook(self.main_frame)
-        settings_notebook.grid(row=2, column=0, sticky="ew", pady=15)
-        settings_notebook.configure(style="TNotebook")
-
-        # Basic Tab
-        basic_tab = ttk.Frame(settings_notebook, padding=15, relief="flat", borderwidth=2)
-        settings_notebook.add(basic_tab, text="Basic")
-
-        ttk.Label(basic_tab, text="Foreground Size:", font=("Helvetica", 11)).grid(row=0, column=0, sticky="w")
-        self.fg_menu = tk.OptionMenu(basic_tab, self.fg_preset, *self.size_presets.keys(), command=lambda v: self.set_preset_size(v, "fg"))
-        self.fg_menu.grid(row=0, column=1, sticky="ew", padx=5)
-        fg_size_frame = ttk.Frame(basic_tab)
-        fg_size_frame.grid(row=1, column=0, columnspan=2, pady=5)
-        ttk.Entry(fg_size_frame, textvariable=self.fg_width, width=8, justify="center").pack(side="left", padx=2)
-        ttk.Label(fg_size_frame, text="x").pack(side="left")
-        ttk.Entry(fg_size_frame, textvariable=self.fg_height, width=8, justify="center").pack(side="left", padx=2)
-
-        ttk.Label(basic_tab, text="Background Size:", font=("Helvetica", 11)).grid(row=2, column=0, sticky="w")
-        self.bg_menu = tk.OptionMenu(basic_tab, self.bg_preset, *self.size_presets.keys(), command=lambda v: self.set_preset_size(v, "bg"))
-        self.bg_menu.grid(row=2, column=1, sticky="ew", padx=5)
-        bg_size_frame = ttk.Frame(basic_tab)
-        bg_size_frame.grid(row=3, column=0, columnspan=2, pady=5)
-        ttk.Entry(bg_size_frame, textvariable=self.bg_width, width=8, justify="center").pack(side="left", padx=2)
-        ttk.Label(bg_size_frame, text="x").pack(side="left")
-        ttk.Entry(bg_size_frame, textvariable=self.bg_height, width=8, justify="center").pack(side="left", padx=2)
-
-        ttk.Label(basic_tab, text="Overlay Text:", font=("Helvetica", 11)).grid(row=4, column=0, sticky="w")
-        ttk.Entry(basic_tab, textvariable=self.text_input).grid(row=4, column=1, sticky="ew", pady=5, padx=5)
-
-        # Advanced Tab
-        advanced_tab = ttk.Frame(settings_notebook, padding=15, relief="flat", borderwidth=2)
-        settings_notebook.add(advanced_tab, text="Advanced")
-
-        ttk.Label(advanced_tab, text="Text Color:", font=("Helvetica", 11)).grid(row=0, column=0, sticky="w")
-        ttk.OptionMenu(advanced_tab, self.text_color, "white", "black", "red", "blue", "yellow").grid(row=0, column=1, sticky="ew", padx=5)
-        ttk.Label(advanced_tab, text="Text Size:", font=("Helvetica", 11)).grid(row=1, column=0, sticky="w")
-        ttk.Scale(advanced_tab, from_=10, to=100, orient="horizontal", variable=self.text_size).grid(row=1, column=1, sticky="ew", padx=5)
-        ttk.Label(advanced_tab, text="Text Position:", font=("Helvetica", 11)).grid(row=2, column=0, sticky="w")
-        ttk.OptionMenu(advanced_tab, self.text_pos, "Top Left", "Top Center", "Top Right", "Center", "Bottom Left", "Bottom Center", "Bottom Right").grid(row=2, column=1, sticky="ew", padx=5)
-
-        ttk.Label(advanced_tab, text="Audio Source:", font=("Helvetica", 11)).grid(row=3, column=0, sticky="w")
-        ttk.OptionMenu(advanced_tab, self.audio_source, "Foreground", "Background", "Custom", command=self.toggle_audio_entry).grid(row=3, column=1, sticky="ew", padx=5)
-        self.audio_frame = ttk.Frame(advanced_tab)
-        self.audio_frame.grid(row=4, column=0, columnspan=2, sticky="ew", pady=5)
-        ttk.Button(self.audio_frame, text="Browse", command=self.select_audio, style="TButton").pack(side="left", padx=5)
-        ttk.Label(self.audio_frame, textvariable=self.custom_audio_path, wraplength=300, font=("Helvetica", 9)).pack(side="left")
-        self.audio_frame.grid_remove()
-
-        ttk.Label(advanced_tab, text="Green Lower RGB:", font=("Helvetica", 11)).grid(row=5, column=0, sticky="w")
-        lower_frame = ttk.Frame(advanced_tab)
-        lower_frame.grid(row=5, column=1, sticky="ew")
-        ttk.Entry(lower_frame, textvariable=self.green_lower_r, width=5, justify="center").pack(side="left", padx=2)
-        ttk.Entry(lower_frame, textvariable=self.green_lower_g, width=5, justify="center").pack(side="left", padx=2)
-        ttk.Entry(lower_frame, textvariable=self.green_lower_b, width=5, justify="center").pack(side="left", padx=2)
-
-        ttk.Label(advanced_tab, text="Green Upper RGB:", font=("Helvetica", 11)).grid(row=6, column=0, sticky="w")
-        upper_frame = ttk.Frame(advanced_tab)
-        upper_frame.grid(row=6, column=1, sticky="ew")
-        ttk.Entry(upper_frame, textvariable=self.green_upper_r, width=5, justify="center").pack(side="left", padx=2)
-        ttk.Entry(upper_frame, textvariable=self.green_upper_g, width=5, justify="center").pack(side="left", padx=2)
-        ttk.Entry(upper_frame, textvariable=self.green_upper_b, width=5, justify="center").pack(side="left", padx=2)
-
-        ttk.Label(advanced_tab, text="Dilation:", font=("Helvetica", 11)).grid(row=7, column=0, sticky="w")
-        ttk.Scale(advanced_tab, from_=0, to=5, orient="horizontal", variable=self.dilation).grid(row=7, column=1, sticky="ew", padx=5)
-
-        # Output Tab
-        output_tab = ttk.Frame(settings_notebook, padding=15, relief="flat", borderwidth=2)
-        settings_notebook.add(output_tab, text="Output")
-
-        ttk.Label(output_tab, text="Format:", font=("Helvetica", 11)).grid(row=0, column=0, sticky="w")
-        ttk.OptionMenu(output_tab, self.format, "MP4", "AVI", "MOV").grid(row=0, column=1, sticky="ew", padx=5)
-        ttk.Label(output_tab, text="FPS:", font=("Helvetica", 11)).grid(row=1, column=0, sticky="w")
-        ttk.Entry(output_tab, textvariable=self.fps, width=5, justify="center").grid(row=1, column=1, sticky="w", padx=5, pady=5)
-        ttk.Checkbutton(output_tab, text="Loop Video", variable=self.loop_video).grid(row=2, column=0, sticky="w")
-        ttk.Checkbutton(output_tab, text="Fade Transition", variable=self.transition).grid(row=2, column=1, sticky="w")
-        ttk.Checkbutton(output_tab, text="Export Log", variable=self.export_log).grid(row=3, column=0, sticky="w")
-
-        # Recent Files with card-like design
-        recent_frame = ttk.LabelFrame(self.main_frame, text="Recent Outputs", padding=15, relief="flat", borderwidth=2)
-        recent_frame.grid(row=3, column=0, sticky="ew", pady=10)
-        self.recent_listbox = tk.Listbox(recent_frame, height=3, font=("Helvetica", 10), bg="#ffffff", relief="flat", borderwidth=1, selectbackground="#b0bec5")
-        self.recent_listbox.grid(row=0, column=0, sticky="ew")
-        self.recent_listbox.bind("<Double-1>", self.load_recent_file)
-
-        # Controls with hover effects
-        control_frame = ttk.Frame(self.main_frame)
-        control_frame.grid(row=4, column=0, sticky="ew", pady=20)
-        self.preview_btn = ttk.Button(control_frame, text="Preview", command=self.show_preview, style="TButton")
-        self.preview_btn.grid(row=0, column=0, padx=5)
-        Tooltip(self.preview_btn, "Preview a single frame (Ctrl+P)")
-        ttk.Button(control_frame, text="Save Preset", command=self.save_preset, style="TButton").grid(row=0, column=1, padx=5)
-        ttk.Button(control_frame, text="Load Preset", command=self.load_preset, style="TButton").grid(row=0, column=2, padx=5)
-        self.reset_btn = ttk.Button(control_frame, text="Reset", command=self.reset_settings, style="TButton")
-        self.reset_btn.grid(row=0, column=3, padx=5)
-        Tooltip(self.reset_btn, "Reset all settings (Ctrl+R)")
-        self.run_button = ttk.Button(control_frame, text="Process", command=self.run_processing, style="TButton")
-        self.run_button.grid(row=0, column=4, padx=5)
-        Tooltip(self.run_button, "Start processing (Ctrl+Enter)")
-        self.open_button = ttk.Button(control_frame, text="Open Output", command=self.open_output, style="TButton", state="disabled")
-        self.open_button.grid(row=0, column=5, padx=5)
-        Tooltip(self.open_button, "Open last processed video")
-        self.convert_btn = ttk.Button(control_frame, text="Convert to Green", command=self.convert_to_green, style="TButton")
-        self.convert_btn.grid(row=0, column=6, padx=5)
-        Tooltip(self.convert_btn, "Convert video to green screen foreground")
-
-        # Status Bar with rounded progress
-        status_frame = ttk.Frame(self.main_frame, relief="flat", borderwidth=0)
-        status_frame.grid(row=5, column=0, sticky="ew", pady=10)
-        ttk.Label(status_frame, text="Progress:", font=("Helvetica", 11, "bold")).grid(row=0, column=0, sticky="w", padx=5)
-        self.progress = ttk.Progressbar(status_frame, maximum=100, length=550, mode="determinate", style="TProgressbar")
-        self.progress.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
-        ttk.Label(status_frame, text="Status:", font=("Helvetica", 11, "bold")).grid(row=1, column=0, sticky="w", padx=5)
-        self.status_label = ttk.Label(status_frame, textvariable=self.status, foreground=self.status_color.get(), font=("Helvetica", 10, "bold"))
-        self.status_label.grid(row=1, column=1, sticky="w", padx=5, pady=2)
-
-        # Configure grid weights
-        self.main_frame.columnconfigure(0, weight=1)
-        input_frame.columnconfigure(0, weight=1)
-        basic_tab.columnconfigure(1, weight=1)
-        advanced_tab.columnconfigure(1, weight=1)
-        output_tab.columnconfigure(1, weight=1)
-        recent_frame.columnconfigure(0, weight=1)
-        control_frame.columnconfigure(6, weight=1)
-        status_frame.columnconfigure(1, weight=1)
-
-        # Keyboard shortcuts
-        self.root.bind("<Control-p>", lambda e: self.show_preview())
-        self.root.bind("<Control-r>", lambda e: self.reset_settings())
-        self.root.bind("<Control-Return>", lambda e: self.run_processing())
-
-        print("VideoProcessorApp.__init__ completed")
-
-    def add_foreground(self):
-        path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4")])
-        if path:
-            self.foreground_paths.append(path)
-            self.fg_listbox.insert(tk.END, os.path.basename(path))
-            try:
-                clip = VideoFileClip(path)
-                self.fg_size.set(f"Last added: {clip.w}x{clip.h}, {clip.duration:.2f}s")
-                clip.close()
-            except Exception as e:
-                self.fg_size.set(f"Error: {str(e)}")
-
-    def clear_foregrounds(self):
-        self.foreground_paths.clear()
-        self.fg_listbox.delete(0, tk.END)
-        self.fg_size.set("Not selected")
-
-    def select_background(self):
-        path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4")])
-        if path:
-            self.background_path.set(path)
-            try:
-                clip = VideoFileClip(path)
-                self.bg_size.set(f"Size: {clip.w}x{clip.h}, {clip.duration:.2f}s")
+        stop_profiler(frames)
+        if budget is not None:
+            configure_memory_budget(0)
+        configure_farm(None)
+        if log_events is not None:
+            EVENTS.unsubscribe(log_events)
+
+# Interactive preview. The session keeps the foreground, background and alpha sidecar decoders
+# open and decodes at a small proxy size (ffmpeg scales while decoding), and it keeps the frames
+# of the last time shown, so moving a keying setting only re-keys the proxy frames (a few ms)
+# and scrubbing only decodes. Not thread-safe: use it from one thread.
+PREVIEW_WIDTH = 480
+
+class PreviewSession:
+    # proxy_width=None previews at the full output size
+    def __init__(self, foreground_path, background_path, fg_width, fg_height, bg_width, bg_height, proxy_width=PREVIEW_WIDTH, resize_quality="Decoder"):
+        target_width, target_height = requested_size(fg_width, fg_height, bg_width, bg_height)
+        info = probe_video(foreground_path)
+        if not target_width or not target_height:
+            target_width, target_height = info["w"], info["h"]
+        self.scale = 1.0
+        if proxy_width and proxy_width < target_width:
+            self.scale = proxy_width / target_width
+            target_width, target_height = proxy_width, max(2, int(round(target_height * self.scale / 2)) * 2)
+        self.size = (target_width, target_height)
+        self.resize_quality = resize_quality
+        self.duration = info["duration"]
+        # Time of the last frame, the end of a scrubber
+        self.end = max(0.0, info["duration"] - 1 / info["fps"]) if info["fps"] else info["duration"]
+        self.foreground_path = foreground_path
+        self.foreground = self.open(foreground_path)
+        self.background = self.open(background_path)
+        alpha_path = find_alpha_sidecar(foreground_path)
+        self.alpha = self.open(alpha_path) if alpha_path else None
+        self.compositor = AlphaCompositor()
+        self.keyer = None
+        self.key_settings = None
+        self.frames_time = None
+        self.frames = None
+
+    def open(self, path):
+        clip = open_video(path, self.size, self.resize_quality)
+        if clip is None:
+            raise ValueError(f"Failed to load preview video: {path}")
+        return clip
+
+    def fit(self, frame):
+        width, height = self.size
+        if frame.shape[1] != width or frame.shape[0] != height:
+            return resize_frame(frame, width, height, "Fast" if self.resize_quality == "Decoder" else self.resize_quality)
+        return frame
+
+    # Proxy frames (foreground, background, alpha) at time t, decoded once per t
+    def decode(self, t):
+        if t != self.frames_time:
+            t_fg = t % self.foreground.duration
+            self.frames = (self.fit(self.foreground.get_frame(t_fg)),
+                           self.fit(self.background.get_frame(t % self.background.duration)),
+                           self.fit(self.alpha.get_frame(t_fg)) if self.alpha is not None else None)
+            self.frames_time = t
+        return self.frames
+
+    # Keyed frame at time t as a (height, width, 3) array, overwritten by the next call.
+    # Dilation is in output pixels and scaled down to the proxy. The "Auto" key model is
+    # calibrated once per tolerance (and remembered for the render).
+    def render(self, t, green_lower, green_upper, dilation, key_backend="auto", key_model="Range", key_tolerance=3.0):
+        fg_frame, bg_frame, alpha_frame = self.decode(t)
+        if alpha_frame is not None:
+            return self.compositor.composite(fg_frame, alpha_frame, bg_frame)
+        model = calibrate_key(self.foreground_path, float(key_tolerance)) if key_model == "Auto" else None
+        settings = (tuple(int(c) for c in green_lower), tuple(int(c) for c in green_upper), int(round(int(dilation) * self.scale)), key_backend, False, model)
+        if settings != self.key_settings:
+            self.keyer = GreenKeyer(*settings)
+            self.key_settings = settings
+        return self.keyer.key(fg_frame, bg_frame)
+
+    def close(self):
+        for clip in (self.foreground, self.background, self.alpha):
+            if clip is not None:
                 clip.close()
-            except Exception as e:
-                self.bg_size.set(f"Error: {str(e)}")
-
-    def select_output(self):
-        path = filedialog.asksaveasfilename(defaultextension=f".{self.format.get().lower()}", filetypes=[("Video files", f"*.{self.format.get().lower()}")])
-        if path:
-            self.output_path.set(path)
-
-    def select_audio(self):
-        path = filedialog.askopenfilename(filetypes=[("Audio files", "*.mp3 *.wav")])
-        if path:
-            self.custom_audio_path.set(path)
-
-    def set_preset_size(self, preset, target):
-        width, height = self.size_presets[preset]
-        if target == "fg":
-            if width and height:
-                self.fg_width.set(str(width))
-                self.fg_height.set(str(height))
-            else:
-                self.fg_width.set("")
-                self.fg_height.set("")
-        elif target == "bg":
-            if width and height:
-                self.bg_width.set(str(width))
-                self.bg_height.set(str(height))
-            else:
-                self.bg_width.set("")
-                self.bg_height.set("")
 
-    def toggle_audio_entry(self, *args):
-        if self.audio_source.get() == "Custom":
-            self.audio_frame.grid()
+# Single full-size preview frame at t=1s
+def preview_frame(foreground_path, background_path, fg_width, fg_height, bg_width, bg_height, green_lower, green_upper, dilation, resize_quality="Best", key_backend="auto", key_model="Range", key_tolerance=3.0):
+    session = PreviewSession(foreground_path, background_path, fg_width, fg_height, bg_width, bg_height, None, resize_quality)
+    try:
+        return Image.fromarray(session.render(1, green_lower, green_upper, dilation, key_backend, key_model, key_tolerance))
+    finally:
+        session.close()
+
+# Person segmentation model for green screen conversion: an object whose process(rgb_frame)
+# returns a result with a float segmentation_mask, like mediapipe's SelfieSegmentation
+def make_selfie_segmenter(model_selection=1):
+    import mediapipe as mp
+    return mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=model_selection)
+
+# Per-worker state for green screen conversion: a segmentation model (None for a worker that
+# only finishes masks) plus scratch buffers, allocated once. infer() runs the model;
+# apply() thresholds and cleans up a soft mask and turns the frame green outside it, in place.
+class GreenScreenSegmenter:
+    def __init__(self, model, width, height):
+        import cv2
+        self.model = model
+        self.size = (width, height)
+        self.rgb = np.empty((height, width, 3), np.uint8)
+        self.green_bg = np.empty((height, width, 3), np.uint8)
+        self.green_bg[:] = [0, 255, 0]
+        self.mask = np.empty((height, width), np.float32)
+        self.hard = np.empty((height, width), np.bool_)
+        self.scaled = np.empty((height, width), np.uint8)
+        self.blurred = np.empty((height, width), np.uint8)
+        self.eroded = np.empty((height, width), np.uint8)
+        self.dilated = np.empty((height, width), np.uint8)
+        self.erode_kernel = np.ones((3, 3), np.uint8)
+        self.dilate_kernel = np.ones((5, 5), np.uint8)
+        self.cv2 = cv2
+
+    # Soft person mask (float, model resolution) for a BGR frame. Copied, since models may reuse it.
+    def infer(self, frame):
+        self.cv2.cvtColor(frame, self.cv2.COLOR_BGR2RGB, dst=self.rgb)
+        return np.array(self.model.process(self.rgb).segmentation_mask, np.float32)
+
+    # alpha (optional): a (height, width) uint8 frame that receives the final mask as 0/255
+    def apply(self, frame, soft_mask, alpha=None):
+        cv2 = self.cv2
+        cv2.resize(soft_mask, self.size, dst=self.mask, interpolation=cv2.INTER_NEAREST)
+        np.greater(self.mask, 0.7, out=self.hard)
+        np.multiply(self.hard.view(np.uint8), 255, out=self.scaled)
+        cv2.GaussianBlur(self.scaled, (5, 5), 0, dst=self.blurred)
+        cv2.threshold(self.blurred, 127, 1, cv2.THRESH_BINARY, dst=self.blurred)
+        cv2.erode(self.blurred, self.erode_kernel, dst=self.eroded, iterations=1)
+        cv2.dilate(self.eroded, self.dilate_kernel, dst=self.dilated, iterations=2)
+        if alpha is not None:
+            np.multiply(self.dilated, 255, out=alpha)
+        # Background where the mask is 0; scaled is free again and holds the inverse mask
+        cv2.compare(self.dilated, 0, cv2.CMP_EQ, dst=self.scaled)
+        cv2.copyTo(self.green_bg, self.scaled, frame)
+        return frame
+
+    def segment(self, frame, alpha=None):
+        return self.apply(frame, self.infer(frame), alpha)
+
+# Temporal mask state for adaptive conversion, run in frame order. Frames are compared at a
+# small analysis size: a frame is a keyframe (gets a fresh segmentation) every `interval`
+# frames (0 = no fixed interval) or when more than `motion_threshold` percent of its pixels differ
+# from the last keyframe by over MOTION_DELTA grey levels (0 = interval only). In between, the last keyframe's mask is reused, or warped
+# along dense optical flow with `warp`. `smoothing` (0-1) blends in the previous frame's mask.
+class MaskPropagator:
+    ANALYSIS_WIDTH = 256
+    MOTION_DELTA = 20
+
+    def __init__(self, width, height, interval=1, motion_threshold=0.0, warp=False, smoothing=0.0):
+        import cv2
+        self.cv2 = cv2
+        self.interval = max(0, int(interval))
+        self.motion_threshold = float(motion_threshold)
+        self.warp = warp
+        self.smoothing = min(max(float(smoothing), 0.0), 0.95)
+        self.analysis_size = (self.ANALYSIS_WIDTH, max(1, round(height * self.ANALYSIS_WIDTH / width)))
+        aw, ah = self.analysis_size
+        self.grid_x, self.grid_y = np.meshgrid(np.arange(aw, dtype=np.float32), np.arange(ah, dtype=np.float32))
+        self.key_grey = None
+        self.since_key = 0
+        self.key_mask = None
+        self.previous = None
+        self.keyframes = 0
+
+    def grey(self, frame):
+        small = self.cv2.resize(frame, self.analysis_size, interpolation=self.cv2.INTER_AREA)
+        return self.cv2.cvtColor(small, self.cv2.COLOR_BGR2GRAY)
+
+    # Percentage of pixels that changed since the keyframe
+    def motion(self, grey):
+        _, changed = self.cv2.threshold(self.cv2.absdiff(grey, self.key_grey), self.MOTION_DELTA, 1, self.cv2.THRESH_BINARY)
+        return 100.0 * self.cv2.countNonZero(changed) / changed.size
+
+    # Reader side, in frame order: (is_keyframe, analysis grey frame)
+    def classify(self, frame):
+        grey = self.grey(frame)
+        key = self.key_grey is None or (self.interval > 0 and self.since_key + 1 >= self.interval)
+        if not key and self.motion_threshold > 0:
+            key = self.motion(grey) > self.motion_threshold
+        if key:
+            self.key_grey, self.since_key = grey, 0
+            self.keyframes += 1
         else:
-            self.audio_frame.grid_remove()
-
-    def set_theme(self, theme):
-        self.theme = theme
-        if theme == "Light":
-            bg, fg, btn, btn_active, trough = "#eceff1", "#263238", "#4caf50", "#388e3c", "#cfd8dc"
-        elif theme == "Dark":
-            bg, fg, btn, btn_active, trough = "#263238", "#eceff1", "#3498db", "#2980b9", "#34495e"
-        elif theme == "Slate":
-            bg, fg, btn, btn_active, trough = "#576574", "#dfe4ea", "#e67e22", "#d35400", "#718093"
-        
-        self.root.configure(bg=bg)
-        self.canvas.configure(bg=bg)
-        self.header_canvas.configure(bg=btn)
-        self.fg_listbox.configure(bg="#ffffff" if theme == "Light" else trough, fg=fg)
-        self.recent_listbox.configure(bg="#ffffff" if theme == "Light" else trough, fg=fg)
-        style = ttk.Style()
-        style.configure("TLabel", background=bg, foreground=fg)
-        style.configure("TFrame", background=bg)
-        style.configure("TCheckbutton", background=bg, foreground=fg)
-        style.configure("TScale", background=bg, troughcolor=trough)
-        style.configure("TButton", background=btn, foreground="#ffffff")
-        style.map("TButton", background=[("active", btn_active), ("disabled", "#b0bec5")], foreground=[("disabled", "#eceff1")])
-        style.configure("TProgressbar", background=btn, troughcolor=trough)
-        style.configure("TNotebook", background=bg)
-        style.configure("TNotebook.Tab", background=trough if theme != "Light" else "#b0bec5")
-        style.map("TNotebook.Tab", background=[("selected", "#ffffff" if theme == "Light" else trough)])
-        self.status_label.configure(foreground=self.status_color.get())
-        for btn in [self.preview_btn, self.reset_btn, self.run_button, self.open_button, self.convert_btn]:
-            btn.configure(style="TButton")
-
-    def reset_settings(self):
-        self.text_input.set("")
-        self.text_color.set("white")
-        self.text_size.set(24)
-        self.text_pos.set("Top Left")
-        self.loop_video.set(False)
-        self.fg_width.set("")
-        self.fg_height.set("")
-        self.bg_width.set("")
-        self.bg_height.set("")
-        self.fg_preset.set("Native")
-        self.bg_preset.set("Native")
-        self.audio_source.set("Foreground")
-        self.custom_audio_path.set("")
-        self.green_lower_r.set(0)
-        self.green_lower_g.set(200)
-        self.green_lower_b.set(0)
-        self.green_upper_r.set(50)
-        self.green_upper_g.set(255)
-        self.green_upper_b.set(50)
-        self.dilation.set(1)
-        self.format.set("MP4")
-        self.fps.set(24)
-        self.transition.set(False)
-        self.export_log.set(False)
-        self.toggle_audio_entry()
-
-    def show_preview(self):
-        if not self.foreground_paths or not self.background_path.get():
-            messagebox.showwarning("Input Error", "Select foreground and background first!")
-            return
+            self.since_key += 1
+        return key, grey
+
+    # Writer side, in frame order: the soft mask to apply, at analysis size
+    def propagate(self, key, grey, soft_mask):
+        cv2 = self.cv2
+        if key:
+            mask = cv2.resize(soft_mask, self.analysis_size, interpolation=cv2.INTER_LINEAR)
+            self.key_mask, self.key_mask_grey = mask, grey
+        elif self.warp:
+            # Flow from this frame back to the keyframe tells where each pixel's mask value is
+            flow = cv2.calcOpticalFlowFarneback(grey, self.key_mask_grey, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+            mask = cv2.remap(self.key_mask, self.grid_x + flow[..., 0], self.grid_y + flow[..., 1],
+                             cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        else:
+            mask = self.key_mask
+        if self.smoothing > 0 and self.previous is not None:
+            mask = cv2.addWeighted(self.previous, self.smoothing, mask, 1 - self.smoothing, 0)
+        self.previous = mask
+        return mask
+
+# Convert a video to a green screen foreground: everything but the person becomes [0, 255, 0].
+# A reader thread decodes into a fixed pool of frame buffers, `workers` segmentation threads
+# (each with its own model) process frames as they come, and a writer thread puts them back in
+# frame order and encodes them. progress(done, total) is called at most every progress_interval
+# seconds, from the writer thread. segmenter_factory() builds one model per worker.
+# With segment_interval other than 1 (0 = only on motion), motion_threshold, mask_warp or mask_smoothing
+# (see MaskPropagator) only keyframes are segmented, and the writer propagates and finishes every mask
+# in order. At segment_interval 1 every frame is a keyframe, so motion_threshold has no effect.
+# With write_alpha the mask is also written, losslessly, to the alpha sidecar of output_path.
+def convert_video_to_green(input_path, output_path, workers=1, progress=None, progress_interval=0.25, segmenter_factory=make_selfie_segmenter,
+                           segment_interval=1, motion_threshold=0.0, mask_warp=False, mask_smoothing=0.0, write_alpha=False):
+    import cv2
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise ValueError("Could not open input video")
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    workers = max(1, int(workers))
+    if int(segment_interval) < 0:
+        raise ValueError("Segment interval must be 0 (motion only) or more")
+    if int(segment_interval) == 1 and float(motion_threshold) > 0:
+        print("Motion threshold has no effect when segmenting every frame; use segment interval 0 to segment on motion only")
+    adaptive = int(segment_interval) != 1 or float(mask_smoothing) > 0
+    propagator = MaskPropagator(width, height, segment_interval, motion_threshold, mask_warp, mask_smoothing) if adaptive else None
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not out.isOpened():
+        cap.release()
+        raise ValueError(f"Could not open output video: {output_path}")
+    alpha_out = None
+    if write_alpha:
+        alpha_out = cv2.VideoWriter(alpha_sidecar_path(output_path), cv2.VideoWriter_fourcc(*"FFV1"), fps, (width, height), isColor=False)
+        if not alpha_out.isOpened():
+            cap.release()
+            out.release()
+            raise ValueError(f"Could not open alpha output: {alpha_sidecar_path(output_path)}")
+    else:
+        # An old sidecar would no longer match the new video
+        remove_alpha_sidecar(output_path)
+
+    # Enough buffers for every worker to hold one frame with one more waiting for it,
+    # plus the frame being read and the one being written. Each frame has an alpha buffer
+    # when the mask is written too.
+    free = queue.Queue()
+    for _ in range(workers * 2 + 2):
+        free.put((np.empty((height, width, 3), np.uint8), np.empty((height, width), np.uint8) if write_alpha else None))
+    todo = queue.Queue(maxsize=workers * 2)
+    done = queue.Queue()
+    stop = threading.Event()
+    errors = []
+    written = [0]
+
+    def run_stage(body):
         try:
-            green_lower = (self.green_lower_r.get(), self.green_lower_g.get(), self.green_lower_b.get())
-            green_upper = (self.green_upper_r.get(), self.green_upper_g.get(), self.green_upper_b.get())
-            preview_img = preview_frame(self.foreground_paths[0], self.background_path.get(), self.fg_width.get(), self.fg_height.get(), self.bg_width.get(), self.bg_height.get(), green_lower, green_upper, self.dilation.get())
-            preview_img = preview_img.resize((300, int(300 * preview_img.height / preview_img.width)), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(preview_img)
-            preview_window = tk.Toplevel(self.root)
-            preview_window.title("Preview")
-            preview_window.configure(bg="#263238" if self.theme != "Light" else "#eceff1")
-            ttk.Label(preview_window, image=photo).pack(padx=10, pady=10)
-            preview_window.photo = photo
+            body()
         except Exception as e:
-            messagebox.showerror("Preview Error", str(e))
-
-    def save_preset(self):
-        settings = {
-            "fg_width": self.fg_width.get(),
-            "fg_height": self.fg_height.get(),
-            "bg_width": self.bg_width.get(),
-            "bg_height": self.bg_height.get(),
-            "text": self.text_input.get(),
-            "text_color": self.text_color.get(),
-            "text_size": self.text_size.get(),
-            "text_pos": self.text_pos.get(),
-            "loop": self.loop_video.get(),
-            "audio_source": self.audio_source.get(),
-            "custom_audio_path": self.custom_audio_path.get(),
-            "green_lower": (self.green_lower_r.get(), self.green_lower_g.get(), self.green_lower_b.get()),
-            "green_upper": (self.green_upper_r.get(), self.green_upper_g.get(), self.green_upper_b.get()),
-            "dilation": self.dilation.get(),
-            "format": self.format.get(),
-            "fps": self.fps.get(),
-            "transition": self.transition.get(),
-            "export_log": self.export_log.get()
-        }
-        main_dir = os.path.dirname(os.path.abspath(__file__))
-        presets_dir = os.path.join(main_dir, "presets")
-        
-        os.makedirs(presets_dir, exist_ok=True)
-        
-        existing_files = [f for f in os.listdir(presets_dir) if f.startswith("preset") and f.endswith(".json")]
-        if existing_files:
-            numbers = [int(f.replace("preset", "").replace(".json", "")) for f in existing_files if f.replace("preset", "").replace(".json", "").isdigit()]
-            next_num = max(numbers) + 1 if numbers else 1
-        else:
-            next_num = 1
-        default_name = f"preset{next_num}.json"
-        
-        path = filedialog.asksaveasfilename(
-            initialdir=presets_dir,
-            initialfile=default_name,
-            defaultextension=".json",
-            filetypes=[("JSON files", "*.json")]
-        )
-        if path:
-            with open(path, 'w') as f:
-                json.dump(settings, f)
-            messagebox.showinfo("Success", f"Preset saved to {path}!")
-
-    def load_preset(self):
-        main_dir = os.path.dirname(os.path.abspath(__file__))
-        presets_dir = os.path.join(main_dir, "presets")
-        
-        path = filedialog.askopenfilename(
-            initialdir=presets_dir,
-            filetypes=[("JSON files", "*.json")]
-        )
-        if path:
-            with open(path, 'r') as f:
-                settings = json.load(f)
-            self.fg_width.set(settings.get("fg_width", ""))
-            self.fg_height.set(settings.get("fg_height", ""))
-            self.bg_width.set(settings.get("bg_width", ""))
-            self.bg_height.set(settings.get("bg_height", ""))
-            self.text_input.set(settings.get("text", ""))
-            self.text_color.set(settings.get("text_color", "white"))
-            self.text_size.set(settings.get("text_size", 24))
-            self.text_pos.set(settings.get("text_pos", "Top Left"))
-            self.loop_video.set(settings.get("loop", False))
-            self.audio_source.set(settings.get("audio_source", "Foreground"))
-            self.custom_audio_path.set(settings.get("custom_audio_path", ""))
-            self.green_lower_r.set(settings["green_lower"][0])
-            self.green_lower_g.set(settings["green_lower"][1])
-            self.green_lower_b.set(settings["green_lower"][2])
-            self.green_upper_r.set(settings["green_upper"][0])
-            self.green_upper_g.set(settings["green_upper"][1])
-            self.green_upper_b.set(settings["green_upper"][2])
-            self.dilation.set(settings.get("dilation", 1))
-            self.format.set(settings.get("format", "MP4"))
-            self.fps.set(settings.get("fps", "24"))
-            self.transition.set(settings.get("transition", False))
-            self.export_log.set(settings.get("export_log", False))
-            self.toggle_audio_entry()
-            messagebox.showinfo("Success", "Preset loaded!")
-
-    def add_recent_file(self, path):
-        if path not in self.recent_files:
-            self.recent_files.insert(0, path)
-            self.recent_listbox.insert(0, os.path.basename(path))
-            if len(self.recent_files) > 5:
-                self.recent_files.pop()
-                self.recent_listbox.delete(tk.END)
-
-    def load_recent_file(self, event):
-        selection = self.recent_listbox.curselection()
-        if selection:
-            path = self.recent_files[selection[0]]
-            self.output_path.set(path)
-            messagebox.showinfo("Recent File", f"Selected recent output: {path}")
-
-    def run_processing(self):
-        if not self.foreground_paths or not self.background_path.get() or not self.output_path.get():
-            messagebox.showwarning("Input Error", "Please select all required files!")
-            return
+            errors.append(e)
+            stop.set()
+
+    def read():
         try:
-            fps = int(self.fps.get())
-            if fps <= 0:
-                raise ValueError("FPS must be positive")
-        except ValueError:
-            messagebox.showwarning("Input Error", "Invalid FPS value!")
-            return
-        self.run_button.config(state="disabled")
-        self.open_button.config(state="disabled")
-        self.convert_btn.config(state="disabled")
-        for _ in range(3):
-            self.progress["value"] = 50
-            self.root.update_idletasks()
-            time.sleep(0.1)
-            self.progress["value"] = 0
-            self.root.update_idletasks()
-            time.sleep(0.1)
-        green_lower = (self.green_lower_r.get(), self.green_lower_g.get(), self.green_lower_b.get())
-        green_upper = (self.green_upper_r.get(), self.green_upper_g.get(), self.green_upper_b.get())
-        thread = threading.Thread(target=process_video, args=(self.foreground_paths, self.background_path.get(), self.output_path.get(), self.text_input.get(), self.text_color.get(), self.text_size.get(), self.text_pos.get(), self.loop_video.get(), self.fg_width.get(), self.fg_height.get(), self.bg_width.get(), self.bg_height.get(), self.audio_source.get(), self.custom_audio_path.get(), green_lower, green_upper, self.dilation.get(), self.format.get(), self.fps.get(), self.transition.get(), self))
+            index = 0
+            while not stop.is_set():
+                buffers = pipeline_get(free, stop)
+                if buffers is None:
+                    return
+                frame, alpha = buffers
+                ok, _ = cap.read(frame)
+                if not ok:
+                    break
+                key, grey = propagator.classify(frame) if propagator else (True, None)
+                if not pipeline_put(todo, (index, frame, alpha, key, grey), stop):
+                    return
+                index += 1
+        finally:
+            for _ in range(workers):
+                pipeline_put(todo, None, stop)
+
+    def segment():
+        try:
+            segmenter = GreenScreenSegmenter(segmenter_factory(), width, height)
+            infer = profiled("segment", segmenter.infer)
+            run = profiled("segment", segmenter.segment)
+            while True:
+                item = pipeline_get(todo, stop)
+                if item is None:
+                    return
+                index, frame, alpha, key, grey = item
+                if propagator is None:
+                    done.put((index, run(frame, alpha), alpha, None))
+                else:
+                    done.put((index, frame, alpha, (key, grey, infer(frame) if key else None)))
+        finally:
+            done.put(None)
+
+    def write():
+        pending = {}
+        finished = 0
+        last_report = 0
+        finisher = GreenScreenSegmenter(None, width, height) if propagator else None
+        while finished < workers:
+            item = pipeline_get(done, stop)
+            if item is None:
+                if stop.is_set():
+                    return
+                finished += 1
+                continue
+            pending[item[0]] = item[1:]
+            while written[0] in pending:
+                frame, alpha, mask_info = pending.pop(written[0])
+                if mask_info is not None:
+                    finisher.apply(frame, propagator.propagate(*mask_info), alpha)
+                out.write(frame)
+                if alpha_out is not None:
+                    alpha_out.write(alpha)
+                free.put((frame, alpha))
+                written[0] += 1
+                now = time.perf_counter()
+                if progress is not None and now - last_report >= progress_interval:
+                    last_report = now
+                    progress(written[0], max(frame_count, written[0]))
+        if pending:
+            raise RuntimeError(f"Conversion lost frames: {len(pending)} left after frame {written[0]}")
+
+    threads = [threading.Thread(target=run_stage, args=(read,), daemon=True),
+               threading.Thread(target=run_stage, args=(write,), daemon=True)]
+    threads += [threading.Thread(target=run_stage, args=(segment,), daemon=True) for _ in range(workers)]
+    for thread in threads:
         thread.start()
-
-    def open_output(self):
-        if self.last_output and os.path.exists(self.last_output):
-            try:
-                subprocess.Popen(['start', self.last_output], shell=True)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to open file: {str(e)}")
-        else:
-            messagebox.showwarning("No Output", "No processed video available to open!")
-
-    def convert_to_green(self):
-        path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4")])
-        if not path:
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+        cap.release()
+        out.release()
+        if alpha_out is not None:
+            alpha_out.release()
+    if errors:
+        remove_alpha_sidecar(output_path)
+        raise errors[0]
+    if progress is not None:
+        progress(written[0], written[0])
+    segmented = propagator.keyframes if propagator else written[0]
+    print(f"Converted {written[0]} frames to {output_path} with {workers} segmentation worker(s), {segmented} segmented")
+    return output_path
+
+# Preset defaults, matching the GUI's reset values
+PRESET_DEFAULTS = {
+    "fg_width": "",
+    "fg_height": "",
+    "bg_width": "",
+    "bg_height": "",
+    "text": "",
+    "text_color": "white",
+    "text_size": 24,
+    "text_pos": "Top Left",
+    "loop": False,
+    "audio_source": "Foreground",
+    "custom_audio_path": "",
+    "green_lower": [0, 200, 0],
+    "green_upper": [50, 255, 50],
+    "dilation": 1,
+    "format": "MP4",
+    "fps": "24",
+    "transition": False,
+    "export_log": False,
+    "workers": "1",
+    "pipeline_depth": 0,
+    "bg_cache_mb": 512,
+    "bg_cache_spill_mb": 0,
+    "resize_quality": "Best",
+    "key_backend": "auto",
+    "roi_keying": False,
+    "key_model": "Range",
+    "key_tolerance": 3.0,
+    "farm_workers": [],
+    "encoder": "x264",
+    "encoder_preset": "medium",
+    "encoder_tune": "none",
+    "crf": 23,
+    "encoder_threads": 0,
+    "gop": 0,
+    "draft": False,
+    "segment_cache_mb": 0,
+    "memory_budget_mb": 0
+}
+
+# Load a preset JSON (as written by Save Preset) with defaults for missing keys
+def load_preset_file(path):
+    with open(path, 'r') as f:
+        settings = json.load(f)
+    return {**PRESET_DEFAULTS, **settings}
+
+# Run process_video with a preset settings dict instead of GUI variables
+def process_with_preset(foreground_paths, background_path, output_path, settings):
+    s = {**PRESET_DEFAULTS, **settings}
+    return process_video(foreground_paths, background_path, output_path, s["text"], s["text_color"], s["text_size"], s["text_pos"], s["loop"],
+                         s["fg_width"], s["fg_height"], s["bg_width"], s["bg_height"], s["audio_source"], s["custom_audio_path"],
+                         s["green_lower"], s["green_upper"], s["dilation"], s["format"], s["fps"], s["transition"],
+                         workers=s["workers"], export_log=s["export_log"], pipeline_depth=s["pipeline_depth"],
+                         bg_cache_mb=s["bg_cache_mb"], bg_cache_spill_mb=s["bg_cache_spill_mb"],
+                         resize_quality=s["resize_quality"], key_backend=s["key_backend"], roi_keying=s["roi_keying"],
+                         encoder=s["encoder"], encoder_preset=s["encoder_preset"], encoder_tune=s["encoder_tune"], crf=s["crf"],
+                         encoder_threads=s["encoder_threads"], gop=s["gop"], draft=s["draft"],
+                         segment_cache_mb=s["segment_cache_mb"], memory_budget_mb=s["memory_budget_mb"],
+                         key_model=s["key_model"], key_tolerance=s["key_tolerance"], farm_workers=s["farm_workers"])
+
+# Jobs from a batch file: a JSON list of {"foregrounds", "background", "output", "preset", "settings"} objects.
+# "preset" is a preset file path (relative to the batch file), "settings" overrides individual keys.
+def load_batch_file(path):
+    with open(path, 'r') as f:
+        jobs = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for job in jobs:
+        settings = dict(PRESET_DEFAULTS)
+        if job.get("preset"):
+            settings = load_preset_file(os.path.join(base_dir, job["preset"]))
+        settings.update(job.get("settings", {}))
+        job["settings"] = settings
+    return jobs
+
+# Default location of the persistent render queue, next to the presets
+QUEUE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_queue.json")
+
+# Queue worker process entry point: run one job, forwarding its status and progress events to the dispatcher
+def run_queue_job(job, events):
+    forward = EVENTS.subscribe(lambda event: events.put((job["id"], event)) if event["type"] in ("status", "progress") else None)
+    try:
+        process_with_preset(job["foregrounds"], job["background"], job["output"], job["settings"])
+    finally:
+        EVENTS.unsubscribe(forward)
+    return job["output"]
+
+# Persistent render queue. Jobs ({"foregrounds", "background", "output", "settings"} plus id,
+# status, progress and timestamps) are saved to a JSON file on every state change, so a queue
+# survives restarts; jobs that were running when the process died are queued again on load.
+# start() runs queued jobs on a pool of `processes` worker processes (each job may use its own
+# render workers on top of that) until the queue is empty or stop() is called. on_update is
+# called from the dispatcher thread with a copy of the job whenever it changes.
+class RenderQueue:
+    def __init__(self, path=QUEUE_FILE, processes=1, on_update=None):
+        self.path = path
+        self.processes = max(1, int(processes))
+        self.on_update = on_update
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.thread = None
+        self.stopping = threading.Event()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
             return
-        
-        self.convert_btn.config(state="disabled")
-        self.run_button.config(state="disabled")
-        
-        def process_conversion():
-            try:
-                mp_selfie_segmentation = mp.solutions.selfie_segmentation
-                segmentation = mp_selfie_segmentation.SelfieSegmentation(model_selection=1)
-                
-                cap = cv2.VideoCapture(path)
-                if not cap.isOpened():
-                    raise ValueError("Could not open input video")
-                
-                fps = int(cap.get(cv2.CAP_PROP_FPS))
-                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                
-                main_dir = os.path.dirname(os.path.abspath(__file__))
-                output_path = os.path.join(main_dir, "foregrounds", f"greenscreen_{os.path.basename(path)}")
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
-                
-                self.update_status("Converting to green screen...", "#d4a017")
-                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                processed_frames = 0
-                
-                while cap.isOpened():
-                    ret, frame = cap.read()
-                    if not ret:
+        with open(self.path, 'r') as f:
+            jobs = json.load(f)
+        for job in jobs:
+            if job["status"] == "running":
+                job["status"], job["progress"] = "queued", 0
+        with self.lock:
+            self.jobs = jobs
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.jobs, indent=1)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs]
+
+    def add(self, foregrounds, background, output, settings):
+        import uuid
+        job = {"id": uuid.uuid4().hex[:8], "foregrounds": list(foregrounds), "background": background, "output": output,
+               "settings": {**PRESET_DEFAULTS, **settings}, "status": "queued", "progress": 0, "message": "",
+               "added": time.strftime("%Y-%m-%d %H:%M:%S"), "started": None, "finished": None}
+        with self.lock:
+            self.jobs.append(job)
+        self.save()
+        self.notify(job)
+        return job["id"]
+
+    def remove(self, job_id):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job["id"] != job_id or job["status"] == "running"]
+        self.save()
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job["status"] not in ("done", "failed")]
+        self.save()
+
+    def retry(self, job_id):
+        self.update(job_id, status="queued", progress=0, message="", started=None, finished=None)
+
+    def update(self, job_id, persist=True, **changes):
+        with self.lock:
+            job = next((job for job in self.jobs if job["id"] == job_id), None)
+            if job is None:
+                return
+            job.update(changes)
+            job = dict(job)
+        if persist:
+            self.save()
+        self.notify(job)
+
+    def notify(self, job):
+        if self.on_update is not None:
+            self.on_update(job)
+
+    def next_queued(self):
+        with self.lock:
+            return next((dict(job) for job in self.jobs if job["status"] == "queued"), None)
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.dispatch, daemon=True)
+        self.thread.start()
+
+    # Stop taking new jobs; running jobs finish
+    def stop(self):
+        self.stopping.set()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def dispatch(self):
+        from concurrent.futures import wait, FIRST_COMPLETED
+        from concurrent.futures.process import BrokenProcessPool
+        context = multiprocessing.get_context("spawn")
+        manager = context.Manager()
+        events = manager.Queue()
+        pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        futures = {}
+        try:
+            while True:
+                while not self.stopping.is_set() and len(futures) < self.processes:
+                    job = self.next_queued()
+                    if job is None:
                         break
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    results = segmentation.process(rgb_frame)
-                    
-                    mask = cv2.resize(results.segmentation_mask, (width, height), interpolation=cv2.INTER_NEAREST)
-                    mask = mask > 0.7
-                    mask = cv2.GaussianBlur(mask.astype(np.uint8) * 255, (5, 5), 0) > 127
-                    mask = cv2.erode(mask.astype(np.uint8), np.ones((3, 3), np.uint8), iterations=1)
-                    mask = cv2.dilate(mask, np.ones((5, 5), np.uint8), iterations=2)
-                    
-                    green_bg = np.zeros_like(frame, dtype=np.uint8)
-                    green_bg[:] = [0, 255, 0]
-                    result = np.where(mask[..., None], frame, green_bg)
-                    out.write(result)
-                    
-                    processed_frames += 1
-                    self.progress["value"] = (processed_frames / frame_count) * 100
-                    self.root.update_idletasks()
-                
-                cap.release()
-                out.release()
-                self.update_status("Conversion complete!", "#27ae60")
-                self.foreground_paths.append(output_path)
-                self.fg_listbox.insert(tk.END, os.path.basename(output_path))
-                try:
-                    clip = VideoFileClip(output_path)
-                    self.fg_size.set(f"Last added: {clip.w}x{clip.h}, {clip.duration:.2f}s")
-                    clip.close()
-                except Exception as e:
-                    self.fg_size.set(f"Error: {str(e)}")
-                messagebox.showinfo("Success", f"Green screen video saved as {output_path} and added to foregrounds!")
-            except Exception as e:
-                print(f"Conversion error: {str(e)}")
-                self.update_status(f"Error: {str(e)[:50]}", "#c0392b")
-                messagebox.showerror("Error", f"Conversion failed: {str(e)}")
-            finally:
-                self.root.after(0, lambda: self.convert_btn.config(state="normal"))
-                self.root.after(0, lambda: self.run_button.config(state="normal"))
-        
-        thread = threading.Thread(target=process_conversion)
-        thread.start()
-
-    def update_status(self, text, color="#263238"):
-        self.status.set(text)
-        self.status_color.set(color)
-        self.status_label.configure(foreground=color)
-        self.root.update_idletasks()
-
-    def enable_button(self):
-        self.run_button.config(state="normal")
-        self.convert_btn.config(state="normal")
-        print(f"enable_button: last_output = {self.last_output}, exists = {os.path.exists(self.last_output) if self.last_output else False}")
-        if self.last_output and os.path.exists(self.last_output):
-            self.open_button.config(state="normal", style="TButton")
-            print("Open Output button enabled")
-        else:
-            print("Open Output button remains disabled")
-        self.root.update_idletasks()
+                    self.update(job["id"], status="running", progress=0, message="Starting", started=time.strftime("%Y-%m-%d %H:%M:%S"))
+                    futures[pool.submit(run_queue_job, job, events)] = job["id"]
+                if not futures:
+                    break
+                done, _ = wait(list(futures), timeout=0.2, return_when=FIRST_COMPLETED)
+                while not events.empty():
+                    job_id, event = events.get()
+                    if event["type"] == "progress":
+                        self.update(job_id, persist=False, progress=round(event["value"], 1))
+                    else:
+                        self.update(job_id, persist=False, message=event["text"])
+                lost = []
+                for future in done:
+                    job_id = futures.pop(future)
+                    try:
+                        future.result()
+                        self.update(job_id, status="done", progress=100, message="Done", finished=time.strftime("%Y-%m-%d %H:%M:%S"))
+                    except BrokenProcessPool:
+                        lost.append(job_id)
+                    except Exception as e:
+                        self.update(job_id, status="failed", message=str(e), finished=time.strftime("%Y-%m-%d %H:%M:%S"))
+                if lost:
+                    # A worker died (crash, out of memory) and took the whole pool with it
+                    lost += list(futures.values())
+                    futures.clear()
+                    for job_id in lost:
+                        self.update(job_id, status="failed", message="Worker process died", finished=time.strftime("%Y-%m-%d %H:%M:%S"))
+                    pool.shutdown(wait=False)
+                    pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        finally:
+            pool.shutdown(wait=True)
+            manager.shutdown()
+
+# --list-queue / --run-queue: print the queue, or run it to completion with per-job progress
+def run_queue_cli(args):
+    reported = {}
+
+    def on_update(job):
+        state = (job["status"], int(job["progress"]) // 10)
+        if reported.get(job["id"]) != state:
+            reported[job["id"]] = state
+            print(f"[{job['id']}] {job['status']:7} {job['progress']:5.1f}%  {job['output']}" + (f"  ({job['message']})" if job["status"] == "failed" else ""))
+
+    render_queue = RenderQueue(args.queue_file, args.queue_processes, on_update if args.run_queue else None)
+    if args.list_queue:
+        for job in render_queue.snapshot():
+            print(f"[{job['id']}] {job['status']:7} {job['progress']:5.1f}%  {job['output']}  (added {job['added']})")
+        if not args.run_queue:
+            return 0
+    render_queue.start()
+    try:
+        render_queue.wait()
+    except KeyboardInterrupt:
+        print("Stopping after the running jobs finish...")
+        render_queue.stop()
+        render_queue.wait()
+    jobs = render_queue.snapshot()
+    failed = sum(1 for job in jobs if job["status"] == "failed")
+    print(f"Queue: {sum(1 for job in jobs if job['status'] == 'done')} done, {failed} failed, {sum(1 for job in jobs if job['status'] == 'queued')} queued")
+    return 1 if failed else 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Green screen keyer. Runs the GUI when started without arguments.")
+    parser.add_argument("foregrounds", nargs="*", help="foreground video(s), keyed and combined in order")
+    parser.add_argument("-b", "--background", help="background video")
+    parser.add_argument("-o", "--output", help="output video path")
+    parser.add_argument("-p", "--preset", help="preset JSON written by Save Preset")
+    parser.add_argument("-w", "--workers", type=int, help="render worker processes (overrides the preset)")
+    parser.add_argument("-d", "--pipeline-depth", type=int, help="frames buffered between pipelined render stages, 0 to disable (overrides the preset)")
+    parser.add_argument("--batch", help="JSON list of jobs to run one after another")
+    parser.add_argument("--enqueue", action="store_true", help="add the job (or --batch jobs) to the render queue instead of running it")
+    parser.add_argument("--run-queue", action="store_true", help="run the render queue until it is empty")
+    parser.add_argument("--list-queue", action="store_true", help="print the render queue")
+    parser.add_argument("--queue-file", default=QUEUE_FILE, help="render queue file (default: render_queue.json next to green.py)")
+    parser.add_argument("--queue-processes", type=int, default=1, help="jobs the render queue runs at once")
+    parser.add_argument("--gui", action="store_true", help="start the Tk GUI")
+    parser.add_argument("--convert", metavar="VIDEO", help="convert a video to a green screen foreground (written to --output or greenscreen_<name> next to it)")
+    parser.add_argument("--convert-workers", type=int, default=min(4, os.cpu_count() or 1), help="segmentation threads for --convert")
+    parser.add_argument("--segment-interval", type=int, default=1, help="--convert: segment every N frames and reuse the mask in between (0 = only when --motion-threshold is exceeded)")
+    parser.add_argument("--motion-threshold", type=float, default=0.0, help="--convert: also segment when this %% of the frame changed (0 = off)")
+    parser.add_argument("--mask-warp", action="store_true", help="--convert: warp reused masks along optical flow")
+    parser.add_argument("--mask-smoothing", type=float, default=0.0, help="--convert: weight of the previous mask, 0-0.95, against flicker")
+    parser.add_argument("--no-alpha", action="store_true", help="--convert: do not write the .alpha.mkv mask sidecar")
+    parser.add_argument("--farm", nargs="+", metavar="HOST:PORT", help="render on these farm workers (overrides the preset)")
+    parser.add_argument("--farm-worker", action="store_true", help="run a render farm worker until interrupted")
+    parser.add_argument("--farm-host", default="127.0.0.1", help="--farm-worker: address to listen on (0.0.0.0 for every interface)")
+    parser.add_argument("--farm-port", type=int, default=FARM_PORT, help="--farm-worker: port to listen on")
+    parser.add_argument("--farm-store", default=FARM_STORE_DIR, help="--farm-worker: directory for uploaded input files")
+    parser.add_argument("--check-backends", action="store_true", help="check every installed keying backend against the numpy reference")
+    return parser.parse_args(argv)
+
+# Headless entry point; returns the process exit code
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.gui or not argv:
+        from green_gui import run_gui
+        run_gui()
+        return 0
+    if args.check_backends:
+        results = check_key_backends()
+        return 0 if all(diff <= 1 for diff in results.values()) else 1
+    if args.farm_worker:
+        EVENTS.subscribe(ConsoleEvents())
+        run_farm_worker(args.farm_host, args.farm_port, args.farm_store)
+        return 0
+
+    if args.convert:
+        output = args.output or os.path.join(os.path.dirname(os.path.abspath(args.convert)), f"greenscreen_{os.path.basename(args.convert)}")
+        convert_video_to_green(args.convert, output, args.convert_workers,
+                               lambda done, total: print(f"Converted {done}/{total} frames", end="\r", flush=True), progress_interval=1.0,
+                               segment_interval=args.segment_interval, motion_threshold=args.motion_threshold,
+                               mask_warp=args.mask_warp, mask_smoothing=args.mask_smoothing, write_alpha=not args.no_alpha)
+        return 0
+
+    if args.list_queue or (args.run_queue and not args.foregrounds and not args.batch):
+        return run_queue_cli(args)
+
+    if args.batch:
+        jobs = load_batch_file(args.batch)
+    else:
+        if not args.foregrounds or not args.background or not args.output:
+            print("Error: foreground(s), --background and --output are required")
+            return 2
+        settings = load_preset_file(args.preset) if args.preset else dict(PRESET_DEFAULTS)
+        jobs = [{"foregrounds": args.foregrounds, "background": args.background, "output": args.output, "settings": settings}]
+    for job in jobs:
+        if args.workers:
+            job["settings"]["workers"] = args.workers
+        if args.pipeline_depth is not None:
+            job["settings"]["pipeline_depth"] = args.pipeline_depth
+        if args.farm:
+            job["settings"]["farm_workers"] = args.farm
+
+    if args.enqueue or args.run_queue:
+        render_queue = RenderQueue(args.queue_file, args.queue_processes)
+        for job in jobs:
+            job_id = render_queue.add(job["foregrounds"], job["background"], job["output"], job["settings"])
+            print(f"Queued {job_id}: {job['output']}")
+        return run_queue_cli(args) if args.run_queue else 0
+
+    EVENTS.subscribe(ConsoleEvents())
+    failed = 0
+    for i, job in enumerate(jobs):
+        settings = job["settings"]
+        print(f"Job {i+1}/{len(jobs)}: {job['output']}")
+        started = time.time()
+        try:
+            process_with_preset(job["foregrounds"], job["background"], job["output"], settings)
+            print(f"Job {i+1}/{len(jobs)} done in {time.time() - started:.1f}s")
+        except Exception as e:
+            failed += 1
+            print(f"Job {i+1}/{len(jobs)} failed: {str(e)}")
+    print(f"{len(jobs) - failed}/{len(jobs)} job(s) succeeded")
+    return 1 if failed else 0
 
-# Run the GUI
 if __name__ == "__main__":
-    print("Starting main block")
-    root = tk.Tk()
-    print("Tk root created")
-    app = VideoProcessorApp(root)
-    print("App instance created")
-    root.mainloop()
-    print("Mainloop exited")
+    sys.exit(main())
@@ -0,0 +1,1134 @@
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+from PIL import Image, ImageTk
+import numpy as np
+import threading
+import queue
+import json
+import os
+import time
+import subprocess
+from green import process_video, load_preset_file, RESIZE_QUALITIES, KEY_MODELS, MIN_DILATION, available_key_backends, RenderQueue, convert_video_to_green, probe_video, ENCODERS, ENCODER_PRESETS, ENCODER_TUNES, EVENTS
+
+# Tooltip class
+class Tooltip:
+    def __init__(self, widget, text):
+        self.widget = widget
+        self.text = text
+        self.tip_window = None
+        self.widget.bind("<Enter>", self.show_tip)
+        self.widget.bind("<Leave>", self.hide_tip)
+
+    def show_tip(self, event):
+        if self.tip_window or not self.text:
+            return
+        x, y = self.widget.winfo_rootx() + 25, self.widget.winfo_rooty() + 25
+        self.tip_window = tw = tk.Toplevel(self.widget)
+        tw.wm_overrideredirect(True)
+        tw.wm_geometry(f"+{x}+{y}")
+        label = ttk.Label(tw, text=self.text, background="#263238", foreground="#ffffff", relief="solid", borderwidth=1, padding=4, font=("Helvetica", 9))
+        label.pack()
+
+    def hide_tip(self, event):
+        if self.tip_window:
+            self.tip_window.destroy()
+            self.tip_window = None
+
+# Live preview window: a PreviewSession runs on its own thread and renders the latest requested
+# (time, keying settings); the Tk thread only posts requests and shows finished frames. Keying
+# setting changes and scrubbing are debounced so a dragged slider renders once it pauses.
+class PreviewWindow:
+    DEBOUNCE_MS = 30
+    POLL_MS = 30
+
+    def __init__(self, app):
+        self.app = app
+        self.root = app.root
+        self.window = tk.Toplevel(self.root)
+        self.window.title("Preview")
+        self.window.configure(bg="#263238" if app.theme != "Light" else "#eceff1")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.image_label = ttk.Label(self.window, text="Loading preview...")
+        self.image_label.pack(padx=10, pady=10)
+        self.time = tk.DoubleVar(value=1.0)
+        self.scrubber = ttk.Scale(self.window, from_=0, to=1, orient="horizontal", variable=self.time, command=lambda value: self.schedule())
+        self.scrubber.pack(fill="x", padx=10)
+        Tooltip(self.scrubber, "Scrub through the foreground")
+        self.info = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.info, font=("Helvetica", 9)).pack(pady=5)
+        self.photo = None
+        self.pending = None
+        self.closed = False
+        self.request = None
+        self.result = None
+        self.error = None
+        self.duration = None
+        self.condition = threading.Condition()
+
+        self.traces = []
+        for var in (app.green_lower_r, app.green_lower_g, app.green_lower_b, app.green_upper_r, app.green_upper_g, app.green_upper_b,
+                    app.dilation, app.key_backend, app.key_model, app.key_tolerance):
+            self.traces.append((var, var.trace_add("write", lambda *args: self.schedule())))
+
+        args = (app.foreground_paths[0], app.background_path.get(), app.fg_width.get(), app.fg_height.get(), app.bg_width.get(), app.bg_height.get())
+        threading.Thread(target=self.run, args=args, daemon=True).start()
+        self.submit()
+        self.poll()
+
+    # Preview thread: open the session, then render the newest request until the window closes
+    def run(self, *session_args):
+        from green import PreviewSession
+        session = None
+        try:
+            session = PreviewSession(*session_args)
+            self.duration = session.end
+            while True:
+                with self.condition:
+                    while self.request is None and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    request, self.request = self.request, None
+                started = time.perf_counter()
+                t = min(request[0], session.end)
+                frame = session.render(t, *request[1:])
+                image = Image.fromarray(frame)
+                self.result = (image, t, (time.perf_counter() - started) * 1000)
+        except Exception as e:
+            print(f"Preview error: {str(e)}")
+            self.error = e
+        finally:
+            if session is not None:
+                session.close()
+
+    def schedule(self):
+        if self.closed:
+            return
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+        self.pending = self.root.after(self.DEBOUNCE_MS, self.submit)
+
+    # Read the settings on the Tk thread and hand them to the preview thread
+    def submit(self):
+        self.pending = None
+        app = self.app
+        try:
+            request = (self.time.get(),
+                       (app.green_lower_r.get(), app.green_lower_g.get(), app.green_lower_b.get()),
+                       (app.green_upper_r.get(), app.green_upper_g.get(), app.green_upper_b.get()),
+                       app.dilation.get(), app.key_backend.get(), app.key_model.get(), float(app.key_tolerance.get()))
+        except (tk.TclError, ValueError):
+            # A setting is being edited and isn't a number yet
+            return
+        with self.condition:
+            self.request = request
+            self.condition.notify()
+
+    def poll(self):
+        if self.closed:
+            return
+        if self.duration is not None and float(self.scrubber.cget("to")) != self.duration:
+            self.scrubber.configure(to=self.duration)
+        result, self.result = self.result, None
+        if result is not None:
+            image, t, elapsed = result
+            self.photo = ImageTk.PhotoImage(image)
+            self.image_label.configure(image=self.photo, text="")
+            self.info.set(f"{t:.2f}s / {self.duration:.2f}s  ({elapsed:.0f} ms)")
+        if self.error is not None:
+            error, self.error = self.error, None
+            self.image_label.configure(text=f"Preview failed: {str(error)}")
+            return
+        self.root.after(self.POLL_MS, self.poll)
+
+    def close(self):
+        self.closed = True
+        with self.condition:
+            self.condition.notify()
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+        for var, trace in self.traces:
+            var.trace_remove("write", trace)
+        self.window.destroy()
+        if self.app.preview_window is self:
+            self.app.preview_window = None
+
+# GUI class
+class VideoProcessorApp:
+    # Render and conversion threads only post events; the Tk thread drains them this often
+    EVENT_POLL_MS = 50
+
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Green Screen Video Editor v1.3")
+        self.root.geometry("700x900")  # Slightly larger for better spacing
+        self.root.configure(bg="#eceff1")  # Softer light gray background
+        self.theme = "Light"
+        self.last_output = None
+
+        # Style configuration with modern flair
+        style = ttk.Style()
+        style.theme_use("clam")
+        style.configure("TButton", font=("Helvetica", 11, "bold"), padding=8, background="#4caf50", 
+                        foreground="#ffffff", borderwidth=0, relief="flat")
+        style.map("TButton", background=[("active", "#388e3c"), ("disabled", "#b0bec5")], 
+                  foreground=[("disabled", "#eceff1")])
+        style.configure("TLabel", font=("Helvetica", 10), background="#eceff1", foreground="#263238")
+        style.configure("TFrame", background="#eceff1")
+        style.configure("TCheckbutton", font=("Helvetica", 10), background="#eceff1", foreground="#263238")
+        style.configure("TScale", background="#eceff1", troughcolor="#cfd8dc", sliderrelief="flat")
+        style.configure("TProgressbar", background="#4caf50", troughcolor="#cfd8dc", thickness=10)
+        style.configure("TNotebook", background="#eceff1", tabposition="nw")
+        style.configure("TNotebook.Tab", font=("Helvetica", 11, "bold"), padding=[12, 6], 
+                        background="#b0bec5", borderwidth=0)
+        style.map("TNotebook.Tab", background=[("selected", "#ffffff"), ("active", "#90a4ae")])
+
+        # Main frame with scrollbar and subtle shadow
+        self.canvas = tk.Canvas(self.root, bg="#eceff1", highlightthickness=0, borderwidth=0)
+        self.scrollbar = ttk.Scrollbar(self.root, orient="vertical", command=self.canvas.yview)
+        self.main_frame = ttk.Frame(self.canvas, style="TFrame", padding=10)
+        self.main_frame.configure(relief="flat", borderwidth=2)
+
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side="right", fill="y", padx=5)
+        self.canvas.pack(side="left", fill="both", expand=True, padx=20, pady=20)
+        self.canvas.create_window((0, 0), window=self.main_frame, anchor="nw")
+        self.main_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+
+        # Variables
+        self.foreground_paths = []
+        self.background_path = tk.StringVar()
+        self.output_path = tk.StringVar(value="C:/Users/Haley/Desktop/green/output.mp4")
+        self.fg_size = tk.StringVar(value="Not selected")
+        self.bg_size = tk.StringVar(value="Not selected")
+        self.status = tk.StringVar(value="Ready")
+        self.status_color = tk.StringVar(value="#263238")
+        self.text_input = tk.StringVar()
+        self.text_color = tk.StringVar(value="white")
+        self.text_size = tk.IntVar(value=24)
+        self.text_pos = tk.StringVar(value="Top Left")
+        self.loop_video = tk.BooleanVar(value=False)
+        self.fg_width = tk.StringVar()
+        self.fg_height = tk.StringVar()
+        self.bg_width = tk.StringVar()
+        self.bg_height = tk.StringVar()
+        self.fg_preset = tk.StringVar(value="Native")
+        self.bg_preset = tk.StringVar(value="Native")
+        self.audio_source = tk.StringVar(value="Foreground")
+        self.custom_audio_path = tk.StringVar()
+        self.green_lower_r = tk.IntVar(value=0)
+        self.green_lower_g = tk.IntVar(value=200)
+        self.green_lower_b = tk.IntVar(value=0)
+        self.green_upper_r = tk.IntVar(value=50)
+        self.green_upper_g = tk.IntVar(value=255)
+        self.green_upper_b = tk.IntVar(value=50)
+        self.dilation = tk.IntVar(value=1)
+        self.format = tk.StringVar(value="MP4")
+        self.fps = tk.StringVar(value="24")
+        self.transition = tk.BooleanVar(value=False)
+        self.export_log = tk.BooleanVar(value=False)
+        self.workers = tk.StringVar(value="1")
+        self.pipeline_depth = tk.StringVar(value="0")
+        self.bg_cache_mb = tk.StringVar(value="512")
+        self.bg_cache_spill_mb = tk.StringVar(value="0")
+        self.resize_quality = tk.StringVar(value="Best")
+        self.key_backend = tk.StringVar(value="auto")
+        self.roi_keying = tk.BooleanVar(value=False)
+        self.key_model = tk.StringVar(value="Range")
+        self.key_tolerance = tk.StringVar(value="3.0")
+        self.encoder = tk.StringVar(value="x264")
+        self.encoder_preset = tk.StringVar(value="medium")
+        self.encoder_tune = tk.StringVar(value="none")
+        self.crf = tk.StringVar(value="23")
+        self.encoder_threads = tk.StringVar(value="0")
+        self.gop = tk.StringVar(value="0")
+        self.draft = tk.BooleanVar(value=False)
+        self.segment_cache_mb = tk.StringVar(value="0")
+        self.memory_budget_mb = tk.StringVar(value="0")
+        self.farm_workers = tk.StringVar(value="")
+        self.queue_processes = tk.StringVar(value="1")
+        self.convert_workers = tk.StringVar(value=str(min(4, os.cpu_count() or 1)))
+        self.segment_interval = tk.StringVar(value="1")
+        self.motion_threshold = tk.StringVar(value="0")
+        self.mask_warp = tk.BooleanVar(value=False)
+        self.mask_smoothing = tk.StringVar(value="0")
+        self.write_alpha = tk.BooleanVar(value=True)
+        self.events = queue.SimpleQueue()
+        self.preview_window = None
+        self.recent_files = []
+        self.render_queue = RenderQueue()
+        self.queue_jobs = []
+
+        self.size_presets = {
+            "Native": (None, None),
+            "Instagram (1080x1080)": (1080, 1080),
+            "YouTube (1920x1080)": (1920, 1080),
+            "TikTok (1080x1920)": (1080, 1920),
+            "Custom": (None, None)
+        }
+
+        # Header with gradient background
+        header_frame = ttk.Frame(self.main_frame, relief="flat")
+        header_frame.grid(row=0, column=0, sticky="ew", pady=(0, 20))
+        self.header_canvas = tk.Canvas(header_frame, height=50, highlightthickness=0)
+        self.header_canvas.pack(fill="x")
+        self.header_canvas.create_rectangle(0, 0, 700, 50, fill="#4caf50", outline="")
+        self.header_canvas.create_text(20, 25, text="Green Screen Video Editor", font=("Helvetica", 18, "bold"), fill="#ffffff", anchor="w")
+        self.header_canvas.create_text(260, 25, text="v1.3", font=("Helvetica", 8), fill="#ffffff", anchor="w")
+        theme_menu = ttk.OptionMenu(header_frame, tk.StringVar(value="Light"), "Light", "Dark", "Slate", command=self.set_theme)
+        theme_menu.pack(side="right", pady=5, padx=10)
+        Tooltip(theme_menu, "Switch UI theme")
+
+        # Inputs with card-like design
+        input_frame = ttk.LabelFrame(self.main_frame, text="Inputs", padding=15, relief="flat", borderwidth=2)
+        input_frame.grid(row=1, column=0, sticky="ew", pady=10)
+
+        ttk.Label(input_frame, text="Foreground Video(s):", font=("Helvetica", 11, "bold")).grid(row=0, column=0, sticky="w")
+        fg_btn_frame = ttk.Frame(input_frame)
+        fg_btn_frame.grid(row=0, column=1, sticky="e")
+        ttk.Button(fg_btn_frame, text="Add", command=self.add_foreground, style="TButton").pack(side="left", padx=5)
+        ttk.Button(fg_btn_frame, text="Clear", command=self.clear_foregrounds, style="TButton").pack(side="left", padx=5)
+        self.fg_listbox = tk.Listbox(input_frame, height=4, font=("Helvetica", 10), bg="#ffffff", relief="flat", borderwidth=1, selectbackground="#b0bec5")
+        self.fg_listbox.grid(row=1, column=0, columnspan=2, sticky="ew", pady=5)
+        ttk.Label(input_frame, textvariable=self.fg_size, font=("Helvetica", 9, "italic")).grid(row=2, column=0, columnspan=2, sticky="w")
+
+        ttk.Label(input_frame, text="Background Video:", font=("Helvetica", 11, "bold")).grid(row=3, column=0, sticky="w")
+        ttk.Button(input_frame, text="Browse", command=self.select_background, style="TButton").grid(row=3, column=1, sticky="e", padx=5)
+        ttk.Label(input_frame, textvariable=self.background_path, wraplength=400, font=("Helvetica", 9)).grid(row=4, column=0, columnspan=2, sticky="w")
+        ttk.Label(input_frame, textvariable=self.bg_size, font=("Helvetica", 9, "italic")).grid(row=5, column=0, columnspan=2, sticky="w")
+
+        ttk.Label(input_frame, text="Output Path:", font=("Helvetica", 11, "bold")).grid(row=6, column=0, sticky="w")
+        ttk.Button(input_frame, text="Browse", command=self.select_output, style="TButton").grid(row=6, column=1, sticky="e", padx=5)
+        ttk.Label(input_frame, textvariable=self.output_path, wraplength=400, font=("Helvetica", 9)).grid(row=7, column=0, columnspan=2, sticky="w")
+
+        # Tabbed Settings with shadow
+        settings_notebook = ttk.Notebook(self.main_frame)
+        settings_notebook.grid(row=2, column=0, sticky="ew", pady=15)
+        settings_notebook.configure(style="TNotebook")
+
+        # Basic Tab
+        basic_tab = ttk.Frame(settings_notebook, padding=15, relief="flat", borderwidth=2)
+        settings_notebook.add(basic_tab, text="Basic")
+
+        ttk.Label(basic_tab, text="Foreground Size:", font=("Helvetica", 11)).grid(row=0, column=0, sticky="w")
+        self.fg_menu = tk.OptionMenu(basic_tab, self.fg_preset, *self.size_presets.keys(), command=lambda v: self.set_preset_size(v, "fg"))
+        self.fg_menu.grid(row=0, column=1, sticky="ew", padx=5)
+        fg_size_frame = ttk.Frame(basic_tab)
+        fg_size_frame.grid(row=1, column=0, columnspan=2, pady=5)
+        ttk.Entry(fg_size_frame, textvariable=self.fg_width, width=8, justify="center").pack(side="left", padx=2)
+        ttk.Label(fg_size_frame, text="x").pack(side="left")
+        ttk.Entry(fg_size_frame, textvariable=self.fg_height, width=8, justify="center").pack(side="left", padx=2)
+
+        ttk.Label(basic_tab, text="Background Size:", font=("Helvetica", 11)).grid(row=2, column=0, sticky="w")
+        self.bg_menu = tk.OptionMenu(basic_tab, self.bg_preset, *self.size_presets.keys(), command=lambda v: self.set_preset_size(v, "bg"))
+        self.bg_menu.grid(row=2, column=1, sticky="ew", padx=5)
+        bg_size_frame = ttk.Frame(basic_tab)
+        bg_size_frame.grid(row=3, column=0, columnspan=2, pady=5)
+        ttk.Entry(bg_size_frame, textvariable=self.bg_width, width=8, justify="center").pack(side="left", padx=2)
+        ttk.Label(bg_size_frame, text="x").pack(side="left")
+        ttk.Entry(bg_size_frame, textvariable=self.bg_height, width=8, justify="center").pack(side="left", padx=2)
+
+        ttk.Label(basic_tab, text="Overlay Text:", font=("Helvetica", 11)).grid(row=4, column=0, sticky="w")
+        ttk.Entry(basic_tab, textvariable=self.text_input).grid(row=4, column=1, sticky="ew", pady=5, padx=5)
+
+        ttk.Label(basic_tab, text="Resize Quality:", font=("Helvetica", 11)).grid(row=5, column=0, sticky="w")
+        resize_menu = ttk.OptionMenu(basic_tab, self.resize_quality, "Best", *RESIZE_QUALITIES)
+        resize_menu.grid(row=5, column=1, sticky="ew", padx=5)
+        Tooltip(resize_menu, "Best = LANCZOS, Balanced/Fast = OpenCV, Decoder = scale in ffmpeg while decoding")
+
+        # Advanced Tab
+        advanced_tab = ttk.Frame(settings_notebook, padding=15, relief="flat", borderwidth=2)
+        settings_notebook.add(advanced_tab, text="Advanced")
+
+        ttk.Label(advanced_tab, text="Text Color:", font=("Helvetica", 11)).grid(row=0, column=0, sticky="w")
+        ttk.OptionMenu(advanced_tab, self.text_color, "white", "black", "red", "blue", "yellow").grid(row=0, column=1, sticky="ew", padx=5)
+        ttk.Label(advanced_tab, text="Text Size:", font=("Helvetica", 11)).grid(row=1, column=0, sticky="w")
+        ttk.Scale(advanced_tab, from_=10, to=100, orient="horizontal", variable=self.text_size).grid(row=1, column=1, sticky="ew", padx=5)
+        ttk.Label(advanced_tab, text="Text Position:", font=("Helvetica", 11)).grid(row=2, column=0, sticky="w")
+        ttk.OptionMenu(advanced_tab, self.text_pos, "Top Left", "Top Center", "Top Right", "Center", "Bottom Left", "Bottom Center", "Bottom Right").grid(row=2, column=1, sticky="ew", padx=5)
+
+        ttk.Label(advanced_tab, text="Audio Source:", font=("Helvetica", 11)).grid(row=3, column=0, sticky="w")
+        ttk.OptionMenu(advanced_tab, self.audio_source, "Foreground", "Background", "Custom", command=self.toggle_audio_entry).grid(row=3, column=1, sticky="ew", padx=5)
+        self.audio_frame = ttk.Frame(advanced_tab)
+        self.audio_frame.grid(row=4, column=0, columnspan=2, sticky="ew", pady=5)
+        ttk.Button(self.audio_frame, text="Browse", command=self.select_audio, style="TButton").pack(side="left", padx=5)
+        ttk.Label(self.audio_frame, textvariable=self.custom_audio_path, wraplength=300, font=("Helvetica", 9)).pack(side="left")
+        self.audio_frame.grid_remove()
+
+        ttk.Label(advanced_tab, text="Green Lower RGB:", font=("Helvetica", 11)).grid(row=5, column=0, sticky="w")
+        lower_frame = ttk.Frame(advanced_tab)
+        lower_frame.grid(row=5, column=1, sticky="ew")
+        ttk.Entry(lower_frame, textvariable=self.green_lower_r, width=5, justify="center").pack(side="left", padx=2)
+        ttk.Entry(lower_frame, textvariable=self.green_lower_g, width=5, justify="center").pack(side="left", padx=2)
+        ttk.Entry(lower_frame, textvariable=self.green_lower_b, width=5, justify="center").pack(side="left", padx=2)
+
+        ttk.Label(advanced_tab, text="Green Upper RGB:", font=("Helvetica", 11)).grid(row=6, column=0, sticky="w")
+        upper_frame = ttk.Frame(advanced_tab)
+        upper_frame.grid(row=6, column=1, sticky="ew")
+        ttk.Entry(upper_frame, textvariable=self.green_upper_r, width=5, justify="center").pack(side="left", padx=2)
+        ttk.Entry(upper_frame, textvariable=self.green_upper_g, width=5, justify="center").pack(side="left", padx=2)
+        ttk.Entry(upper_frame, textvariable=self.green_upper_b, width=5, justify="center").pack(side="left", padx=2)
+
+        ttk.Label(advanced_tab, text="Dilation:", font=("Helvetica", 11)).grid(row=7, column=0, sticky="w")
+        ttk.Scale(advanced_tab, from_=MIN_DILATION, to=5, orient="horizontal", variable=self.dilation).grid(row=7, column=1, sticky="ew", padx=5)
+
+        ttk.Label(advanced_tab, text="Keying Backend:", font=("Helvetica", 11)).grid(row=8, column=0, sticky="w")
+        backend_menu = ttk.OptionMenu(advanced_tab, self.key_backend, "auto", "auto", *available_key_backends())
+        backend_menu.grid(row=8, column=1, sticky="ew", padx=5)
+        Tooltip(backend_menu, "Keying implementation (auto picks the fastest installed one)")
+        roi_check = ttk.Checkbutton(advanced_tab, text="ROI Keying", variable=self.roi_keying)
+        roi_check.grid(row=9, column=0, columnspan=2, sticky="w")
+        Tooltip(roi_check, "Only key around the subject and copy the background elsewhere (same result, faster when the subject is small)")
+        ttk.Label(advanced_tab, text="Key Model:", font=("Helvetica", 11)).grid(row=10, column=0, sticky="w")
+        key_model_menu = ttk.OptionMenu(advanced_tab, self.key_model, "Range", *KEY_MODELS)
+        key_model_menu.grid(row=10, column=1, sticky="ew", padx=5)
+        Tooltip(key_model_menu, "Range = the RGB range above, Auto = fit the backdrop's colour from each foreground (handles uneven lighting)")
+        ttk.Label(advanced_tab, text="Key Tolerance:", font=("Helvetica", 11)).grid(row=11, column=0, sticky="w")
+        tolerance_entry = ttk.Entry(advanced_tab, textvariable=self.key_tolerance, width=5, justify="center")
+        tolerance_entry.grid(row=11, column=1, sticky="w", padx=5, pady=5)
+        Tooltip(tolerance_entry, "Auto key model: how far (in standard deviations) a colour may be from the backdrop's and still be keyed")
+
+        # Output Tab
+        output_tab = ttk.Frame(settings_notebook, padding=15, relief="flat", borderwidth=2)
+        settings_notebook.add(output_tab, text="Output")
+
+        ttk.Label(output_tab, text="Format:", font=("Helvetica", 11)).grid(row=0, column=0, sticky="w")
+        ttk.OptionMenu(output_tab, self.format, "MP4", "AVI", "MOV").grid(row=0, column=1, sticky="ew", padx=5)
+        ttk.Label(output_tab, text="FPS:", font=("Helvetica", 11)).grid(row=1, column=0, sticky="w")
+        ttk.Entry(output_tab, textvariable=self.fps, width=5, justify="center").grid(row=1, column=1, sticky="w", padx=5, pady=5)
+        ttk.Checkbutton(output_tab, text="Loop Video", variable=self.loop_video).grid(row=2, column=0, sticky="w")
+        ttk.Checkbutton(output_tab, text="Fade Transition", variable=self.transition).grid(row=2, column=1, sticky="w")
+        export_log_check = ttk.Checkbutton(output_tab, text="Export Log", variable=self.export_log)
+        export_log_check.grid(row=3, column=0, sticky="w")
+        Tooltip(export_log_check, "Append per-stage timings (JSON lines) to process_log.jsonl next to the output")
+        ttk.Label(output_tab, text="Render Workers:", font=("Helvetica", 11)).grid(row=4, column=0, sticky="w")
+        workers_entry = ttk.Entry(output_tab, textvariable=self.workers, width=5, justify="center")
+        workers_entry.grid(row=4, column=1, sticky="w", padx=5, pady=5)
+        Tooltip(workers_entry, f"Render frame ranges in parallel processes (this machine has {os.cpu_count()} cores)")
+        ttk.Label(output_tab, text="Pipeline Depth:", font=("Helvetica", 11)).grid(row=5, column=0, sticky="w")
+        depth_entry = ttk.Entry(output_tab, textvariable=self.pipeline_depth, width=5, justify="center")
+        depth_entry.grid(row=5, column=1, sticky="w", padx=5, pady=5)
+        Tooltip(depth_entry, "Frames buffered between decode, keying and encode threads (0 = off)")
+        ttk.Label(output_tab, text="Background Cache (MB):", font=("Helvetica", 11)).grid(row=6, column=0, sticky="w")
+        cache_frame = ttk.Frame(output_tab)
+        cache_frame.grid(row=6, column=1, sticky="w", padx=5, pady=5)
+        cache_entry = ttk.Entry(cache_frame, textvariable=self.bg_cache_mb, width=6, justify="center")
+        cache_entry.pack(side="left", padx=2)
+        Tooltip(cache_entry, "Memory for decoded background frames (0 = off)")
+        ttk.Label(cache_frame, text="+ disk").pack(side="left")
+        spill_entry = ttk.Entry(cache_frame, textvariable=self.bg_cache_spill_mb, width=6, justify="center")
+        spill_entry.pack(side="left", padx=2)
+        Tooltip(spill_entry, "Disk space for background frames evicted from memory (0 = off)")
+        ttk.Label(output_tab, text="Queue Processes:", font=("Helvetica", 11)).grid(row=7, column=0, sticky="w")
+        queue_processes_entry = ttk.Entry(output_tab, textvariable=self.queue_processes, width=5, justify="center")
+        queue_processes_entry.grid(row=7, column=1, sticky="w", padx=5, pady=5)
+        Tooltip(queue_processes_entry, "Render queue jobs run at the same time (applies when the queue starts)")
+        ttk.Label(output_tab, text="Convert Workers:", font=("Helvetica", 11)).grid(row=8, column=0, sticky="w")
+        convert_workers_entry = ttk.Entry(output_tab, textvariable=self.convert_workers, width=5, justify="center")
+        convert_workers_entry.grid(row=8, column=1, sticky="w", padx=5, pady=5)
+        Tooltip(convert_workers_entry, "Segmentation threads for Convert to Green, each with its own model")
+        ttk.Label(output_tab, text="Segment Every (frames):", font=("Helvetica", 11)).grid(row=9, column=0, sticky="w")
+        segment_frame = ttk.Frame(output_tab)
+        segment_frame.grid(row=9, column=1, sticky="w", padx=5, pady=5)
+        interval_entry = ttk.Entry(segment_frame, textvariable=self.segment_interval, width=5, justify="center")
+        interval_entry.pack(side="left", padx=2)
+        Tooltip(interval_entry, "Convert to Green: run segmentation every N frames and reuse the mask in between (1 = every frame, 0 = only on motion)")
+        ttk.Label(segment_frame, text="or motion >").pack(side="left")
+        motion_entry = ttk.Entry(segment_frame, textvariable=self.motion_threshold, width=5, justify="center")
+        motion_entry.pack(side="left", padx=2)
+        Tooltip(motion_entry, "Also segment when this % of the frame changed since the last segmented frame (0 = off; no effect when segmenting every frame)")
+        ttk.Label(segment_frame, text="%").pack(side="left")
+        ttk.Label(output_tab, text="Mask Smoothing:", font=("Helvetica", 11)).grid(row=10, column=0, sticky="w")
+        smoothing_frame = ttk.Frame(output_tab)
+        smoothing_frame.grid(row=10, column=1, sticky="w", padx=5, pady=5)
+        smoothing_entry = ttk.Entry(smoothing_frame, textvariable=self.mask_smoothing, width=5, justify="center")
+        smoothing_entry.pack(side="left", padx=2)
+        Tooltip(smoothing_entry, "Weight of the previous frame's mask, 0-0.95, to reduce flicker (0 = off)")
+        warp_check = ttk.Checkbutton(smoothing_frame, text="Warp Mask", variable=self.mask_warp)
+        warp_check.pack(side="left", padx=5)
+        Tooltip(warp_check, "Move reused masks along optical flow instead of holding them still")
+        alpha_check = ttk.Checkbutton(output_tab, text="Write Alpha Mask", variable=self.write_alpha)
+        alpha_check.grid(row=11, column=0, sticky="w")
+        Tooltip(alpha_check, "Convert to Green also writes a lossless mask (.alpha.mkv); Process composites from it instead of keying")
+        ttk.Label(output_tab, text="Encoder:", font=("Helvetica", 11)).grid(row=12, column=0, sticky="w")
+        encoder_frame = ttk.Frame(output_tab)
+        encoder_frame.grid(row=12, column=1, sticky="w", padx=5, pady=5)
+        encoder_menu = ttk.OptionMenu(encoder_frame, self.encoder, "x264", *ENCODERS)
+        encoder_menu.pack(side="left", padx=2)
+        Tooltip(encoder_menu, "Video encoder for MP4 and MOV (AVI always uses MPEG-4)")
+        preset_menu = ttk.OptionMenu(encoder_frame, self.encoder_preset, "medium", *ENCODER_PRESETS)
+        preset_menu.pack(side="left", padx=2)
+        Tooltip(preset_menu, "Encoder speed preset: faster presets encode quicker but need more bits for the same quality")
+        tune_menu = ttk.OptionMenu(encoder_frame, self.encoder_tune, "none", *ENCODER_TUNES["x264"])
+        tune_menu.pack(side="left", padx=2)
+        Tooltip(tune_menu, "Encoder tuning for the content (x265 supports animation, grain, fastdecode and zerolatency)")
+        ttk.Label(output_tab, text="Quality (CRF):", font=("Helvetica", 11)).grid(row=13, column=0, sticky="w")
+        quality_frame = ttk.Frame(output_tab)
+        quality_frame.grid(row=13, column=1, sticky="w", padx=5, pady=5)
+        crf_entry = ttk.Entry(quality_frame, textvariable=self.crf, width=5, justify="center")
+        crf_entry.pack(side="left", padx=2)
+        Tooltip(crf_entry, "Constant rate factor, 0-51: lower is better quality and bigger files (23 is x264's default)")
+        ttk.Label(quality_frame, text="GOP").pack(side="left")
+        gop_entry = ttk.Entry(quality_frame, textvariable=self.gop, width=5, justify="center")
+        gop_entry.pack(side="left", padx=2)
+        Tooltip(gop_entry, "Maximum frames between keyframes (0 = encoder default)")
+        ttk.Label(quality_frame, text="Threads").pack(side="left")
+        threads_entry = ttk.Entry(quality_frame, textvariable=self.encoder_threads, width=5, justify="center")
+        threads_entry.pack(side="left", padx=2)
+        Tooltip(threads_entry, "Encoder threads (0 = automatic)")
+        draft_check = ttk.Checkbutton(output_tab, text="Fast Draft", variable=self.draft)
+        draft_check.grid(row=14, column=0, sticky="w")
+        Tooltip(draft_check, "Encode with the fastest preset at CRF 30 or worse, for quick checks")
+        ttk.Label(output_tab, text="Segment Cache (MB):", font=("Helvetica", 11)).grid(row=15, column=0, sticky="w")
+        segment_cache_entry = ttk.Entry(output_tab, textvariable=self.segment_cache_mb, width=6, justify="center")
+        segment_cache_entry.grid(row=15, column=1, sticky="w", padx=5, pady=5)
+        Tooltip(segment_cache_entry, "Disk space for rendered clips, so re-rendering only redoes the clips whose inputs or settings changed (0 = off)")
+        ttk.Label(output_tab, text="Memory Budget (MB):", font=("Helvetica", 11)).grid(row=16, column=0, sticky="w")
+        memory_budget_entry = ttk.Entry(output_tab, textvariable=self.memory_budget_mb, width=6, justify="center")
+        memory_budget_entry.grid(row=16, column=1, sticky="w", padx=5, pady=5)
+        Tooltip(memory_budget_entry, "Cap the render's memory: render one clip at a time and cut workers, pipeline depth and background cache to fit (0 = off)")
+        ttk.Label(output_tab, text="Render Farm:", font=("Helvetica", 11)).grid(row=17, column=0, sticky="w")
+        farm_entry = ttk.Entry(output_tab, textvariable=self.farm_workers, width=30)
+        farm_entry.grid(row=17, column=1, sticky="ew", padx=5, pady=5)
+        Tooltip(farm_entry, "Render on these farm workers (host:port, comma-separated; start them with green.py --farm-worker). Empty = render here")
+
+        # Recent Files with card-like design
+        recent_frame = ttk.LabelFrame(self.main_frame, text="Recent Outputs", padding=15, relief="flat", borderwidth=2)
+        recent_frame.grid(row=3, column=0, sticky="ew", pady=10)
+        self.recent_listbox = tk.Listbox(recent_frame, height=3, font=("Helvetica", 10), bg="#ffffff", relief="flat", borderwidth=1, selectbackground="#b0bec5")
+        self.recent_listbox.grid(row=0, column=0, sticky="ew")
+        self.recent_listbox.bind("<Double-1>", self.load_recent_file)
+
+        # Render queue
+        queue_frame = ttk.LabelFrame(self.main_frame, text="Render Queue", padding=15, relief="flat", borderwidth=2)
+        queue_frame.grid(row=6, column=0, sticky="ew", pady=10)
+        self.queue_listbox = tk.Listbox(queue_frame, height=4, font=("Helvetica", 10), bg="#ffffff", relief="flat", borderwidth=1, selectbackground="#b0bec5")
+        self.queue_listbox.grid(row=0, column=0, columnspan=5, sticky="ew")
+        queue_add_btn = ttk.Button(queue_frame, text="Add to Queue", command=self.queue_job, style="TButton")
+        queue_add_btn.grid(row=1, column=0, padx=5, pady=5)
+        Tooltip(queue_add_btn, "Queue the current files and settings as a job")
+        self.queue_start_btn = ttk.Button(queue_frame, text="Start Queue", command=self.toggle_queue, style="TButton")
+        self.queue_start_btn.grid(row=1, column=1, padx=5, pady=5)
+        ttk.Button(queue_frame, text="Remove", command=self.remove_queue_job, style="TButton").grid(row=1, column=2, padx=5, pady=5)
+        ttk.Button(queue_frame, text="Retry", command=self.retry_queue_job, style="TButton").grid(row=1, column=3, padx=5, pady=5)
+        ttk.Button(queue_frame, text="Clear Done", command=self.clear_queue, style="TButton").grid(row=1, column=4, padx=5, pady=5)
+
+        # Controls with hover effects
+        control_frame = ttk.Frame(self.main_frame)
+        control_frame.grid(row=4, column=0, sticky="ew", pady=20)
+        self.preview_btn = ttk.Button(control_frame, text="Preview", command=self.show_preview, style="TButton")
+        self.preview_btn.grid(row=0, column=0, padx=5)
+        Tooltip(self.preview_btn, "Live preview: scrub through the foreground, keying changes show immediately (Ctrl+P)")
+        ttk.Button(control_frame, text="Save Preset", command=self.save_preset, style="TButton").grid(row=0, column=1, padx=5)
+        ttk.Button(control_frame, text="Load Preset", command=self.load_preset, style="TButton").grid(row=0, column=2, padx=5)
+        self.reset_btn = ttk.Button(control_frame, text="Reset", command=self.reset_settings, style="TButton")
+        self.reset_btn.grid(row=0, column=3, padx=5)
+        Tooltip(self.reset_btn, "Reset all settings (Ctrl+R)")
+        self.run_button = ttk.Button(control_frame, text="Process", command=self.run_processing, style="TButton")
+        self.run_button.grid(row=0, column=4, padx=5)
+        Tooltip(self.run_button, "Start processing (Ctrl+Enter)")
+        self.open_button = ttk.Button(control_frame, text="Open Output", command=self.open_output, style="TButton", state="disabled")
+        self.open_button.grid(row=0, column=5, padx=5)
+        Tooltip(self.open_button, "Open last processed video")
+        self.convert_btn = ttk.Button(control_frame, text="Convert to Green", command=self.convert_to_green, style="TButton")
+        self.convert_btn.grid(row=0, column=6, padx=5)
+        Tooltip(self.convert_btn, "Convert video to green screen foreground")
+
+        # Status Bar with rounded progress
+        status_frame = ttk.Frame(self.main_frame, relief="flat", borderwidth=0)
+        status_frame.grid(row=5, column=0, sticky="ew", pady=10)
+        ttk.Label(status_frame, text="Progress:", font=("Helvetica", 11, "bold")).grid(row=0, column=0, sticky="w", padx=5)
+        self.progress = ttk.Progressbar(status_frame, maximum=100, length=550, mode="determinate", style="TProgressbar")
+        self.progress.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        ttk.Label(status_frame, text="Status:", font=("Helvetica", 11, "bold")).grid(row=1, column=0, sticky="w", padx=5)
+        self.status_label = ttk.Label(status_frame, textvariable=self.status, foreground=self.status_color.get(), font=("Helvetica", 10, "bold"))
+        self.status_label.grid(row=1, column=1, sticky="w", padx=5, pady=2)
+
+        # Configure grid weights
+        self.main_frame.columnconfigure(0, weight=1)
+        input_frame.columnconfigure(0, weight=1)
+        basic_tab.columnconfigure(1, weight=1)
+        advanced_tab.columnconfigure(1, weight=1)
+        output_tab.columnconfigure(1, weight=1)
+        recent_frame.columnconfigure(0, weight=1)
+        queue_frame.columnconfigure(0, weight=1)
+        control_frame.columnconfigure(6, weight=1)
+        status_frame.columnconfigure(1, weight=1)
+
+        # Keyboard shortcuts
+        self.root.bind("<Control-p>", lambda e: self.show_preview())
+        self.root.bind("<Control-r>", lambda e: self.reset_settings())
+        self.root.bind("<Control-Return>", lambda e: self.run_processing())
+
+        self.refresh_queue()
+        EVENTS.subscribe(self.events.put)
+        self.poll_events()
+
+    def add_foreground(self):
+        path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4")])
+        if path:
+            self.foreground_paths.append(path)
+            self.fg_listbox.insert(tk.END, os.path.basename(path))
+            try:
+                info = probe_video(path)
+                self.fg_size.set(f"Last added: {info['w']}x{info['h']}, {info['duration']:.2f}s")
+            except Exception as e:
+                self.fg_size.set(f"Error: {str(e)}")
+
+    def clear_foregrounds(self):
+        self.foreground_paths.clear()
+        self.fg_listbox.delete(0, tk.END)
+        self.fg_size.set("Not selected")
+
+    def select_background(self):
+        path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4")])
+        if path:
+            self.background_path.set(path)
+            try:
+                info = probe_video(path)
+                self.bg_size.set(f"Size: {info['w']}x{info['h']}, {info['duration']:.2f}s")
+            except Exception as e:
+                self.bg_size.set(f"Error: {str(e)}")
+
+    def select_output(self):
+        path = filedialog.asksaveasfilename(defaultextension=f".{self.format.get().lower()}", filetypes=[("Video files", f"*.{self.format.get().lower()}")])
+        if path:
+            self.output_path.set(path)
+
+    def select_audio(self):
+        path = filedialog.askopenfilename(filetypes=[("Audio files", "*.mp3 *.wav")])
+        if path:
+            self.custom_audio_path.set(path)
+
+    def set_preset_size(self, preset, target):
+        width, height = self.size_presets[preset]
+        if target == "fg":
+            if width and height:
+                self.fg_width.set(str(width))
+                self.fg_height.set(str(height))
+            else:
+                self.fg_width.set("")
+                self.fg_height.set("")
+        elif target == "bg":
+            if width and height:
+                self.bg_width.set(str(width))
+                self.bg_height.set(str(height))
+            else:
+                self.bg_width.set("")
+                self.bg_height.set("")
+
+    def toggle_audio_entry(self, *args):
+        if self.audio_source.get() == "Custom":
+            self.audio_frame.grid()
+        else:
+            self.audio_frame.grid_remove()
+
+    def set_theme(self, theme):
+        self.theme = theme
+        if theme == "Light":
+            bg, fg, btn, btn_active, trough = "#eceff1", "#263238", "#4caf50", "#388e3c", "#cfd8dc"
+        elif theme == "Dark":
+            bg, fg, btn, btn_active, trough = "#263238", "#eceff1", "#3498db", "#2980b9", "#34495e"
+        elif theme == "Slate":
+            bg, fg, btn, btn_active, trough = "#576574", "#dfe4ea", "#e67e22", "#d35400", "#718093"
+        
+        self.root.configure(bg=bg)
+        self.canvas.configure(bg=bg)
+        self.header_canvas.configure(bg=btn)
+        self.fg_listbox.configure(bg="#ffffff" if theme == "Light" else trough, fg=fg)
+        self.recent_listbox.configure(bg="#ffffff" if theme == "Light" else trough, fg=fg)
+        style = ttk.Style()
+        style.configure("TLabel", background=bg, foreground=fg)
+        style.configure("TFrame", background=bg)
+        style.configure("TCheckbutton", background=bg, foreground=fg)
+        style.configure("TScale", background=bg, troughcolor=trough)
+        style.configure("TButton", background=btn, foreground="#ffffff")
+        style.map("TButton", background=[("active", btn_active), ("disabled", "#b0bec5")], foreground=[("disabled", "#eceff1")])
+        style.configure("TProgressbar", background=btn, troughcolor=trough)
+        style.configure("TNotebook", background=bg)
+        style.configure("TNotebook.Tab", background=trough if theme != "Light" else "#b0bec5")
+        style.map("TNotebook.Tab", background=[("selected", "#ffffff" if theme == "Light" else trough)])
+        self.status_label.configure(foreground=self.status_color.get())
+        for btn in [self.preview_btn, self.reset_btn, self.run_button, self.open_button, self.convert_btn]:
+            btn.configure(style="TButton")
+
+    def reset_settings(self):
+        self.text_input.set("")
+        self.text_color.set("white")
+        self.text_size.set(24)
+        self.text_pos.set("Top Left")
+        self.loop_video.set(False)
+        self.fg_width.set("")
+        self.fg_height.set("")
+        self.bg_width.set("")
+        self.bg_height.set("")
+        self.fg_preset.set("Native")
+        self.bg_preset.set("Native")
+        self.audio_source.set("Foreground")
+        self.custom_audio_path.set("")
+        self.green_lower_r.set(0)
+        self.green_lower_g.set(200)
+        self.green_lower_b.set(0)
+        self.green_upper_r.set(50)
+        self.green_upper_g.set(255)
+        self.green_upper_b.set(50)
+        self.dilation.set(1)
+        self.format.set("MP4")
+        self.fps.set(24)
+        self.transition.set(False)
+        self.export_log.set(False)
+        self.workers.set("1")
+        self.pipeline_depth.set("0")
+        self.bg_cache_mb.set("512")
+        self.bg_cache_spill_mb.set("0")
+        self.resize_quality.set("Best")
+        self.key_backend.set("auto")
+        self.roi_keying.set(False)
+        self.key_model.set("Range")
+        self.key_tolerance.set("3.0")
+        self.encoder.set("x264")
+        self.encoder_preset.set("medium")
+        self.encoder_tune.set("none")
+        self.crf.set("23")
+        self.encoder_threads.set("0")
+        self.gop.set("0")
+        self.draft.set(False)
+        self.segment_cache_mb.set("0")
+        self.memory_budget_mb.set("0")
+        self.farm_workers.set("")
+        self.queue_processes.set("1")
+        self.convert_workers.set(str(min(4, os.cpu_count() or 1)))
+        self.segment_interval.set("1")
+        self.motion_threshold.set("0")
+        self.mask_warp.set(False)
+        self.mask_smoothing.set("0")
+        self.write_alpha.set(True)
+        self.toggle_audio_entry()
+
+    def show_preview(self):
+        if not self.foreground_paths or not self.background_path.get():
+            messagebox.showwarning("Input Error", "Select foreground and background first!")
+            return
+        # A new window picks up the current files and sizes
+        if self.preview_window is not None:
+            self.preview_window.close()
+        self.preview_window = PreviewWindow(self)
+
+    # Farm worker addresses from the Render Farm entry
+    def farm_worker_list(self):
+        return self.farm_workers.get().replace(",", " ").split()
+
+    # Current settings in preset form
+    def current_settings(self):
+        return {
+            "fg_width": self.fg_width.get(),
+            "fg_height": self.fg_height.get(),
+            "bg_width": self.bg_width.get(),
+            "bg_height": self.bg_height.get(),
+            "text": self.text_input.get(),
+            "text_color": self.text_color.get(),
+            "text_size": self.text_size.get(),
+            "text_pos": self.text_pos.get(),
+            "loop": self.loop_video.get(),
+            "audio_source": self.audio_source.get(),
+            "custom_audio_path": self.custom_audio_path.get(),
+            "green_lower": (self.green_lower_r.get(), self.green_lower_g.get(), self.green_lower_b.get()),
+            "green_upper": (self.green_upper_r.get(), self.green_upper_g.get(), self.green_upper_b.get()),
+            "dilation": self.dilation.get(),
+            "format": self.format.get(),
+            "fps": self.fps.get(),
+            "transition": self.transition.get(),
+            "export_log": self.export_log.get(),
+            "workers": self.workers.get(),
+            "pipeline_depth": self.pipeline_depth.get(),
+            "bg_cache_mb": self.bg_cache_mb.get(),
+            "bg_cache_spill_mb": self.bg_cache_spill_mb.get(),
+            "resize_quality": self.resize_quality.get(),
+            "key_backend": self.key_backend.get(),
+            "roi_keying": self.roi_keying.get(),
+            "key_model": self.key_model.get(),
+            "key_tolerance": self.key_tolerance.get(),
+            "encoder": self.encoder.get(),
+            "encoder_preset": self.encoder_preset.get(),
+            "encoder_tune": self.encoder_tune.get(),
+            "crf": self.crf.get(),
+            "encoder_threads": self.encoder_threads.get(),
+            "gop": self.gop.get(),
+            "draft": self.draft.get(),
+            "segment_cache_mb": self.segment_cache_mb.get(),
+            "memory_budget_mb": self.memory_budget_mb.get(),
+            "farm_workers": self.farm_worker_list()
+        }
+
+    def save_preset(self):
+        settings = self.current_settings()
+        main_dir = os.path.dirname(os.path.abspath(__file__))
+        presets_dir = os.path.join(main_dir, "presets")
+        
+        os.makedirs(presets_dir, exist_ok=True)
+        
+        existing_files = [f for f in os.listdir(presets_dir) if f.startswith("preset") and f.endswith(".json")]
+        if existing_files:
+            numbers = [int(f.replace("preset", "").replace(".json", "")) for f in existing_files if f.replace("preset", "").replace(".json", "").isdigit()]
+            next_num = max(numbers) + 1 if numbers else 1
+        else:
+            next_num = 1
+        default_name = f"preset{next_num}.json"
+        
+        path = filedialog.asksaveasfilename(
+            initialdir=presets_dir,
+            initialfile=default_name,
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json")]
+        )
+        if path:
+            with open(path, 'w') as f:
+                json.dump(settings, f)
+            messagebox.showinfo("Success", f"Preset saved to {path}!")
+
+    def load_preset(self):
+        main_dir = os.path.dirname(os.path.abspath(__file__))
+        presets_dir = os.path.join(main_dir, "presets")
+        
+        path = filedialog.askopenfilename(
+            initialdir=presets_dir,
+            filetypes=[("JSON files", "*.json")]
+        )
+        if path:
+            settings = load_preset_file(path)
+            self.fg_width.set(settings.get("fg_width", ""))
+            self.fg_height.set(settings.get("fg_height", ""))
+            self.bg_width.set(settings.get("bg_width", ""))
+            self.bg_height.set(settings.get("bg_height", ""))
+            self.text_input.set(settings.get("text", ""))
+            self.text_color.set(settings.get("text_color", "white"))
+            self.text_size.set(settings.get("text_size", 24))
+            self.text_pos.set(settings.get("text_pos", "Top Left"))
+            self.loop_video.set(settings.get("loop", False))
+            self.audio_source.set(settings.get("audio_source", "Foreground"))
+            self.custom_audio_path.set(settings.get("custom_audio_path", ""))
+            self.green_lower_r.set(settings["green_lower"][0])
+            self.green_lower_g.set(settings["green_lower"][1])
+            self.green_lower_b.set(settings["green_lower"][2])
+            self.green_upper_r.set(settings["green_upper"][0])
+            self.green_upper_g.set(settings["green_upper"][1])
+            self.green_upper_b.set(settings["green_upper"][2])
+            self.dilation.set(max(MIN_DILATION, int(settings.get("dilation", 1))))
+            self.format.set(settings.get("format", "MP4"))
+            self.fps.set(settings.get("fps", "24"))
+            self.transition.set(settings.get("transition", False))
+            self.export_log.set(settings.get("export_log", False))
+            self.workers.set(settings.get("workers", "1"))
+            self.pipeline_depth.set(settings.get("pipeline_depth", "0"))
+            self.bg_cache_mb.set(settings.get("bg_cache_mb", "512"))
+            self.bg_cache_spill_mb.set(settings.get("bg_cache_spill_mb", "0"))
+            self.resize_quality.set(settings.get("resize_quality", "Best"))
+            self.key_backend.set(settings.get("key_backend", "auto"))
+            self.roi_keying.set(settings.get("roi_keying", False))
+            self.key_model.set(settings.get("key_model", "Range"))
+            self.key_tolerance.set(str(settings.get("key_tolerance", 3.0)))
+            self.encoder.set(settings.get("encoder", "x264"))
+            self.encoder_preset.set(settings.get("encoder_preset", "medium"))
+            self.encoder_tune.set(settings.get("encoder_tune", "none"))
+            self.crf.set(settings.get("crf", "23"))
+            self.encoder_threads.set(settings.get("encoder_threads", "0"))
+            self.gop.set(settings.get("gop", "0"))
+            self.draft.set(settings.get("draft", False))
+            self.segment_cache_mb.set(settings.get("segment_cache_mb", "0"))
+            self.memory_budget_mb.set(settings.get("memory_budget_mb", "0"))
+            self.farm_workers.set(", ".join(settings.get("farm_workers", [])))
+            self.toggle_audio_entry()
+            messagebox.showinfo("Success", "Preset loaded!")
+
+    def add_recent_file(self, path):
+        if path not in self.recent_files:
+            self.recent_files.insert(0, path)
+            self.recent_listbox.insert(0, os.path.basename(path))
+            if len(self.recent_files) > 5:
+                self.recent_files.pop()
+                self.recent_listbox.delete(tk.END)
+
+    def load_recent_file(self, event):
+        selection = self.recent_listbox.curselection()
+        if selection:
+            path = self.recent_files[selection[0]]
+            self.output_path.set(path)
+            messagebox.showinfo("Recent File", f"Selected recent output: {path}")
+
+    # Check the inputs before running or queueing a job; shows a warning and returns False if invalid
+    def validate_inputs(self):
+        if not self.foreground_paths or not self.background_path.get() or not self.output_path.get():
+            messagebox.showwarning("Input Error", "Please select all required files!")
+            return False
+        try:
+            fps = int(self.fps.get())
+            if fps <= 0:
+                raise ValueError("FPS must be positive")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid FPS value!")
+            return False
+        try:
+            workers = int(self.workers.get())
+            if workers <= 0:
+                raise ValueError("Workers must be positive")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid worker count!")
+            return False
+        try:
+            pipeline_depth = int(self.pipeline_depth.get())
+            if pipeline_depth < 0:
+                raise ValueError("Pipeline depth must not be negative")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid pipeline depth!")
+            return False
+        try:
+            bg_cache_mb = int(self.bg_cache_mb.get())
+            bg_cache_spill_mb = int(self.bg_cache_spill_mb.get())
+            segment_cache_mb = int(self.segment_cache_mb.get())
+            if bg_cache_mb < 0 or bg_cache_spill_mb < 0 or segment_cache_mb < 0:
+                raise ValueError("Cache sizes must not be negative")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid cache size!")
+            return False
+        try:
+            if int(self.memory_budget_mb.get()) < 0:
+                raise ValueError("Memory budget must not be negative")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid memory budget!")
+            return False
+        try:
+            if float(self.key_tolerance.get()) <= 0:
+                raise ValueError("Key tolerance must be positive")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid key tolerance!")
+            return False
+        try:
+            crf = int(self.crf.get())
+            if not 0 <= crf <= 51:
+                raise ValueError("CRF must be 0-51")
+            if int(self.encoder_threads.get()) < 0 or int(self.gop.get()) < 0:
+                raise ValueError("Threads and GOP must not be negative")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid encoder settings!")
+            return False
+        return True
+
+    def run_processing(self):
+        if not self.validate_inputs():
+            return
+        workers = int(self.workers.get())
+        pipeline_depth = int(self.pipeline_depth.get())
+        bg_cache_mb = int(self.bg_cache_mb.get())
+        bg_cache_spill_mb = int(self.bg_cache_spill_mb.get())
+        self.run_button.config(state="disabled")
+        self.open_button.config(state="disabled")
+        self.convert_btn.config(state="disabled")
+        self.progress["value"] = 0
+        green_lower = (self.green_lower_r.get(), self.green_lower_g.get(), self.green_lower_b.get())
+        green_upper = (self.green_upper_r.get(), self.green_upper_g.get(), self.green_upper_b.get())
+        thread = threading.Thread(target=self.render, args=(self.foreground_paths, self.background_path.get(), self.output_path.get(), self.text_input.get(), self.text_color.get(), self.text_size.get(), self.text_pos.get(), self.loop_video.get(), self.fg_width.get(), self.fg_height.get(), self.bg_width.get(), self.bg_height.get(), self.audio_source.get(), self.custom_audio_path.get(), green_lower, green_upper, self.dilation.get(), self.format.get(), self.fps.get(), self.transition.get(), workers, self.export_log.get(), pipeline_depth, bg_cache_mb, bg_cache_spill_mb, self.resize_quality.get(), self.key_backend.get(), self.roi_keying.get()),
+                                  kwargs={"encoder": self.encoder.get(), "encoder_preset": self.encoder_preset.get(), "encoder_tune": self.encoder_tune.get(),
+                                          "crf": int(self.crf.get()), "encoder_threads": int(self.encoder_threads.get()), "gop": int(self.gop.get()), "draft": self.draft.get(),
+                                          "segment_cache_mb": int(self.segment_cache_mb.get()), "memory_budget_mb": int(self.memory_budget_mb.get()),
+                                          "key_model": self.key_model.get(), "key_tolerance": float(self.key_tolerance.get()),
+                                          "farm_workers": self.farm_worker_list()}, daemon=True)
+        thread.start()
+
+    # Render thread: process_video posts its own "done"/"error" event, handled in poll_events
+    def render(self, *args, **kwargs):
+        try:
+            process_video(*args, **kwargs)
+        except Exception:
+            pass
+
+    def open_output(self):
+        if self.last_output and os.path.exists(self.last_output):
+            try:
+                subprocess.Popen(['start', self.last_output], shell=True)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to open file: {str(e)}")
+        else:
+            messagebox.showwarning("No Output", "No processed video available to open!")
+
+    def queue_job(self):
+        if not self.validate_inputs():
+            return
+        self.render_queue.add(self.foreground_paths, self.background_path.get(), self.output_path.get(), self.current_settings())
+        self.update_status(f"Queued {os.path.basename(self.output_path.get())}")
+        self.refresh_queue(reschedule=False)
+
+    def toggle_queue(self):
+        if self.render_queue.running() and not self.render_queue.stopping.is_set():
+            self.render_queue.stop()
+            self.update_status("Queue pausing after the running jobs")
+            return
+        try:
+            processes = int(self.queue_processes.get())
+            if processes <= 0:
+                raise ValueError("Queue processes must be positive")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid queue process count!")
+            return
+        self.render_queue.processes = processes
+        self.render_queue.start()
+        self.update_status(f"Queue running ({processes} at a time)")
+
+    def selected_queue_job(self):
+        selection = self.queue_listbox.curselection()
+        return self.queue_jobs[selection[0]]["id"] if selection else None
+
+    def remove_queue_job(self):
+        job_id = self.selected_queue_job()
+        if job_id:
+            self.render_queue.remove(job_id)
+            self.refresh_queue(reschedule=False)
+
+    def retry_queue_job(self):
+        job_id = self.selected_queue_job()
+        if job_id:
+            self.render_queue.retry(job_id)
+            self.refresh_queue(reschedule=False)
+
+    def clear_queue(self):
+        self.render_queue.clear_finished()
+        self.refresh_queue(reschedule=False)
+
+    # Poll the render queue (it runs on its own thread) and redraw the job list
+    def refresh_queue(self, reschedule=True):
+        jobs = self.render_queue.snapshot()
+        finished = {job["id"] for job in self.queue_jobs if job["status"] == "done"}
+        for job in jobs:
+            if job["status"] == "done" and job["id"] not in finished and self.queue_jobs:
+                self.last_output = job["output"]
+                self.add_recent_file(job["output"])
+                self.open_button.config(state="normal")
+        rows = [f"{job['status']:8} {job['progress']:5.1f}%  {os.path.basename(job['output'])}" + (f"  {job['message'][:60]}" if job["status"] == "failed" else "")
+                for job in jobs]
+        if rows != list(self.queue_listbox.get(0, tk.END)):
+            selection = self.queue_listbox.curselection()
+            self.queue_listbox.delete(0, tk.END)
+            for row in rows:
+                self.queue_listbox.insert(tk.END, row)
+            if selection and selection[0] < len(rows):
+                self.queue_listbox.selection_set(selection[0])
+        self.queue_jobs = jobs
+        active = self.render_queue.running() and not self.render_queue.stopping.is_set()
+        self.queue_start_btn.config(text="Pause Queue" if active else "Start Queue")
+        if reschedule:
+            self.root.after(500, self.refresh_queue)
+
+    def convert_to_green(self):
+        path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4")])
+        if not path:
+            return
+        try:
+            workers = int(self.convert_workers.get())
+            if workers <= 0:
+                raise ValueError("Convert workers must be positive")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid convert worker count!")
+            return
+        try:
+            segment_interval = int(self.segment_interval.get())
+            motion_threshold = float(self.motion_threshold.get())
+            mask_smoothing = float(self.mask_smoothing.get())
+            if segment_interval < 0 or motion_threshold < 0 or not 0 <= mask_smoothing < 1:
+                raise ValueError("Invalid adaptive segmentation settings")
+        except ValueError:
+            messagebox.showwarning("Input Error", "Invalid segmentation interval, motion threshold or smoothing!")
+            return
+        mask_warp = self.mask_warp.get()
+        write_alpha = self.write_alpha.get()
+        
+        self.convert_btn.config(state="disabled")
+        self.run_button.config(state="disabled")
+        main_dir = os.path.dirname(os.path.abspath(__file__))
+        output_path = os.path.join(main_dir, "foregrounds", f"greenscreen_{os.path.basename(path)}")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        self.update_status("Converting to green screen...", "#d4a017")
+        self.progress["value"] = 0
+        
+        def set_progress(done, total):
+            EVENTS.post("progress", value=(done / total) * 100 if total else 0)
+
+        def process_conversion():
+            try:
+                convert_video_to_green(path, output_path, workers, set_progress, segment_interval=segment_interval,
+                                       motion_threshold=motion_threshold, mask_warp=mask_warp, mask_smoothing=mask_smoothing,
+                                       write_alpha=write_alpha)
+                EVENTS.post("done", task="convert", output=output_path, message=f"Green screen video saved as {output_path} and added to foregrounds!")
+            except Exception as e:
+                print(f"Conversion error: {str(e)}")
+                EVENTS.post("error", task="convert", message=f"Conversion failed: {str(e)}")
+        
+        thread = threading.Thread(target=process_conversion, daemon=True)
+        thread.start()
+
+    # Apply the events posted by render and conversion threads, on the Tk thread
+    def poll_events(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event["type"] == "status":
+                self.update_status(event["text"], event["color"])
+            elif event["type"] == "progress":
+                self.progress["value"] = event["value"]
+            elif event["type"] == "detail":
+                continue
+            elif event["task"] == "render":
+                self.render_finished(event)
+            else:
+                self.conversion_finished(event)
+        self.root.after(self.EVENT_POLL_MS, self.poll_events)
+
+    def render_finished(self, event):
+        if event["type"] == "done":
+            self.last_output = event["output"]
+            self.add_recent_file(event["output"])
+        self.enable_button()
+        if event["type"] == "done":
+            messagebox.showinfo("Success", event["message"])
+        else:
+            messagebox.showerror("Error", event["message"])
+
+    def conversion_finished(self, event):
+        self.convert_btn.config(state="normal")
+        self.run_button.config(state="normal")
+        if event["type"] == "error":
+            self.update_status(f"Error: {event['message'][:50]}", "#c0392b")
+            messagebox.showerror("Error", event["message"])
+            return
+        output_path = event["output"]
+        self.progress["value"] = 100
+        self.update_status("Conversion complete!", "#27ae60")
+        self.foreground_paths.append(output_path)
+        self.fg_listbox.insert(tk.END, os.path.basename(output_path))
+        try:
+            info = probe_video(output_path)
+            self.fg_size.set(f"Last added: {info['w']}x{info['h']}, {info['duration']:.2f}s")
+        except Exception as e:
+            self.fg_size.set(f"Error: {str(e)}")
+        messagebox.showinfo("Success", event["message"])
+
+    def update_status(self, text, color="#263238"):
+        self.status.set(text)
+        self.status_color.set(color)
+        self.status_label.configure(foreground=color)
+
+    def enable_button(self):
+        self.run_button.config(state="normal")
+        self.convert_btn.config(state="normal")
+        if self.last_output and os.path.exists(self.last_output):
+            self.open_button.config(state="normal", style="TButton")
+        self.root.update_idletasks()
+
+# Run the GUI
+def run_gui():
+    root = tk.Tk()
+    VideoProcessorApp(root)
+    root.mainloop()
+
+if __name__ == "__main__":
+    run_gui()
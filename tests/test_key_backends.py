@@ -0,0 +1,61 @@
+# Keying backend parity: every installed kernel, with the green range and with a calibrated key
+# table, keying the whole frame or only the ROI, against the numpy reference kernel. OpenCV
+# rounds the 50/50 edge blend instead of truncating it, so it may differ by 1; the others are exact.
+import numpy as np
+import pytest
+
+import green
+
+GREEN_LOWER = (0, 150, 0)
+GREEN_UPPER = (120, 255, 120)
+TOLERANCE = {"opencv": 1, "numba": 0}
+
+# Subject over most of the frame (ROI falls back to a full key), and a small subject (ROI crops)
+def frames():
+    full = green.synthetic_green_frame(641, 361)
+    small = green.synthetic_green_frame(641, 361, seed=1)
+    small[:] = full[0, -1]
+    small[150:190, 300:340] = (190, 120, 90)
+    return {"full": full, "small": small}
+
+def background(shape):
+    return np.random.default_rng(1).integers(0, 256, shape, dtype=np.uint8)
+
+def reference(img, bg, dilation, key_model):
+    table = green.key_table(key_model) if key_model else None
+    out = np.empty_like(img)
+    green.NumpyKeyKernel(GREEN_LOWER, GREEN_UPPER, dilation, table).key(img, bg, out)
+    return out
+
+@pytest.mark.parametrize("backend", green.KEY_BACKEND_ORDER)
+@pytest.mark.parametrize("table", [False, True], ids=["range", "table"])
+@pytest.mark.parametrize("roi", [False, True], ids=["full", "roi"])
+@pytest.mark.parametrize("dilation", [1, 3])
+@pytest.mark.parametrize("frame", ["full", "small"])
+def test_backend_matches_numpy_reference(backend, table, roi, dilation, frame):
+    if backend not in green.available_key_backends():
+        pytest.skip(f"{backend} is not installed")
+    img = frames()[frame]
+    bg = background(img.shape)
+    key_model = green.fit_key_model([img]) if table else None
+    if table:
+        assert key_model is not None
+    keyer = green.GreenKeyer(GREEN_LOWER, GREEN_UPPER, dilation, backend, roi=roi, key_model=key_model)
+    assert keyer.backend == backend
+    result = keyer.key(img, bg)
+    expected = reference(img, bg, dilation, key_model)
+    assert np.abs(expected.astype(np.int16) - result).max() <= TOLERANCE.get(backend, 0)
+    if roi and frame == "small":
+        assert keyer.region.cropped == 1
+
+def test_table_matches_range_for_box_model():
+    # A key table that holds the green range keys exactly like the range test
+    img = frames()["full"]
+    r, g, b = (np.arange(256)[:, None, None], np.arange(256)[None, :, None], np.arange(256)[None, None, :])
+    inside = (((r >= GREEN_LOWER[0]) & (r <= GREEN_UPPER[0])) & ((g >= GREEN_LOWER[1]) & (g <= GREEN_UPPER[1]))
+              & ((b >= GREEN_LOWER[2]) & (b <= GREEN_UPPER[2])))
+    table = np.where(inside.ravel(), 255, 0).astype(np.uint8)
+    mask = np.empty(img.shape[:2], np.uint8)
+    green.lookup_key_mask(table, img, green.key_index_buffer(*img.shape[:2]), mask)
+    cv2 = pytest.importorskip("cv2")
+    assert np.array_equal(mask, cv2.inRange(img, GREEN_LOWER, GREEN_UPPER))